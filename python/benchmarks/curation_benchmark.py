@@ -0,0 +1,167 @@
+import os
+import sys
+import json
+import time
+import platform
+import numpy as np
+from benchmarks.synthetic_library import generate_library, ground_truth_pairs
+
+STAGES = ['discovery', 'decode', 'preprocess', 'embed', 'similarity', 'clustering', 'serialization']
+
+
+def _stage(seconds, num_images):
+    return {
+        'seconds': seconds,
+        'images_per_second': num_images / seconds if seconds > 0 else float('inf')
+    }
+
+
+def benchmark_library(curator, folder, manifest):
+    # Runs each pipeline stage on its own so time is attributed precisely,
+    # using the curator's own components and settings.
+    stages = {}
+    
+    start = time.perf_counter()
+    image_paths = curator._get_image_paths(folder)
+    stages['discovery'] = time.perf_counter() - start
+    
+    processor = curator.processor
+    tensors = []
+    valid_paths = []
+    stages['decode'] = 0.0
+    stages['preprocess'] = 0.0
+    # One image at a time, so only the model-sized tensors are ever held.
+    for path in image_paths:
+        start = time.perf_counter()
+        try:
+            image = processor.open_image(path)
+        except Exception as e:
+            stages['decode'] += time.perf_counter() - start
+            print(f"Error decoding {path}: {e}")
+            continue
+        decoded = time.perf_counter()
+        stages['decode'] += decoded - start
+        tensors.append(processor.preprocess_image(image))
+        stages['preprocess'] += time.perf_counter() - decoded
+        valid_paths.append(path)
+        del image
+    images = np.stack(tensors)
+    del tensors
+    
+    start = time.perf_counter()
+    embeddings = np.concatenate([
+        curator.model.get_embeddings_batch(images[i:i + curator.batch_size])
+        for i in range(0, len(images), curator.batch_size)
+    ])
+    stages['embed'] = time.perf_counter() - start
+    del images
+    
+    start = time.perf_counter()
+    graph = curator.similarity_calc.build_similarity_graph(embeddings)
+    stages['similarity'] = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    clusters = curator.similarity_calc.cluster(embeddings, valid_paths, graph=graph)
+    duplicate_pairs = curator.similarity_calc.duplicate_pairs_from_graph(graph, valid_paths)
+    stages['clustering'] = time.perf_counter() - start
+    
+    results = {
+        "total_images": len(image_paths),
+        "processed_images": len(valid_paths),
+        "clusters": clusters,
+        "duplicate_pairs": duplicate_pairs,
+        "recommended_photos": [cluster['representative'] for cluster in clusters]
+    }
+    start = time.perf_counter()
+    serialized = json.dumps(results)
+    stages['serialization'] = time.perf_counter() - start
+    
+    expected = ground_truth_pairs(manifest)
+    found = {tuple(sorted((pair['image1'], pair['image2']))) for pair in duplicate_pairs}
+    true_positives = len(expected & found)
+    
+    num_images = len(valid_paths)
+    return {
+        'num_images': num_images,
+        'stages': {name: _stage(stages[name], num_images) for name in STAGES},
+        'total_seconds': sum(stages.values()),
+        'images_per_second': num_images / sum(stages.values()),
+        'num_clusters': len(clusters),
+        'num_duplicate_pairs': len(duplicate_pairs),
+        'serialized_bytes': len(serialized),
+        'pair_precision': true_positives / len(found) if found else 1.0,
+        'pair_recall': true_positives / len(expected) if expected else 1.0
+    }
+
+
+def run_benchmarks(curator, scales, library_root, resolution=(1024, 768), duplicate_rate=0.3,
+                   png_rate=0.1, seed=0):
+    runs = []
+    for num_images in scales:
+        folder = os.path.join(library_root, f"library_{num_images}_{resolution[0]}x{resolution[1]}")
+        print(f"\nPreparing synthetic library: {num_images} images at {resolution[0]}x{resolution[1]}")
+        manifest = generate_library(folder, num_images, resolution=resolution,
+                                    duplicate_rate=duplicate_rate, png_rate=png_rate, seed=seed)
+        
+        print(f"Benchmarking {num_images} images...")
+        run = benchmark_library(curator, folder, manifest)
+        runs.append(run)
+        print(format_run(run))
+    
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'resolution': list(resolution),
+            'duplicate_rate': duplicate_rate,
+            'png_rate': png_rate,
+            'seed': seed,
+            'batch_size': curator.batch_size,
+            'backend': getattr(curator, 'backend', 'keras'),
+            'fast_decode': curator.fast_decode
+        },
+        'runs': runs
+    }
+
+
+def format_run(run):
+    lines = [f"  {'stage':<14}{'seconds':>10}{'images/s':>12}"]
+    for name in STAGES:
+        stage = run['stages'][name]
+        lines.append(f"  {name:<14}{stage['seconds']:>10.3f}{stage['images_per_second']:>12.1f}")
+    lines.append(f"  {'total':<14}{run['total_seconds']:>10.3f}{run['images_per_second']:>12.1f}")
+    lines.append(f"  pairs: {run['num_duplicate_pairs']} "
+                 f"(precision {run['pair_precision']:.3f}, recall {run['pair_recall']:.3f})")
+    return "\n".join(lines)
+
+
+def compare_to_baseline(report, baseline, tolerance=0.1, min_seconds=0.05):
+    # Flags every stage whose throughput fell more than `tolerance` below the
+    # baseline run of the same size. Stages faster than min_seconds in both
+    # runs are reported but never flagged; their timings are mostly noise.
+    baseline_runs = {run['num_images']: run for run in baseline['runs']}
+    regressions = []
+    rows = []
+    
+    for run in report['runs']:
+        base = baseline_runs.get(run['num_images'])
+        if base is None:
+            continue
+        for name in STAGES + ['total']:
+            current_run = run if name == 'total' else run['stages'][name]
+            base_run = base if name == 'total' else base['stages'][name]
+            current, previous = current_run['images_per_second'], base_run['images_per_second']
+            seconds = current_run.get('seconds', current_run.get('total_seconds'))
+            base_seconds = base_run.get('seconds', base_run.get('total_seconds'))
+            ratio = current / previous if previous else float('inf')
+            regressed = ratio < 1.0 - tolerance and max(seconds, base_seconds) >= min_seconds
+            rows.append({'num_images': run['num_images'], 'stage': name,
+                         'baseline_images_per_second': previous,
+                         'images_per_second': current,
+                         'ratio': ratio, 'regressed': regressed})
+            if regressed:
+                regressions.append(rows[-1])
+    
+    return {'tolerance': tolerance, 'min_seconds': min_seconds, 'comparisons': rows, 'regressions': regressions}
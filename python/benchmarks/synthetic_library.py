@@ -0,0 +1,89 @@
+import os
+import json
+import numpy as np
+from PIL import Image, ImageEnhance
+
+MANIFEST_NAME = 'library.json'
+
+
+def _scene(rng, resolution):
+    width, height = resolution
+    # Smooth colour field plus a few hard-edged shapes: cheap to generate and
+    # close enough to photo statistics for decode and resize costs.
+    grid = (rng.random((6, 8, 3)) * 255).astype(np.uint8)
+    image = Image.fromarray(grid).resize((width, height), Image.Resampling.BICUBIC)
+    pixels = np.asarray(image).astype(np.int16)
+    for _ in range(rng.integers(3, 8)):
+        x0, y0 = rng.integers(0, width), rng.integers(0, height)
+        x1, y1 = x0 + rng.integers(width // 20, width // 3), y0 + rng.integers(height // 20, height // 3)
+        pixels[y0:y1, x0:x1] = rng.integers(0, 255, 3)
+    pixels += rng.integers(-6, 7, pixels.shape, dtype=np.int16)
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+
+def _near_duplicate(rng, image):
+    width, height = image.size
+    # Burst-style variation: small reframing, exposure shift and re-encode.
+    dx, dy = rng.integers(0, max(1, width // 25)), rng.integers(0, max(1, height // 25))
+    image = image.crop((dx, dy, width - dx, height - dy)).resize((width, height), Image.Resampling.BILINEAR)
+    image = ImageEnhance.Brightness(image).enhance(rng.uniform(0.9, 1.1))
+    return image
+
+
+def generate_library(output_folder, num_images, resolution=(1024, 768), duplicate_rate=0.3,
+                     png_rate=0.1, seed=0):
+    # Writes num_images files and a manifest recording which scene each file
+    # came from, so detected duplicate pairs can be scored. Reuses an existing
+    # library generated with identical parameters.
+    config = {
+        'num_images': num_images,
+        'resolution': list(resolution),
+        'duplicate_rate': duplicate_rate,
+        'png_rate': png_rate,
+        'seed': seed
+    }
+    manifest_path = os.path.join(output_folder, MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest.get('config') == config:
+            return manifest
+    
+    os.makedirs(output_folder, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    files = []
+    scene = None
+    scene_id = -1
+    
+    for i in range(num_images):
+        if scene is None or rng.random() >= duplicate_rate:
+            scene = _scene(rng, resolution)
+            scene_id += 1
+            image = scene
+        else:
+            image = _near_duplicate(rng, scene)
+        
+        if rng.random() < png_rate:
+            name = f"img_{i:06d}.png"
+            image.save(os.path.join(output_folder, name))
+        else:
+            name = f"img_{i:06d}.jpg"
+            image.save(os.path.join(output_folder, name), quality=int(rng.integers(80, 96)))
+        files.append({'path': os.path.join(output_folder, name), 'scene': scene_id})
+    
+    manifest = {'config': config, 'files': files}
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f)
+    return manifest
+
+
+def ground_truth_pairs(manifest):
+    by_scene = {}
+    for entry in manifest['files']:
+        by_scene.setdefault(entry['scene'], []).append(entry['path'])
+    pairs = set()
+    for paths in by_scene.values():
+        for i in range(len(paths)):
+            for j in range(i + 1, len(paths)):
+                pairs.add(tuple(sorted((paths[i], paths[j]))))
+    return pairs
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import json
+import argparse
+import numpy as np
+from preprocessing.image_processor import ImageProcessor
+
+def decode_all(processor, image_paths):
+    images = []
+    valid_paths = []
+    start_time = time.time()
+    for path, image in processor.iter_images(image_paths):
+        images.append(image[0])
+        valid_paths.append(path)
+    elapsed = time.time() - start_time
+    return np.stack(images), valid_paths, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare fast JPEG decoding against the reference path')
+    parser.add_argument('--data_folder', type=str, default='../data/',
+                      help='Path to folder containing images')
+    parser.add_argument('--num_images', type=int, default=100,
+                      help='Maximum number of images to compare')
+    parser.add_argument('--min_cosine', type=float, default=0.98,
+                      help='Fail if any embedding falls below this cosine similarity')
+    parser.add_argument('--output', type=str, default=None,
+                      help='Optional path for a JSON report')
+    
+    args = parser.parse_args()
+    
+    extensions = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff')
+    image_paths = sorted(
+        os.path.join(root, name)
+        for root, _, files in os.walk(args.data_folder)
+        for name in files if name.lower().endswith(extensions)
+    )[:args.num_images]
+    
+    if not image_paths:
+        print(f"Error: No images found in '{args.data_folder}'")
+        return 1
+    
+    reference = ImageProcessor()
+    fast = ImageProcessor(fast_decode=True, dtype=np.uint8)
+    
+    ref_images, ref_paths, ref_time = decode_all(reference, image_paths)
+    fast_images, fast_paths, fast_time = decode_all(fast, image_paths)
+    
+    if ref_paths != fast_paths:
+        print("Error: Reference and fast decoders failed on different files")
+        return 1
+    
+    from models.mobilenet_similarity import MobileNetSimilarityModel
+    model = MobileNetSimilarityModel()
+    ref_embeddings = model.get_embeddings_batch(ref_images)
+    fast_embeddings = model.get_embeddings_batch(fast_images)
+    
+    # Both outputs are L2-normalized, so the row-wise dot product is the cosine.
+    cosines = np.sum(ref_embeddings * fast_embeddings, axis=1)
+    pixel_error = np.abs(ref_images - fast_images.astype(np.float32)).mean(axis=(1, 2, 3))
+    
+    report = {
+        "num_images": len(ref_paths),
+        "reference_decode_ms_per_image": ref_time / len(ref_paths) * 1000,
+        "fast_decode_ms_per_image": fast_time / len(fast_paths) * 1000,
+        "reference_bytes_per_image": int(ref_images[0].nbytes),
+        "fast_bytes_per_image": int(fast_images[0].nbytes),
+        "mean_abs_pixel_error": float(pixel_error.mean()),
+        "cosine_mean": float(cosines.mean()),
+        "cosine_min": float(cosines.min()),
+        "cosine_p5": float(np.percentile(cosines, 5)),
+        "worst_image": ref_paths[int(np.argmin(cosines))],
+        "passed": bool(cosines.min() >= args.min_cosine)
+    }
+    
+    print("\n" + "="*60)
+    print("FAST DECODE ACCURACY CHECK")
+    print("="*60)
+    print(f"Images compared: {report['num_images']}")
+    print(f"Decode time: {report['reference_decode_ms_per_image']:.1f} ms -> "
+          f"{report['fast_decode_ms_per_image']:.1f} ms per image")
+    print(f"Tensor size: {report['reference_bytes_per_image']} -> "
+          f"{report['fast_bytes_per_image']} bytes per image")
+    print(f"Mean absolute pixel error: {report['mean_abs_pixel_error']:.2f}")
+    print(f"Embedding cosine: mean {report['cosine_mean']:.4f}, "
+          f"p5 {report['cosine_p5']:.4f}, min {report['cosine_min']:.4f}")
+    print(f"Result: {'PASS' if report['passed'] else 'FAIL'} (min cosine >= {args.min_cosine})")
+    print("="*60)
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report saved to: {args.output}")
+    
+    return 0 if report['passed'] else 1
+
+if __name__ == "__main__":
+    raise SystemExit(main())
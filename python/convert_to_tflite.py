@@ -2,19 +2,104 @@
 
 import os
 import json
-from tflite_convert.model_converter import TFLiteConverter
+import argparse
+from models.tflite_similarity import TFLITE_MODEL_FILES
+
+def parse_int_list(value):
+    return [int(v) for v in value.split(',') if v]
+
+def print_sweep(name, rows):
+    print(f"\n{name} throughput sweep:")
+    print(f"  {'xnnpack':>7} {'threads':>7} {'batch':>5} {'p50 ms':>9} {'p95 ms':>9} {'img/s':>9}")
+    for row in rows:
+        if "error" in row:
+            print(f"  {row['use_xnnpack']!s:>7} {row['num_threads']:>7} {row['batch_size']:>5}  ❌ {row['error']}")
+            continue
+        print(f"  {row['use_xnnpack']!s:>7} {row['num_threads']:>7} {row['batch_size']:>5} "
+              f"{row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['images_per_second']:>9.1f}")
+    best = max((row for row in rows if "error" not in row), key=lambda row: row['images_per_second'], default=None)
+    if best:
+        print(f"  Best: batch {best['batch_size']}, {best['num_threads']} threads, "
+              f"XNNPACK {'on' if best['use_xnnpack'] else 'off'} ({best['images_per_second']:.1f} img/s)")
+
+def run_sweep_only(converter, args, sweep):
+    # Benchmarks models already in output_folder without converting again.
+    image_paths = converter.find_images(args.data_folder)
+    images, _ = converter.load_images(image_paths[:max(sweep['batch_sizes'])])
+    if not len(images):
+        print(f"No images found in {args.data_folder}")
+        return
+    
+    results = {}
+    for backend, filename in TFLITE_MODEL_FILES.items():
+        tflite_path = os.path.join(args.output_folder, filename)
+        if not os.path.exists(tflite_path):
+            print(f"Skipping {backend}: {tflite_path} not found")
+            continue
+        results[backend] = converter.benchmark_sweep(tflite_path, images, **sweep)
+        print_sweep(backend, results[backend])
+    
+    results_file = os.path.join(args.output_folder, "sweep_results.json")
+    with open(results_file, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nSweep results saved to: {results_file}")
 
 def main():
-    data_folder = "../data"
-    output_folder = "tflite_models"
+    parser = argparse.ArgumentParser(description='Convert the similarity model to TensorFlow Lite')
+    parser.add_argument('--data_folder', type=str, default='../data',
+                      help='Images used for calibration, verification and benchmarks')
+    parser.add_argument('--output_folder', type=str, default='tflite_models',
+                      help='Where converted models and results are written')
+    parser.add_argument('--similarity_threshold', type=float, default=0.85,
+                      help='Threshold used for duplicate-pair fidelity')
+    parser.add_argument('--num_workers', type=int, default=None,
+                      help='Processes converting variants in parallel (default: one per variant)')
+    parser.add_argument('--no_cache', action='store_true',
+                      help='Re-export the SavedModel and re-decode calibration/eval images')
+    parser.add_argument('--sweep', action='store_true',
+                      help='Also run a batch size x threads x XNNPACK throughput sweep per variant')
+    parser.add_argument('--sweep_only', action='store_true',
+                      help='Only sweep the models already in output_folder')
+    parser.add_argument('--batch_sizes', type=parse_int_list, default=[1, 8, 32],
+                      help='Comma-separated batch sizes for the sweep')
+    parser.add_argument('--threads', type=parse_int_list, default=None,
+                      help='Comma-separated num_threads values for the sweep (default: 1,2,4,cores)')
+    parser.add_argument('--warmup_runs', type=int, default=3,
+                      help='Untimed invocations before each sweep configuration')
+    parser.add_argument('--num_runs', type=int, default=20,
+                      help='Timed invocations per sweep configuration')
+    args = parser.parse_args()
+    
+    # Imported after argument parsing so --help does not load TensorFlow.
+    from tflite_convert.model_converter import TFLiteConverter
+    
+    data_folder = args.data_folder
+    output_folder = args.output_folder
+    
+    sweep = None
+    if args.sweep or args.sweep_only:
+        sweep = {
+            "batch_sizes": args.batch_sizes,
+            "thread_counts": args.threads,
+            "warmup_runs": args.warmup_runs,
+            "num_runs": args.num_runs,
+        }
+    
+    converter = TFLiteConverter()
+    
+    if args.sweep_only:
+        run_sweep_only(converter, args, sweep)
+        return
     
     print("=== TensorFlow Lite Model Conversion Pipeline ===")
     print(f"Data folder: {data_folder}")
     print(f"Output folder: {output_folder}")
     
-    converter = TFLiteConverter()
-    
-    results = converter.convert_and_evaluate(data_folder, output_folder)
+    results = converter.convert_and_evaluate(data_folder, output_folder,
+                                             similarity_threshold=args.similarity_threshold,
+                                             sweep=sweep,
+                                             num_workers=args.num_workers,
+                                             use_cache=not args.no_cache)
     
     print("\n" + "="*60)
     print("CONVERSION RESULTS SUMMARY")
@@ -30,6 +115,7 @@ def main():
         conv_stats = result.get("conversion", {})
         verify_stats = result.get("verification", {})
         bench_stats = result.get("benchmark", {})
+        fidelity_stats = result.get("fidelity", {})
         
         print(f"  ✅ Conversion: {conv_stats.get('model_size_mb', 0):.2f} MB")
         
@@ -43,6 +129,17 @@ def main():
             print(f"  ⚡ Performance: {avg_time:.1f} ms average")
         else:
             print(f"  ❌ Benchmark: Failed")
+        
+        if "cosine_mean" in fidelity_stats:
+            print(f"  🎯 Fidelity: cosine {fidelity_stats['cosine_mean']:.4f} "
+                  f"(min {fidelity_stats['cosine_min']:.4f}), "
+                  f"pair precision {fidelity_stats['pair_precision']:.3f} / "
+                  f"recall {fidelity_stats['pair_recall']:.3f}")
+        else:
+            print(f"  ❌ Fidelity: {fidelity_stats.get('error', 'Not evaluated')}")
+        
+        if "sweep" in result:
+            print_sweep(quant_type.upper(), result["sweep"])
     
     results_file = os.path.join(output_folder, "conversion_results.json")
     with open(results_file, 'w') as f:
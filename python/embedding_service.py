@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+import argparse
+from photo_curator import PhotoCurator
+from models.tflite_similarity import TFLITE_MODEL_FILES
+from service.http_server import EmbeddingService, create_server
+
+def main():
+    parser = argparse.ArgumentParser(description='Resident embedding and curation service')
+    parser.add_argument('--host', type=str, default='127.0.0.1',
+                      help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8765,
+                      help='TCP port to listen on')
+    parser.add_argument('--unix_socket', type=str, default=None,
+                      help='Listen on this Unix socket instead of TCP')
+    parser.add_argument('--backend', type=str, default='keras', choices=['keras', *TFLITE_MODEL_FILES],
+                      help='Inference backend for embedding extraction')
+    parser.add_argument('--tflite_model_dir', type=str, default='tflite_models',
+                      help='Folder containing the converted .tflite models')
+    parser.add_argument('--tflite_threads', type=int, default=1,
+                      help='Threads per TFLite interpreter')
+    parser.add_argument('--model_dir', type=str, default=None,
+                      help='Save the built Keras model here on first run and load it on later runs')
+    parser.add_argument('--fast_decode', action='store_true',
+                      help='Decode JPEGs at reduced resolution and keep pixels as uint8')
+    parser.add_argument('--max_batch_size', type=int, default=32,
+                      help='Largest batch sent to the model')
+    parser.add_argument('--max_latency_ms', type=float, default=5.0,
+                      help='Longest a request waits for its batch to fill')
+    parser.add_argument('--max_queue_images', type=int, default=1024,
+                      help='Queued images beyond which /embed answers 503')
+    parser.add_argument('--max_concurrent_jobs', type=int, default=4,
+                      help='Concurrent /curate jobs beyond which /curate answers 503')
+    parser.add_argument('--quiet', action='store_true',
+                      help='Do not log every request')
+
+    args = parser.parse_args()
+
+    # The curator only builds the model here; jobs get their own curators.
+    loader = PhotoCurator(backend=args.backend,
+                          tflite_model_dir=args.tflite_model_dir,
+                          tflite_threads=args.tflite_threads,
+                          fast_decode=args.fast_decode,
+                          model_dir=args.model_dir or None)
+    service = EmbeddingService(loader.model,
+                               target_size=loader.target_size,
+                               fast_decode=args.fast_decode,
+                               max_batch_size=args.max_batch_size,
+                               max_latency_ms=args.max_latency_ms,
+                               max_queue_images=args.max_queue_images,
+                               max_concurrent_jobs=args.max_concurrent_jobs)
+    service.warmup()
+
+    server = create_server(service, host=args.host, port=args.port, unix_socket=args.unix_socket,
+                           quiet=args.quiet)
+    address = args.unix_socket or f"http://{args.host}:{args.port}"
+    print(f"Embedding service listening on {address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        loader.close()
+
+if __name__ == "__main__":
+    main()
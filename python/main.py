@@ -2,7 +2,29 @@
 
 import os
 import argparse
+import tempfile
 from photo_curator import PhotoCurator
+from similarity.ann_index import INDEX_BACKENDS
+from similarity.clustering import CLUSTERING_METHODS
+from similarity.embedding_compression import EMBEDDING_CODECS, format_fidelity_report
+from models.tflite_similarity import TFLITE_MODEL_FILES
+from preprocessing.perceptual_hash import MAX_HASH_DISTANCE
+from profiling.instrumentation import Instrumentation
+from results.binary_results import save_results, load_results, export_json
+
+def stream_photos(curator, data_folder, max_memory_mb):
+    for event in curator.iter_process_photos(data_folder, max_memory_mb=max_memory_mb):
+        if event["type"] == "error":
+            return {"error": event["error"]}
+        if event["type"] == "progress":
+            print(f"Streamed {event['processed']}/{event['total']} images "
+                  f"({event['elapsed_seconds']:.1f}s)")
+        elif event["type"] == "duplicate_pair":
+            print(f"  duplicate: {os.path.basename(event['image1'])} <-> "
+                  f"{os.path.basename(event['image2'])} ({event['similarity']:.3f})")
+        elif event["type"] == "done":
+            return event["results"]
+    return {"error": "Processing stopped before completion"}
 
 def main():
     parser = argparse.ArgumentParser(description='Travel Photo Curation System')
@@ -10,10 +32,97 @@ def main():
                       help='Path to folder containing images')
     parser.add_argument('--similarity_threshold', type=float, default=0.85,
                       help='Similarity threshold for duplicate detection (0.0-1.0)')
+    parser.add_argument('--batch_size', type=int, default=32,
+                      help='Number of images per model inference batch')
+    parser.add_argument('--prefetch_batches', type=int, default=2,
+                      help='Number of batches decoded ahead of inference')
+    parser.add_argument('--num_workers', type=int, default=1,
+                      help='Number of processes used to decode and resize images')
+    parser.add_argument('--fast_decode', action='store_true',
+                      help='Decode JPEGs at reduced resolution and keep pixels as uint8')
+    parser.add_argument('--cache_dir', type=str, default=None,
+                      help='Directory for the persistent embedding cache')
+    parser.add_argument('--similarity_threads', type=int, default=1,
+                      help='Threads used for blocked similarity computation')
+    parser.add_argument('--export_similarity_matrix', action='store_true',
+                      help='Include the dense n x n similarity matrix in the results')
+    parser.add_argument('--index_backend', type=str, default='exact', choices=sorted(INDEX_BACKENDS),
+                      help='Nearest-neighbor backend for duplicate search')
+    parser.add_argument('--save_index', type=str, default=None,
+                      help='Path to save the approximate nearest-neighbor index')
+    parser.add_argument('--measure_index_recall', action='store_true',
+                      help='Report index recall against exact search')
+    parser.add_argument('--state_dir', type=str, default=None,
+                      help='Persist cluster state here and only process new or deleted photos')
+    parser.add_argument('--stream', action='store_true',
+                      help='Process photos through the streaming API with bounded memory')
+    parser.add_argument('--max_memory_mb', type=float, default=None,
+                      help='Memory cap for embeddings in streaming mode; spills to disk beyond it')
+    parser.add_argument('--backend', type=str, default='keras', choices=['keras', *TFLITE_MODEL_FILES],
+                      help='Inference backend for embedding extraction')
+    parser.add_argument('--tflite_model_dir', type=str, default='tflite_models',
+                      help='Folder containing the converted .tflite models')
+    parser.add_argument('--tflite_threads', type=int, default=1,
+                      help='Threads per TFLite interpreter')
+    parser.add_argument('--tflite_interpreters', type=int, default=None,
+                      help='Number of pooled TFLite interpreters (default: cores / threads)')
+    parser.add_argument('--no_xnnpack', action='store_true',
+                      help='Disable the XNNPACK delegate for TFLite backends')
+    parser.add_argument('--profile', action='store_true',
+                      help='Print a per-stage timing and latency summary')
+    parser.add_argument('--profile_json', type=str, default=None,
+                      help='Write the profiling summary as JSON')
+    parser.add_argument('--chrome_trace', type=str, default=None,
+                      help='Write a Chrome trace (chrome://tracing, Perfetto) of the run')
+    parser.add_argument('--hash_prefilter', action='store_true',
+                      help='Group exact and near-exact copies by perceptual hash before embedding')
+    parser.add_argument('--hash_method', type=str, default='dhash', choices=['dhash', 'phash'],
+                      help='Perceptual hash used by the prefilter')
+    parser.add_argument('--hash_max_distance', type=int, default=0,
+                      help=f'Maximum Hamming distance (bits of 64, at most {MAX_HASH_DISTANCE}) for hash matches')
+    parser.add_argument('--blocking', type=str, default=None, choices=['time', 'geo'],
+                      help='Only compare photos taken close together in time or space (EXIF)')
+    parser.add_argument('--time_window_seconds', type=float, default=600,
+                      help='Time window for --blocking time')
+    parser.add_argument('--geo_cell_degrees', type=float, default=0.01,
+                      help='Grid cell size in degrees for --blocking geo')
+    parser.add_argument('--model_dir', type=str, default=None,
+                      help='Save the built Keras model here on first run and load it on later runs')
+    parser.add_argument('--discovery_workers', type=int, default=4,
+                      help='Threads used to scan directories during discovery')
+    parser.add_argument('--discovery_manifest', type=str, default=None,
+                      help='Manifest file used to skip unchanged directories on later scans')
+    parser.add_argument('--clustering', type=str, default='leader', choices=CLUSTERING_METHODS,
+                      help='leader: first photo claims its matches; components: transitive '
+                           'duplicates via union-find; average: average-link with a size cap')
+    parser.add_argument('--max_cluster_size', type=int, default=None,
+                      help='Largest cluster average-link may form')
+    parser.add_argument('--embedding_codec', type=str, default=None, choices=sorted(EMBEDDING_CODECS),
+                      help='Keep embeddings compressed from extraction through exact search in batch '
+                           'runs (float16 2x, int8 4x, pca 4x, pca_int8 ~16x, pq 16x smaller); '
+                           'exact index_backend only, no --blocking')
+    parser.add_argument('--codec_report', action='store_true',
+                      help='Report duplicate-pair recall of each embedding codec against float32')
+    parser.add_argument('--results_out', type=str, default=None,
+                      help='Save results as a columnar binary directory (memory-mappable)')
+    parser.add_argument('--results_json', type=str, default=None,
+                      help='Also export results as JSON, streamed from the binary directory (a temporary one without --results_out)')
     parser.add_argument('--save_model', type=str, default=None,
                       help='Path to save model for TFLite conversion')
     
     args = parser.parse_args()
+    if not 0 <= args.hash_max_distance <= MAX_HASH_DISTANCE:
+        parser.error(f"--hash_max_distance must be between 0 and {MAX_HASH_DISTANCE}")
+    if args.index_backend == 'exact' and (args.save_index or args.measure_index_recall):
+        parser.error("--save_index and --measure_index_recall need an approximate --index_backend (lsh, hnsw)")
+    if args.embedding_codec and (args.blocking or args.index_backend != 'exact'):
+        parser.error("--embedding_codec needs --index_backend exact and no --blocking")
+    if args.embedding_codec and (args.stream or args.state_dir):
+        parser.error("--embedding_codec only applies to batch runs; drop --stream and --state_dir")
+    if args.embedding_codec and args.codec_report:
+        parser.error("--codec_report compares codecs against float32; run it without --embedding_codec")
+    if args.save_model and args.backend != 'keras':
+        parser.error("--save_model needs the keras backend; TFLite backends are already converted models")
     
     data_folder = os.path.abspath(args.data_folder)
     
@@ -24,10 +133,60 @@ def main():
     print("Starting Travel Photo Curation System")
     print(f"Data folder: {data_folder}")
     print(f"Similarity threshold: {args.similarity_threshold}")
+    print(f"Batch size: {args.batch_size}")
+    
+    instrumentation = None
+    if args.profile or args.profile_json or args.chrome_trace:
+        instrumentation = Instrumentation()
     
-    curator = PhotoCurator(similarity_threshold=args.similarity_threshold)
+    curator = PhotoCurator(similarity_threshold=args.similarity_threshold,
+                           batch_size=args.batch_size,
+                           prefetch_batches=args.prefetch_batches,
+                           num_workers=args.num_workers,
+                           fast_decode=args.fast_decode,
+                           cache_dir=args.cache_dir,
+                           similarity_threads=args.similarity_threads,
+                           export_similarity_matrix=args.export_similarity_matrix,
+                           index_backend=args.index_backend,
+                           backend=args.backend,
+                           tflite_model_dir=args.tflite_model_dir,
+                           tflite_threads=args.tflite_threads,
+                           tflite_interpreters=args.tflite_interpreters,
+                           use_xnnpack=not args.no_xnnpack,
+                           instrumentation=instrumentation,
+                           hash_prefilter=args.hash_prefilter,
+                           hash_method=args.hash_method,
+                           hash_max_distance=args.hash_max_distance,
+                           blocking=args.blocking,
+                           time_window_seconds=args.time_window_seconds,
+                           geo_cell_degrees=args.geo_cell_degrees,
+                           model_dir=args.model_dir or None,
+                           discovery_workers=args.discovery_workers,
+                           discovery_manifest=args.discovery_manifest,
+                           clustering_method=args.clustering,
+                           max_cluster_size=args.max_cluster_size,
+                           embedding_codec=args.embedding_codec,
+                           codec_report=args.codec_report)
     
-    results = curator.process_photos(data_folder)
+    try:
+        if args.state_dir:
+            results = curator.update_library(data_folder, args.state_dir)
+        elif args.stream:
+            results = stream_photos(curator, data_folder, args.max_memory_mb)
+        else:
+            results = curator.process_photos(data_folder)
+    finally:
+        curator.close()
+    
+    if instrumentation is not None:
+        if args.profile:
+            print("\n" + instrumentation.summary_table())
+        if args.profile_json:
+            instrumentation.save_json(args.profile_json)
+            print(f"Profile saved to: {args.profile_json}")
+        if args.chrome_trace:
+            instrumentation.save_chrome_trace(args.chrome_trace)
+            print(f"Chrome trace saved to: {args.chrome_trace}")
     
     if "error" in results:
         print(f"Error: {results['error']}")
@@ -35,6 +194,34 @@ def main():
     
     curator.print_summary(results)
     
+    if args.results_out:
+        save_results(results, args.results_out)
+        print(f"Results saved to: {args.results_out}")
+    if args.results_json:
+        if args.results_out:
+            export_json(load_results(args.results_out), args.results_json)
+        else:
+            # The JSON is streamed from a binary directory; without
+            # --results_out that directory is scratch space next to the output.
+            output_dir = os.path.dirname(os.path.abspath(args.results_json))
+            with tempfile.TemporaryDirectory(prefix='.results-', dir=output_dir) as results_dir:
+                save_results(results, results_dir)
+                export_json(load_results(results_dir), args.results_json)
+        print(f"Results exported to: {args.results_json}")
+    
+    if args.measure_index_recall and curator.similarity_calc.index is not None:
+        report = curator.similarity_calc.measure_index_recall()
+        print(f"Index recall ({report['backend']}): {report['recall']:.4f} "
+              f"({report['found_pairs']}/{report['exact_pairs']} pairs, "
+              f"{report['speedup']:.1f}x faster than exact)")
+    
+    if curator.compression_report:
+        print("\nEmbedding codec fidelity (duplicate pairs vs float32):")
+        print(format_fidelity_report(curator.compression_report))
+    
+    if args.save_index:
+        curator.save_index(args.save_index)
+    
     if args.save_model:
         curator.save_model_for_tflite(args.save_model)
 
@@ -0,0 +1,197 @@
+import os
+import hashlib
+import numpy as np
+from typing import List
+
+CACHE_VERSION = 2
+HASH_SAMPLE_BYTES = 64 * 1024
+
+
+def file_content_hash(path: str, size: int) -> str:
+    # Hashes the size plus the head and tail of the file. Photos almost never
+    # change without touching either end, and this keeps hashing O(1) per file.
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(size.to_bytes(8, 'little'))
+    with open(path, 'rb') as f:
+        digest.update(f.read(HASH_SAMPLE_BYTES))
+        if size > 2 * HASH_SAMPLE_BYTES:
+            f.seek(-HASH_SAMPLE_BYTES, os.SEEK_END)
+            digest.update(f.read(HASH_SAMPLE_BYTES))
+    return digest.hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, cache_dir: str, model_fingerprint: str):
+        self.cache_dir = cache_dir
+        self.model_fingerprint = model_fingerprint
+        self.index_path = os.path.join(cache_dir, 'index.npz')
+        self.embeddings_path = os.path.join(cache_dir, 'embeddings.npy')
+        
+        # path -> [row, size, mtime_ns, content_hash]; row indexes self._embeddings
+        # and self._quality
+        self._entries = {}
+        self._embeddings = None
+        self._quality = None
+        self._new_paths = []
+        self._new_embeddings = []
+        self._new_quality = []
+        self._dirty = False
+        self._load()
+    
+    def _load(self):
+        if not (os.path.exists(self.index_path) and os.path.exists(self.embeddings_path)):
+            return
+        
+        try:
+            index = np.load(self.index_path)
+            if int(index['version']) != CACHE_VERSION or str(index['model_fingerprint']) != self.model_fingerprint:
+                print("Embedding cache was built by a different model or decode settings; invalidating")
+                self._dirty = True
+                return
+            
+            embeddings = np.load(self.embeddings_path, mmap_mode='r')
+            for row, (path, size, mtime_ns, content_hash) in enumerate(zip(
+                    index['paths'].tolist(), index['sizes'].tolist(),
+                    index['mtimes'].tolist(), index['hashes'].tolist())):
+                self._entries[path] = [row, size, mtime_ns, content_hash]
+            self._embeddings = embeddings
+            self._quality = index['quality'].astype(np.float32)
+        except Exception as e:
+            print(f"Could not read embedding cache, rebuilding: {e}")
+            self._entries = {}
+            self._embeddings = None
+            self._quality = None
+            self._dirty = True
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def lookup(self, image_paths: List[str]) -> tuple:
+        hit_paths, hit_rows, missing_paths = self.lookup_rows(image_paths)
+        return hit_paths, self.get(hit_rows), missing_paths
+    
+    def get(self, rows) -> np.ndarray:
+        if len(rows) == 0:
+            return np.array([])
+        return np.asarray(self._embeddings[np.asarray(rows)], dtype=np.float32)
+    
+    def get_quality(self, rows) -> np.ndarray:
+        if len(rows) == 0:
+            return np.array([], dtype=np.float32)
+        return self._quality[np.asarray(rows)]
+    
+    def lookup_rows(self, image_paths: List[str]) -> tuple:
+        hit_paths = []
+        hit_rows = []
+        missing_paths = []
+        
+        for path in image_paths:
+            entry = self._entries.get(path)
+            if entry is None or entry[0] < 0:
+                missing_paths.append(path)
+                continue
+            
+            try:
+                stat = os.stat(path)
+            except OSError:
+                missing_paths.append(path)
+                continue
+            
+            if entry[1] == stat.st_size and entry[2] == stat.st_mtime_ns:
+                hit_paths.append(path)
+                hit_rows.append(entry[0])
+                continue
+            
+            # Touched but possibly unchanged (copy, sync, restore): fall back to content.
+            if entry[1] == stat.st_size and entry[3] == file_content_hash(path, stat.st_size):
+                entry[2] = stat.st_mtime_ns
+                self._dirty = True
+                hit_paths.append(path)
+                hit_rows.append(entry[0])
+                continue
+            
+            missing_paths.append(path)
+        
+        return hit_paths, hit_rows, missing_paths
+    
+    def add(self, image_paths: List[str], embeddings: np.ndarray, quality: np.ndarray = None):
+        if quality is None:
+            quality = np.full(len(image_paths), np.nan, dtype=np.float32)
+        for path, embedding, score in zip(image_paths, embeddings, quality):
+            try:
+                stat = os.stat(path)
+                content_hash = file_content_hash(path, stat.st_size)
+            except OSError:
+                continue
+            
+            # Row -1 marks an entry whose embedding is still in the pending list.
+            self._entries[path] = [-1, stat.st_size, stat.st_mtime_ns, content_hash]
+            self._new_paths.append(path)
+            self._new_embeddings.append(np.asarray(embedding, dtype=np.float32))
+            self._new_quality.append(score)
+            self._dirty = True
+    
+    def prune(self, seen_paths=None) -> int:
+        # Drops entries for files that no longer exist. Paths in seen_paths were
+        # just discovered on disk, so they skip the existence check.
+        seen = set(seen_paths or [])
+        removed = [path for path in self._entries
+                   if path not in seen and not os.path.exists(path)]
+        for path in removed:
+            del self._entries[path]
+        if removed:
+            self._dirty = True
+        return len(removed)
+    
+    def save(self):
+        if not self._dirty:
+            return
+        
+        os.makedirs(self.cache_dir, exist_ok=True)
+        
+        pending = {path: i for i, path in enumerate(self._new_paths)}
+        paths = list(self._entries.keys())
+        dim = None
+        if self._embeddings is not None and len(self._embeddings):
+            dim = self._embeddings.shape[1]
+        elif self._new_embeddings:
+            dim = self._new_embeddings[0].shape[0]
+        
+        tmp_embeddings = self.embeddings_path + '.tmp.npy'
+        output = np.lib.format.open_memmap(tmp_embeddings, mode='w+', dtype=np.float32,
+                                           shape=(len(paths), dim or 0))
+        quality = np.empty(len(paths), dtype=np.float32)
+        for new_row, path in enumerate(paths):
+            row = self._entries[path][0]
+            if row >= 0:
+                output[new_row] = self._embeddings[row]
+                quality[new_row] = self._quality[row]
+            else:
+                output[new_row] = self._new_embeddings[pending[path]]
+                quality[new_row] = self._new_quality[pending[path]]
+            self._entries[path][0] = new_row
+        output.flush()
+        del output
+        
+        tmp_index = self.index_path + '.tmp.npz'
+        entries = [self._entries[path] for path in paths]
+        np.savez(
+            tmp_index,
+            version=np.array(CACHE_VERSION),
+            model_fingerprint=np.array(self.model_fingerprint),
+            paths=np.array(paths, dtype=str),
+            sizes=np.array([e[1] for e in entries], dtype=np.int64),
+            mtimes=np.array([e[2] for e in entries], dtype=np.int64),
+            hashes=np.array([e[3] for e in entries], dtype=str),
+            quality=quality
+        )
+        
+        os.replace(tmp_embeddings, self.embeddings_path)
+        os.replace(tmp_index, self.index_path)
+        
+        self._embeddings = np.load(self.embeddings_path, mmap_mode='r')
+        self._quality = quality
+        self._new_paths = []
+        self._new_embeddings = []
+        self._new_quality = []
+        self._dirty = False
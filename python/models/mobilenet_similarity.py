@@ -1,12 +1,94 @@
+import os
+import json
 import tensorflow as tf
 from tensorflow.keras import layers, Model
 import numpy as np
+import hashlib
+from profiling.instrumentation import NULL_INSTRUMENTATION
+
+# Fixed seed for the projection head so embeddings (and cached results) are
+# reproducible across runs.
+EMBEDDING_SEED = 1337
+# Bump whenever _build_model changes so stale artifacts are rebuilt.
+MODEL_ARTIFACT_VERSION = 1
+
+@tf.keras.utils.register_keras_serializable(package='photo_curator')
+class L2Normalize(layers.Layer):
+    # A named layer instead of a Lambda so the model can be saved and
+    # loaded without unsafe deserialization.
+    def call(self, inputs):
+        return tf.nn.l2_normalize(inputs, axis=1)
 
 class MobileNetSimilarityModel:
-    def __init__(self, input_shape=(224, 224, 3), embedding_dim=512):
-        self.input_shape = input_shape
+    def __init__(self, input_shape=(224, 224, 3), embedding_dim=512, instrumentation=None,
+                 model_dir=None):
+        self.input_shape = tuple(input_shape)
         self.embedding_dim = embedding_dim
-        self.model = self._build_model()
+        self.instrumentation = instrumentation or NULL_INSTRUMENTATION
+        self.model_dir = model_dir
+        self._fingerprint = None
+        if model_dir:
+            self.model = self._load_or_build_artifact(model_dir)
+        else:
+            self.model = self._build_model()
+    
+    def artifact_paths(self, model_dir):
+        height, width, channels = self.input_shape
+        name = (f"mobilenet_similarity_v{MODEL_ARTIFACT_VERSION}"
+                f"_{height}x{width}x{channels}_d{self.embedding_dim}")
+        base = os.path.join(model_dir, name)
+        return base + ".keras", base + ".json"
+    
+    def _artifact_meta(self):
+        return {
+            "version": MODEL_ARTIFACT_VERSION,
+            "input_shape": list(self.input_shape),
+            "embedding_dim": self.embedding_dim,
+            "embedding_seed": EMBEDDING_SEED,
+            "tensorflow_version": tf.__version__,
+        }
+    
+    def _load_or_build_artifact(self, model_dir):
+        model_path, meta_path = self.artifact_paths(model_dir)
+        expected = self._artifact_meta()
+        
+        if os.path.exists(model_path) and os.path.exists(meta_path):
+            try:
+                with open(meta_path) as f:
+                    meta = json.load(f)
+                if {k: meta.get(k) for k in expected} == expected:
+                    with self.instrumentation.stage('model.load'):
+                        model = tf.keras.models.load_model(model_path, compile=False)
+                    self._fingerprint = meta.get("fingerprint")
+                    print(f"Loaded model artifact: {model_path}")
+                    return model
+                print(f"Model artifact {model_path} is stale, rebuilding")
+            except Exception as e:
+                # A truncated or corrupt .keras file can fail in many ways
+                # (BadZipFile, deserialization errors); rebuild in every case.
+                print(f"Could not load model artifact {model_path}: {e}")
+        
+        with self.instrumentation.stage('model.build'):
+            model = self._build_model()
+        self.model = model
+        self.save_artifact(model_dir)
+        return model
+    
+    def save_artifact(self, model_dir):
+        model_path, meta_path = self.artifact_paths(model_dir)
+        os.makedirs(model_dir, exist_ok=True)
+        meta = dict(self._artifact_meta(), fingerprint=self.fingerprint())
+        
+        # Write next to the target and rename so concurrent runs never see a
+        # partial artifact.
+        tmp_model = f"{model_path[:-len('.keras')]}.{os.getpid()}.tmp.keras"
+        tmp_meta = f"{meta_path}.{os.getpid()}.tmp"
+        self.model.save(tmp_model)
+        with open(tmp_meta, 'w') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp_model, model_path)
+        os.replace(tmp_meta, meta_path)
+        print(f"Saved model artifact: {model_path}")
     
     def _build_model(self):
         base_model = tf.keras.applications.MobileNetV3Large(
@@ -24,8 +106,13 @@ class MobileNetSimilarityModel:
         
         x = base_model(x, training=False)
         
-        x = layers.Dense(self.embedding_dim, activation=None, name='embedding')(x)
-        x = layers.Lambda(lambda t: tf.nn.l2_normalize(t, axis=1), name='l2_normalize')(x)
+        x = layers.Dense(
+            self.embedding_dim,
+            activation=None,
+            kernel_initializer=tf.keras.initializers.GlorotUniform(seed=EMBEDDING_SEED),
+            name='embedding'
+        )(x)
+        x = L2Normalize(name='l2_normalize')(x)
         
         model = Model(inputs, x, name='mobilenet_similarity')
         
@@ -34,6 +121,23 @@ class MobileNetSimilarityModel:
     def get_embeddings(self, images):
         return self.model.predict(images, batch_size=1)
     
+    def get_embeddings_batch(self, images):
+        # predict_on_batch skips the per-call dataset and callback setup of predict().
+        # Batches may arrive as uint8; widen to float only at the model boundary.
+        images = np.asarray(images, dtype=np.float32)
+        with self.instrumentation.stage('model.predict', batch_size=len(images)):
+            return np.asarray(self.model.predict_on_batch(images))
+    
+    def fingerprint(self):
+        if self._fingerprint is not None:
+            return self._fingerprint
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(repr((tuple(self.input_shape), self.embedding_dim)).encode())
+        for weight in self.model.get_weights():
+            digest.update(np.ascontiguousarray(weight).tobytes())
+        self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+    
     def save_for_tflite(self, filepath):
         self.model.export(filepath)
     
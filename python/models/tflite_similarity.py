@@ -0,0 +1,125 @@
+import os
+import queue
+import hashlib
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from profiling.instrumentation import NULL_INSTRUMENTATION
+
+TFLITE_MODEL_FILES = {
+    'tflite_dynamic': 'similarity_model_dynamic.tflite',
+    'tflite_float16': 'similarity_model_float16.tflite',
+    'tflite_int8': 'similarity_model_int8.tflite',
+}
+
+
+def quantize_input(images, detail):
+    dtype = detail['dtype']
+    if np.issubdtype(dtype, np.integer):
+        scale, zero_point = detail['quantization']
+        if images.dtype == dtype and (scale, zero_point) in ((1.0, 0), (0.0, 0)):
+            return images
+        if scale:
+            images = np.asarray(images, dtype=np.float32) / scale + zero_point
+        info = np.iinfo(dtype)
+        return np.clip(np.round(images), info.min, info.max).astype(dtype)
+    return np.asarray(images, dtype=dtype)
+
+
+def dequantize_output(outputs, detail):
+    if np.issubdtype(detail['dtype'], np.integer):
+        scale, zero_point = detail['quantization']
+        outputs = (outputs.astype(np.float32) - zero_point) * (scale or 1.0)
+    return np.asarray(outputs, dtype=np.float32)
+
+
+def create_interpreter(model_path, num_threads=None, use_xnnpack=True):
+    # Imported here so listing backends (e.g. for CLI choices) stays cheap.
+    import tensorflow as tf
+    
+    kwargs = {'model_path': model_path, 'num_threads': num_threads}
+    if not use_xnnpack:
+        # Passing experimental_delegates=[] does not disable the default
+        # XNNPACK delegate; the op resolver type does.
+        kwargs['experimental_op_resolver_type'] = \
+            tf.lite.experimental.OpResolverType.BUILTIN_WITHOUT_DEFAULT_DELEGATES
+    interpreter = tf.lite.Interpreter(**kwargs)
+    interpreter.allocate_tensors()
+    return interpreter
+
+
+class TFLiteSimilarityModel:
+    # Drop-in replacement for MobileNetSimilarityModel backed by a pool of
+    # TFLite interpreters. Interpreters are not thread-safe, so each worker
+    # thread checks one out, and invoke() releases the GIL so they run in parallel.
+    def __init__(self, model_path, num_interpreters=None, num_threads=1, use_xnnpack=True,
+                 instrumentation=None):
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"TFLite model not found: {model_path}. Run convert_to_tflite.py first.")
+        
+        self.model_path = model_path
+        self.num_interpreters = num_interpreters or max(1, (os.cpu_count() or 1) // max(1, num_threads))
+        self.num_threads = num_threads
+        self.use_xnnpack = use_xnnpack
+        self.instrumentation = instrumentation or NULL_INSTRUMENTATION
+        
+        interpreters = [create_interpreter(model_path, num_threads, use_xnnpack)
+                        for _ in range(self.num_interpreters)]
+        self._interpreters = queue.Queue()
+        for interpreter in interpreters:
+            self._interpreters.put(interpreter)
+        
+        interpreter = interpreters[0]
+        self.input_detail = interpreter.get_input_details()[0]
+        self.output_detail = interpreter.get_output_details()[0]
+        self.input_shape = tuple(int(d) for d in self.input_detail['shape'][1:])
+        self.embedding_dim = int(self.output_detail['shape'][-1])
+        self.dynamic_batch = int(self.input_detail['shape_signature'][0]) == -1
+        
+        self._executor = ThreadPoolExecutor(max_workers=self.num_interpreters)
+    
+    def _invoke(self, interpreter, images):
+        input_index = self.input_detail['index']
+        if tuple(interpreter.get_input_details()[0]['shape']) != images.shape:
+            interpreter.resize_tensor_input(input_index, images.shape)
+            interpreter.allocate_tensors()
+        interpreter.set_tensor(input_index, quantize_input(images, self.input_detail))
+        interpreter.invoke()
+        return dequantize_output(interpreter.get_tensor(self.output_detail['index']), self.output_detail)
+    
+    def _run_chunk(self, images):
+        interpreter = self._interpreters.get()
+        start_time = time.perf_counter()
+        try:
+            if self.dynamic_batch:
+                return self._invoke(interpreter, images)
+            return np.concatenate([self._invoke(interpreter, images[i:i + 1]) for i in range(len(images))])
+        finally:
+            self.instrumentation.record_span('tflite.invoke', start_time, time.perf_counter(),
+                                             category='model', args={'batch_size': len(images)})
+            self._interpreters.put(interpreter)
+    
+    def get_embeddings_batch(self, images):
+        images = np.asarray(images)
+        chunk = -(-len(images) // self.num_interpreters)
+        chunks = [images[start:start + chunk] for start in range(0, len(images), chunk)]
+        with self.instrumentation.stage('model.predict', batch_size=len(images)):
+            embeddings = np.concatenate(list(self._executor.map(self._run_chunk, chunks)))
+        # Quantized outputs drift off the unit sphere; renormalize for cosine.
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return embeddings / norms
+    
+    def get_embeddings(self, images):
+        return self.get_embeddings_batch(images)
+    
+    def fingerprint(self):
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(repr((self.input_shape, self.embedding_dim)).encode())
+        with open(self.model_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest()
+    
+    def close(self):
+        self._executor.shutdown()
@@ -1,25 +1,122 @@
 import os
-import glob
 import time
 import numpy as np
-from typing import List, Dict, Any
-from models.mobilenet_similarity import MobileNetSimilarityModel
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Iterator
+from models.tflite_similarity import TFLITE_MODEL_FILES
 from preprocessing.image_processor import ImageProcessor
+from preprocessing.batch_loader import PrefetchBatchLoader
+from preprocessing.file_discovery import FileDiscovery
+from preprocessing.parallel_processor import ParallelImageProcessor
+from preprocessing.perceptual_hash import PerceptualHasher, group_by_hash, MAX_HASH_DISTANCE
+from models.embedding_cache import EmbeddingCache
+from similarity.cluster_state import ClusterState
+from similarity.embedding_store import EmbeddingStore
+from similarity.embedding_compression import compression_fidelity_report, CompressedEmbeddings, StreamingEncoder
+from similarity.similarity_graph import SimilarityGraph
 from similarity.similarity_calculator import SimilarityCalculator
+from profiling.instrumentation import NULL_INSTRUMENTATION
 
 class PhotoCurator:
-    def __init__(self, similarity_threshold=0.85, target_size=(224, 224)):
+    def __init__(self, similarity_threshold=0.85, target_size=(224, 224),
+                 batch_size=32, prefetch_batches=2, num_workers=1, fast_decode=False,
+                 cache_dir=None, similarity_block_size=1024, similarity_threads=1,
+                 export_similarity_matrix=False, index_backend='exact', index_params=None,
+                 backend='keras', tflite_model_dir='tflite_models', tflite_threads=1,
+                 tflite_interpreters=None, use_xnnpack=True, instrumentation=None,
+                 hash_prefilter=False, hash_method='dhash', hash_max_distance=0,
+                 blocking=None, time_window_seconds=600, geo_cell_degrees=0.01,
+                 model_dir=None, discovery_workers=1, discovery_manifest=None,
+                 clustering_method='leader', max_cluster_size=None,
+                 embedding_codec=None, codec_params=None, codec_report=False, model=None):
         self.similarity_threshold = similarity_threshold
         self.target_size = target_size
+        self.batch_size = batch_size
+        self.prefetch_batches = prefetch_batches
+        self.num_workers = num_workers
+        self.fast_decode = fast_decode
+        self.export_similarity_matrix = export_similarity_matrix
+        self.instrumentation = instrumentation or NULL_INSTRUMENTATION
+        if not 0 <= hash_max_distance <= MAX_HASH_DISTANCE:
+            raise ValueError(f"hash_max_distance must be between 0 and {MAX_HASH_DISTANCE}, got {hash_max_distance}")
+        self.hash_max_distance = hash_max_distance
+        self.hasher = None
+        self.discovery = FileDiscovery(num_workers=discovery_workers, manifest_path=discovery_manifest)
+        if hash_prefilter:
+            self.hasher = PerceptualHasher(method=hash_method, num_workers=max(1, num_workers))
+        # Fast mode keeps pixels as uint8 until the model casts them.
+        decode_dtype = np.uint8 if fast_decode else np.float32
         
-        print("Initializing MobileNetV3 similarity model...")
-        self.model = MobileNetSimilarityModel(
-            input_shape=(*target_size, 3),
-            embedding_dim=512
-        )
+        self.processor = ImageProcessor(target_size=target_size,
+                                        fast_decode=fast_decode,
+                                        dtype=decode_dtype,
+                                        instrumentation=self.instrumentation)
+        self.decoder = self.processor
+        if num_workers > 1:
+            # Start the decode pool before TensorFlow spins up its threads so
+            # forked workers never inherit them.
+            self.decoder = ParallelImageProcessor(target_size=target_size,
+                                                  num_workers=num_workers,
+                                                  fast_decode=fast_decode,
+                                                  dtype=decode_dtype,
+                                                  instrumentation=self.instrumentation)
+            self.decoder.start()
         
-        self.processor = ImageProcessor(target_size=target_size)
-        self.similarity_calc = SimilarityCalculator(similarity_threshold=similarity_threshold)
+        # Model modules pull in TensorFlow, so they are imported only once a
+        # backend is actually being built. A prebuilt model (anything with
+        # get_embeddings_batch, fingerprint and embedding_dim) skips that.
+        self.backend = backend
+        if model is not None:
+            self.model = model
+        elif backend == 'keras':
+            from models.mobilenet_similarity import MobileNetSimilarityModel
+            print("Initializing MobileNetV3 similarity model...")
+            self.model = MobileNetSimilarityModel(
+                input_shape=(*target_size, 3),
+                embedding_dim=512,
+                instrumentation=self.instrumentation,
+                model_dir=model_dir
+            )
+        elif backend in TFLITE_MODEL_FILES:
+            from models.tflite_similarity import TFLiteSimilarityModel
+            model_path = os.path.join(tflite_model_dir, TFLITE_MODEL_FILES[backend])
+            print(f"Initializing TFLite similarity model: {model_path}")
+            self.model = TFLiteSimilarityModel(model_path,
+                                               num_interpreters=tflite_interpreters,
+                                               num_threads=tflite_threads,
+                                               use_xnnpack=use_xnnpack,
+                                               instrumentation=self.instrumentation)
+            if self.model.input_shape[:2] != (target_size[1], target_size[0]):
+                raise ValueError(f"TFLite model expects {self.model.input_shape[:2]} inputs, got target_size {target_size}")
+        else:
+            raise ValueError(f"Unknown backend '{backend}'. Choose from: keras, {', '.join(TFLITE_MODEL_FILES)}")
+        
+        self.similarity_calc = SimilarityCalculator(similarity_threshold=similarity_threshold,
+                                                    block_size=similarity_block_size,
+                                                    num_threads=similarity_threads,
+                                                    index_backend=index_backend,
+                                                    index_params=index_params,
+                                                    instrumentation=self.instrumentation,
+                                                    blocking=blocking,
+                                                    time_window_seconds=time_window_seconds,
+                                                    geo_cell_degrees=geo_cell_degrees,
+                                                    clustering_method=clustering_method,
+                                                    max_cluster_size=max_cluster_size,
+                                                    embedding_codec=embedding_codec,
+                                                    codec_params=codec_params)
+        # Pair recall of every codec against float32, filled in by the next
+        # batch clustering pass when requested.
+        if codec_report and embedding_codec is not None:
+            raise ValueError("codec_report compares codecs against float32 embeddings; "
+                             "it cannot run with embedding_codec")
+        self.codec_report = codec_report
+        self.compression_report = None
+        
+        self._model_fingerprint = None
+        self.cache = None
+        if cache_dir:
+            self.cache = EmbeddingCache(cache_dir, self.cache_fingerprint())
+            print(f"Embedding cache: {cache_dir} ({len(self.cache)} entries)")
         
         print("Model initialized successfully!")
     
@@ -34,15 +131,26 @@ class PhotoCurator:
         
         start_time = time.time()
         
-        embeddings, valid_paths = self._extract_embeddings(image_paths)
+        with self.instrumentation.stage('embedding', images=len(image_paths)):
+            embeddings, valid_paths, quality = self._extract_embeddings(
+                image_paths, compress=self.similarity_calc.embedding_codec is not None)
         
         if len(embeddings) == 0:
             return {"error": "No valid images could be processed"}
         
         print(f"Extracted embeddings for {len(valid_paths)} images")
+        if isinstance(embeddings, CompressedEmbeddings):
+            print(f"Embeddings stored as {self.similarity_calc.embedding_codec}: "
+                  f"{embeddings.nbytes / 2**20:.1f} MB "
+                  f"(float32: {len(embeddings) * self.model.embedding_dim * 4 / 2**20:.1f} MB)")
         
-        clusters = self.similarity_calc.greedy_clustering(embeddings, valid_paths)
-        duplicate_pairs, similarity_matrix = self.similarity_calc.find_duplicate_pairs(embeddings, valid_paths)
+        return self._build_results(image_paths, embeddings, valid_paths, quality, start_time)
+    
+    def _build_results(self, image_paths: List[str], embeddings: np.ndarray, valid_paths: List[str],
+                       quality: np.ndarray, start_time: float) -> Dict[str, Any]:
+        # Shared by process_photos and the sharded merge so both produce the
+        # same results from the same embeddings.
+        clusters, duplicate_pairs = self._cluster_embeddings(embeddings, valid_paths, quality)
         
         processing_time = time.time() - start_time
         
@@ -53,40 +161,439 @@ class PhotoCurator:
             "duplicate_pairs": duplicate_pairs,
             "processing_time_seconds": processing_time,
             "avg_time_per_image": processing_time / len(valid_paths) if valid_paths else 0,
-            "similarity_matrix": similarity_matrix.tolist(),
             "recommended_photos": self._get_recommended_photos(clusters)
         }
         
+        if self.export_similarity_matrix:
+            # Stays a float32 ndarray; save_results writes it as .npy and only
+            # the JSON export turns it into lists.
+            results["similarity_matrix"] = self.similarity_calc.compute_similarity_matrix(embeddings)
+        
         return results
     
+    def update_library(self, image_folder: str, state_dir: str) -> Dict[str, Any]:
+        if self.similarity_calc.embedding_codec is not None:
+            raise ValueError("embedding_codec only applies to process_photos; incremental state keeps float32")
+        print(f"Updating library in: {image_folder}")
+        
+        image_paths = self._get_image_paths(image_folder)
+        print(f"Found {len(image_paths)} images")
+        
+        if not image_paths:
+            return {"error": "No images found in the specified folder"}
+        
+        start_time = time.time()
+        
+        state = ClusterState.load(state_dir, self.model_fingerprint(), self.similarity_threshold)
+        
+        if state is None:
+            print("No usable library state found; clustering from scratch")
+            embeddings, valid_paths, quality = self._extract_embeddings(image_paths)
+            if len(embeddings) == 0:
+                return {"error": "No valid images could be processed"}
+            
+            clusters, duplicate_pairs = self._cluster_embeddings(embeddings, valid_paths, quality)
+            state = ClusterState.from_clusters(state_dir, self.model_fingerprint(), self.similarity_threshold,
+                                               valid_paths, embeddings, clusters, quality)
+            new_count, changed_count, removed_count = len(valid_paths), 0, 0
+            new_images = new_count
+        else:
+            known_paths = set(state.active_paths())
+            current_paths = set(image_paths)
+            removed_count = state.remove([p for p in known_paths if p not in current_paths])
+            # An edited photo is re-embedded and re-assigned like a new one.
+            changed_paths = state.changed_paths(image_paths)
+            changed_count = state.remove(changed_paths)
+            known_paths.difference_update(changed_paths)
+            new_paths = [p for p in image_paths if p not in known_paths]
+            print(f"Library state: {len(known_paths)} known, {len(new_paths) - changed_count} new, "
+                  f"{changed_count} changed, {removed_count} removed")
+            
+            new_count = new_images = 0
+            duplicate_pairs = []
+            if new_paths:
+                embeddings, valid_new, quality = self._extract_embeddings(new_paths)
+                if len(embeddings):
+                    duplicate_pairs = self._assign_new_photos(state, embeddings, valid_new, quality)
+                    new_count = len(valid_new)
+                    changed = set(changed_paths)
+                    new_images = sum(1 for path in valid_new if path not in changed)
+        
+        state.save()
+        processing_time = time.time() - start_time
+        
+        clusters = state.clusters()
+        processed = int(state.active.sum())
+        
+        return {
+            "total_images": len(image_paths),
+            "processed_images": processed,
+            "new_images": new_images,
+            "changed_images": changed_count,
+            "removed_images": removed_count,
+            "clusters": clusters,
+            "duplicate_pairs": duplicate_pairs,
+            "processing_time_seconds": processing_time,
+            "avg_time_per_image": processing_time / new_count if new_count else 0,
+            "recommended_photos": self._get_recommended_photos(clusters)
+        }
+    
+    def _assign_new_photos(self, state: ClusterState, embeddings: np.ndarray, new_paths: List[str],
+                           quality: np.ndarray = None) -> List[Dict]:
+        # Each new photo joins the cluster of its most similar match above the
+        # threshold, among the existing library and earlier new photos, or
+        # starts a new cluster. Only new photos are ever compared.
+        existing = state.active_indices()
+        query_ids, base_ids, scores = self.similarity_calc.find_neighbors(embeddings, state.embeddings[existing])
+        base_ids = existing[base_ids]
+        new_rows, new_cols, new_scores = self.similarity_calc.find_pairs_above_threshold(embeddings)
+        
+        best_score = np.full(len(new_paths), -np.inf)
+        best_label = np.full(len(new_paths), -1, dtype=np.int64)
+        for q, b, score in zip(query_ids.tolist(), base_ids.tolist(), scores.tolist()):
+            if score > best_score[q]:
+                best_score[q] = score
+                best_label[q] = state.labels[b]
+        
+        earlier = {}
+        for r, c, score in zip(new_rows.tolist(), new_cols.tolist(), new_scores.tolist()):
+            earlier.setdefault(c, []).append((r, score))
+        
+        next_label = state.next_label
+        for i in range(len(new_paths)):
+            for j, score in earlier.get(i, []):
+                if score > best_score[i]:
+                    best_score[i] = score
+                    best_label[i] = best_label[j]
+            if best_label[i] < 0:
+                best_label[i] = next_label
+                next_label += 1
+        
+        start = len(state.paths)
+        state.append(new_paths, embeddings, best_label, quality)
+        
+        positions = state.positions()
+        duplicate_pairs = []
+        for b, q, score in zip(base_ids.tolist(), query_ids.tolist(), scores.tolist()):
+            duplicate_pairs.append((positions[b], positions[start + q], score))
+        for r, c, score in zip(new_rows.tolist(), new_cols.tolist(), new_scores.tolist()):
+            duplicate_pairs.append((positions[start + r], positions[start + c], score))
+        duplicate_pairs.sort()
+        
+        active_paths = state.active_paths()
+        return [
+            {
+                'image1': active_paths[i],
+                'image2': active_paths[j],
+                'similarity': score,
+                'index1': int(i),
+                'index2': int(j)
+            }
+            for i, j, score in duplicate_pairs
+        ]
+    
+    def _cluster_embeddings(self, embeddings: np.ndarray, valid_paths: List[str],
+                            quality: np.ndarray = None) -> tuple:
+        # One thresholded pass feeds both clustering and pair reporting, so
+        # memory scales with the number of duplicates rather than n^2.
+        metadata = None
+        if self.similarity_calc.blocking:
+            with self.instrumentation.stage('metadata', images=len(valid_paths)):
+                metadata = self._read_capture_metadata(valid_paths)
+        
+        graph = self.similarity_calc.build_similarity_graph(embeddings, metadata=metadata)
+        if self.codec_report:
+            with self.instrumentation.stage('similarity.codec_report', images=len(valid_paths)):
+                self.compression_report = compression_fidelity_report(
+                    embeddings, self.similarity_threshold, block_size=self.similarity_calc.block_size)
+        clusters = self.similarity_calc.cluster(embeddings, valid_paths, graph=graph, quality=quality)
+        duplicate_pairs = self.similarity_calc.duplicate_pairs_from_graph(graph, valid_paths)
+        return clusters, duplicate_pairs
+    
+    def _read_capture_metadata(self, image_paths: List[str]) -> List[Dict]:
+        # EXIF lives in the file header, so these reads are I/O bound.
+        with ThreadPoolExecutor(max_workers=max(4, self.num_workers)) as executor:
+            metadata = list(executor.map(self.processor.read_capture_metadata, image_paths))
+        
+        missing_time = sum(1 for m in metadata if m['capture_time'] is None)
+        missing_gps = sum(1 for m in metadata if m['gps'] is None)
+        print(f"Capture metadata: {missing_time} without time, {missing_gps} without GPS "
+              f"(compared in a fallback bucket)")
+        return metadata
+    
+    def model_fingerprint(self) -> str:
+        if self._model_fingerprint is None:
+            self._model_fingerprint = self.model.fingerprint()
+        return self._model_fingerprint
+    
+    def cache_fingerprint(self) -> str:
+        # Cached embeddings and quality scores also depend on how pixels were
+        # decoded, so a cache is only reused with the same decode settings.
+        width, height = self.target_size
+        return f"{self.model_fingerprint()}|{width}x{height}|fast_decode={int(bool(self.fast_decode))}"
+    
     def _get_image_paths(self, folder: str) -> List[str]:
-        extensions = ['*.jpg', '*.jpeg', '*.png', '*.bmp', '*.tiff']
-        image_paths = []
+        with self.instrumentation.stage('discovery'):
+            return self._discover_image_paths(folder)
+    
+    def _discover_image_paths(self, folder: str) -> List[str]:
+        image_paths = self.discovery.discover(folder)
+        if self.discovery.stats.get("had_manifest"):
+            stats, changes = self.discovery.stats, self.discovery.changes
+            print(f"Discovery: {stats['reused_directories']}/{stats['directories']} directories unchanged; "
+                  f"{len(changes['added'])} added, {len(changes['removed'])} removed, "
+                  f"{len(changes['modified'])} modified files since last scan")
+        return image_paths
+    
+    def iter_process_photos(self, image_folder: str, max_memory_mb: float = None) -> Iterator[Dict[str, Any]]:
+        # Streams events while processing:
+        #   started        - number of images discovered
+        #   embedding      - one per image as soon as its batch finishes
+        #   duplicate_pair - as soon as both photos have been embedded
+        #   progress       - after every batch
+        #   cluster        - finalized clusters once every photo has been seen
+        #   done           - the same results dict as process_photos()
+        # Embeddings spill to disk past max_memory_mb, and cross-batch
+        # comparisons read them back in bounded chunks.
+        if self.similarity_calc.embedding_codec is not None:
+            raise ValueError("embedding_codec only applies to process_photos; streaming keeps float32")
+        image_paths = self._get_image_paths(image_folder)
+        
+        if not image_paths:
+            yield {"type": "error", "error": "No images found in the specified folder"}
+            return
         
-        for ext in extensions:
-            pattern = os.path.join(folder, '**', ext)
-            image_paths.extend(glob.glob(pattern, recursive=True))
-            pattern = os.path.join(folder, '**', ext.upper())
-            image_paths.extend(glob.glob(pattern, recursive=True))
+        yield {"type": "started", "total_images": len(image_paths)}
+        
+        start_time = time.time()
+        max_memory_bytes = max_memory_mb * 1024 * 1024 if max_memory_mb else None
+        store_budget = max_memory_bytes // 2 if max_memory_bytes else None
+        # Each comparison chunk costs a chunk of embeddings plus a batch x chunk score block.
+        chunk_rows = 8192
+        if max_memory_bytes:
+            chunk_rows = max(256, int(max_memory_bytes // 4 // ((self.model.embedding_dim + self.batch_size) * 4)))
         
-        return sorted(list(set(image_paths)))
+        store = None
+        arrival_paths = []
+        arrival_quality = []
+        rows, cols, scores = [], [], []
+        
+        try:
+            for batch_embeddings, batch_paths, batch_quality in self._iter_embedding_batches(image_paths):
+                if store is None:
+                    store = EmbeddingStore(batch_embeddings.shape[1], max_memory_bytes=store_budget)
+                start = len(store)
+                
+                batch_rows, batch_cols, batch_scores = [], [], []
+                for chunk_start, chunk in store.iter_chunks(chunk_rows):
+                    q, b, score = self.similarity_calc.find_neighbors(batch_embeddings, chunk)
+                    batch_rows.append(b + chunk_start)
+                    batch_cols.append(q + start)
+                    batch_scores.append(score)
+                r, c, score = self.similarity_calc.find_pairs_above_threshold(batch_embeddings)
+                batch_rows.append(r + start)
+                batch_cols.append(c + start)
+                batch_scores.append(score)
+                
+                store.append(batch_embeddings)
+                arrival_paths.extend(batch_paths)
+                arrival_quality.append(batch_quality)
+                
+                for offset, (path, embedding, score) in enumerate(zip(batch_paths, batch_embeddings, batch_quality)):
+                    yield {"type": "embedding", "index": start + offset, "path": path, "embedding": embedding,
+                           "quality": float(score)}
+                
+                for i, j, score in zip(np.concatenate(batch_rows).tolist(), np.concatenate(batch_cols).tolist(),
+                                       np.concatenate(batch_scores).tolist()):
+                    yield {"type": "duplicate_pair", "image1": arrival_paths[i], "image2": arrival_paths[j],
+                           "similarity": score}
+                
+                rows.extend(batch_rows)
+                cols.extend(batch_cols)
+                scores.extend(batch_scores)
+                
+                yield {
+                    "type": "progress",
+                    "processed": len(arrival_paths),
+                    "total": len(image_paths),
+                    "elapsed_seconds": time.time() - start_time,
+                    "spilled_to_disk": store.spilled
+                }
+        finally:
+            if store is not None:
+                store.close()
+        
+        if not arrival_paths:
+            yield {"type": "error", "error": "No valid images could be processed"}
+            return
+        
+        # Batches arrive in cache/model order; clustering uses discovery order
+        # so the outcome matches process_photos().
+        rank = {path: i for i, path in enumerate(image_paths)}
+        order = np.argsort([rank[path] for path in arrival_paths], kind='stable')
+        position = np.empty(len(order), dtype=np.int64)
+        position[order] = np.arange(len(order))
+        valid_paths = [arrival_paths[i] for i in order]
+        quality = np.concatenate(arrival_quality)[order]
+        
+        a, b = position[np.concatenate(rows)], position[np.concatenate(cols)]
+        graph = SimilarityGraph(len(valid_paths), np.minimum(a, b), np.maximum(a, b), np.concatenate(scores))
+        clusters = self.similarity_calc.cluster(None, valid_paths, graph=graph, quality=quality)
+        duplicate_pairs = self.similarity_calc.duplicate_pairs_from_graph(graph, valid_paths)
+        
+        for cluster in clusters:
+            yield {"type": "cluster", "cluster": cluster}
+        
+        processing_time = time.time() - start_time
+        yield {
+            "type": "done",
+            "results": {
+                "total_images": len(image_paths),
+                "processed_images": len(valid_paths),
+                "clusters": clusters,
+                "duplicate_pairs": duplicate_pairs,
+                "processing_time_seconds": processing_time,
+                "avg_time_per_image": processing_time / len(valid_paths),
+                "recommended_photos": self._get_recommended_photos(clusters)
+            }
+        }
     
-    def _extract_embeddings(self, image_paths: List[str]) -> tuple:
+    def _extract_embeddings(self, image_paths: List[str], hashes: List = None, compress: bool = False) -> tuple:
+        # With compress, batches are encoded as they arrive and the result is
+        # CompressedEmbeddings rather than a float32 matrix.
         embeddings = []
+        encoder = StreamingEncoder(self.similarity_calc.create_codec()) if compress else None
         valid_paths = []
+        quality = []
         
-        print("Extracting embeddings...")
-        for i, path in enumerate(image_paths):
-            if i % 10 == 0:
-                print(f"Processing image {i+1}/{len(image_paths)}")
+        for batch_embeddings, batch_paths, batch_quality in self._iter_embedding_batches(image_paths, hashes):
+            if encoder is not None:
+                encoder.append(batch_embeddings)
+            else:
+                embeddings.append(batch_embeddings)
+            valid_paths.extend(batch_paths)
+            quality.append(batch_quality)
+        
+        if not valid_paths:
+            return np.array([]), [], np.array([], dtype=np.float32)
+        
+        # Cache hits come back before model results; restore discovery order.
+        rank = {path: i for i, path in enumerate(image_paths)}
+        order = np.argsort([rank[path] for path in valid_paths], kind='stable')
+        
+        embeddings = encoder.finish().take(order) if encoder is not None else np.concatenate(embeddings)[order]
+        return embeddings, [valid_paths[i] for i in order], np.concatenate(quality)[order]
+    
+    def _iter_embedding_batches(self, image_paths: List[str], hashes: List = None) -> Iterator[tuple]:
+        if self.hasher is None:
+            yield from self._iter_unique_embedding_batches(image_paths)
+            return
+        
+        # Photos whose perceptual hash matches an earlier photo's reuse that
+        # photo's embedding instead of going through the model. Callers that
+        # already hashed the photos pass the hashes in.
+        with self.instrumentation.stage('hash_prefilter', images=len(image_paths)):
+            if hashes is None:
+                hashes = self.hasher.hash_images(image_paths)
+            leaders = group_by_hash(hashes, self.hash_max_distance)
+        
+        followers = {}
+        for i, leader in enumerate(leaders.tolist()):
+            if leader != i:
+                followers.setdefault(image_paths[leader], []).append(image_paths[i])
+        unique_paths = [path for i, path in enumerate(image_paths) if leaders[i] == i]
+        print(f"Perceptual hash prefilter: {len(image_paths) - len(unique_paths)} of "
+              f"{len(image_paths)} images reuse a matching photo's embedding")
+        
+        # A leader that hashes but fails to decode hands its group to its
+        # first follower, which is embedded in a further pass.
+        while unique_paths:
+            embedded = set()
+            for batch_embeddings, batch_paths, batch_quality in self._iter_unique_embedding_batches(unique_paths):
+                rows = []
+                paths = []
+                for row, path in enumerate(batch_paths):
+                    embedded.add(path)
+                    for member in [path] + followers.get(path, []):
+                        rows.append(row)
+                        paths.append(member)
+                yield batch_embeddings[rows], paths, batch_quality[rows]
+            
+            promoted = {}
+            for path in unique_paths:
+                if path not in embedded and followers.get(path):
+                    promoted[followers[path][0]] = followers[path][1:]
+            if promoted:
+                print(f"Perceptual hash prefilter: {len(promoted)} photos stand in for a matching "
+                      f"photo that failed to decode")
+            followers = promoted
+            unique_paths = list(promoted)
+    
+    def _iter_unique_embedding_batches(self, image_paths: List[str]) -> Iterator[tuple]:
+        if self.cache is None:
+            yield from self._iter_model_batches(image_paths)
+            return
+        
+        with self.instrumentation.stage('cache.lookup', images=len(image_paths)):
+            cached_paths, cached_rows, missing_paths = self.cache.lookup_rows(image_paths)
+        print(f"Embedding cache: {len(cached_paths)} hits, {len(missing_paths)} misses")
+        
+        # Saved even when the consumer stops early, so a cancelled run keeps
+        # the embeddings it already paid for.
+        try:
+            for start in range(0, len(cached_paths), self.batch_size):
+                end = start + self.batch_size
+                rows = cached_rows[start:end]
+                yield self.cache.get(rows), cached_paths[start:end], self.cache.get_quality(rows)
             
-            img_array = self.processor.load_and_preprocess_image(path)
-            if img_array is not None:
-                embedding = self.model.get_embeddings(img_array)
-                embeddings.append(embedding[0])
-                valid_paths.append(path)
+            for batch_embeddings, batch_paths, batch_quality in self._iter_model_batches(missing_paths):
+                self.cache.add(batch_paths, batch_embeddings, batch_quality)
+                yield batch_embeddings, batch_paths, batch_quality
+        finally:
+            removed = self.cache.prune(image_paths)
+            if removed:
+                print(f"Embedding cache: pruned {removed} deleted files")
+            self.cache.save()
+    
+    def _iter_model_batches(self, image_paths: List[str]) -> Iterator[tuple]:
+        if not image_paths:
+            return
+        
+        loader = PrefetchBatchLoader(self.decoder,
+                                     batch_size=self.batch_size,
+                                     prefetch_batches=self.prefetch_batches,
+                                     score_fn=self.processor.quality_scores)
         
-        return np.array(embeddings), valid_paths
+        processed = 0
+        print(f"Extracting embeddings (batch size {self.batch_size})...")
+        for batch, batch_paths, batch_quality in loader.iter_batches(image_paths):
+            processed += len(batch_paths)
+            print(f"Processed {processed}/{len(image_paths)} images")
+            
+            start_time = time.perf_counter()
+            embeddings = self.model.get_embeddings_batch(batch)
+            end_time = time.perf_counter()
+            elapsed = end_time - start_time
+            self.instrumentation.record_span('embed.batch', start_time, end_time, category='batch',
+                                             args={'size': len(batch_paths)})
+            self.instrumentation.record_batch(len(batch_paths), self.batch_size)
+            for _ in batch_paths:
+                self.instrumentation.record_latency('embed', elapsed / len(batch_paths))
+            
+            yield embeddings, batch_paths, batch_quality
+    
+    def save_index(self, output_path: str):
+        if self.similarity_calc.index is None:
+            print("No similarity index has been built yet")
+            return
+        self.similarity_calc.index.save(output_path)
+        print(f"Similarity index saved to: {output_path}")
+    
+    def close(self):
+        if self.decoder is not self.processor:
+            self.decoder.close()
+        if hasattr(self.model, 'close'):
+            self.model.close()
     
     def _get_recommended_photos(self, clusters: List[Dict]) -> List[str]:
         recommended = []
@@ -95,6 +602,8 @@ class PhotoCurator:
         return recommended
     
     def save_model_for_tflite(self, output_path: str):
+        if not hasattr(self.model, 'save_for_tflite'):
+            raise ValueError(f"The {self.backend} backend has no Keras model to save")
         print(f"Saving model for TFLite conversion to: {output_path}")
         self.model.save_for_tflite(output_path)
         print("Model saved successfully!")
@@ -108,6 +617,9 @@ class PhotoCurator:
         print(f"Processing time: {results['processing_time_seconds']:.2f} seconds")
         print(f"Average time per image: {results['avg_time_per_image']*1000:.1f} ms")
         print(f"Found {len(results['clusters'])} clusters")
+        if 'new_images' in results:
+            print(f"New images: {results['new_images']}, changed images: {results['changed_images']}, "
+                  f"removed images: {results['removed_images']}")
         print(f"Found {len(results['duplicate_pairs'])} duplicate pairs")
         print(f"Recommended photos: {len(results['recommended_photos'])}")
         
@@ -0,0 +1,69 @@
+import queue
+import threading
+import numpy as np
+
+
+class PrefetchBatchLoader:
+    _END = object()
+
+    def __init__(self, processor, batch_size=32, prefetch_batches=2, score_fn=None):
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        self.processor = processor
+        self.batch_size = batch_size
+        self.prefetch_batches = max(1, prefetch_batches)
+        # Optional per-batch function run on the producer thread, so work on
+        # decoded pixels overlaps with inference. Its result is yielded as
+        # the third item (None without a score_fn).
+        self.score_fn = score_fn
+
+    def iter_batches(self, image_paths):
+        # A background thread decodes the next batches while the caller runs
+        # inference on the current one; the bounded queue caps memory.
+        batches = queue.Queue(maxsize=self.prefetch_batches)
+        stop = threading.Event()
+
+        def emit(batch, batch_paths):
+            scores = self.score_fn(batch) if self.score_fn is not None else None
+            return put((batch, batch_paths, scores))
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def producer():
+            try:
+                batch, batch_paths = None, []
+                for path, image in self.processor.iter_images(image_paths):
+                    if batch is None:
+                        batch = np.empty((self.batch_size, *image.shape[1:]), dtype=image.dtype)
+                    batch[len(batch_paths)] = image[0]
+                    batch_paths.append(path)
+                    if len(batch_paths) == self.batch_size:
+                        if not emit(batch, batch_paths):
+                            return
+                        batch, batch_paths = None, []
+                if batch_paths:
+                    emit(batch[:len(batch_paths)], batch_paths)
+                put(self._END)
+            except Exception as e:
+                put(e)
+
+        worker = threading.Thread(target=producer, name="batch-prefetch", daemon=True)
+        worker.start()
+        try:
+            while True:
+                item = batches.get()
+                if item is self._END:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            worker.join(timeout=1.0)
@@ -0,0 +1,152 @@
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, List, Optional
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff')
+MANIFEST_VERSION = 1
+# A directory listing is only reused if the directory had stopped changing
+# this long before the previous scan, so an edit racing that scan inside the
+# same mtime tick is never missed.
+MTIME_SAFETY_NS = 1_000_000_000
+
+
+def _scan_directory(path, extensions):
+    stat = os.stat(path)
+    subdirs, files = [], []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            # Hidden entries are skipped, as glob's '**' does.
+            if entry.name.startswith('.'):
+                continue
+            try:
+                if entry.is_dir():
+                    subdirs.append(entry.name)
+                elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in extensions:
+                    file_stat = entry.stat()
+                    files.append([entry.name, file_stat.st_size, file_stat.st_mtime_ns])
+            except OSError:
+                continue
+    return {"mtime_ns": stat.st_mtime_ns, "dirs": sorted(subdirs), "files": sorted(files)}, \
+        (stat.st_dev, stat.st_ino)
+
+
+class FileDiscovery:
+    # Walks a photo library once with os.scandir. Directories are scanned in
+    # parallel, and with a manifest a directory whose mtime has not changed
+    # since the last run is not listed again: its files are taken from the
+    # manifest and only its subdirectories are visited. Editing a file in
+    # place does not touch the directory mtime, so sizes/mtimes of reused
+    # entries can be stale; the embedding cache re-checks them anyway.
+    def __init__(self, extensions=IMAGE_EXTENSIONS, num_workers=1, manifest_path=None):
+        self.extensions = tuple(ext.lower() for ext in extensions)
+        self.num_workers = max(1, num_workers)
+        self.manifest_path = manifest_path
+        self.stats = {}
+        self.changes = {"added": [], "removed": [], "modified": []}
+
+    def load_manifest(self, root) -> Optional[Dict]:
+        if not self.manifest_path or not os.path.exists(self.manifest_path):
+            return None
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable discovery manifest {self.manifest_path}: {e}")
+            return None
+        if manifest.get("version") != MANIFEST_VERSION or manifest.get("root") != os.path.abspath(root) \
+                or manifest.get("extensions") != list(self.extensions):
+            return None
+        return manifest
+
+    def save_manifest(self, manifest):
+        directory = os.path.dirname(os.path.abspath(self.manifest_path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, separators=(',', ':'))
+        os.replace(tmp_path, self.manifest_path)
+
+    def discover(self, root) -> List[str]:
+        previous = self.load_manifest(root)
+        previous_dirs = previous["dirs"] if previous else {}
+        trusted_before = previous["scanned_at_ns"] - MTIME_SAFETY_NS if previous else 0
+        scanned_at_ns = time.time_ns()
+
+        directories = {}
+        reused = 0
+
+        def visit(rel_path):
+            path = root if rel_path == '.' else os.path.join(root, rel_path)
+            cached = previous_dirs.get(rel_path)
+            if cached is not None and cached["mtime_ns"] < trusted_before:
+                stat = os.stat(path)
+                if stat.st_mtime_ns == cached["mtime_ns"]:
+                    return rel_path, cached, (stat.st_dev, stat.st_ino), True
+            listing, key = _scan_directory(path, self.extensions)
+            return rel_path, listing, key, False
+
+        def child(rel_path, name):
+            return name if rel_path == '.' else os.path.join(rel_path, name)
+
+        with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+            pending = {executor.submit(visit, '.'): frozenset()}
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    ancestors = pending.pop(future)
+                    try:
+                        rel_path, listing, key, was_reused = future.result()
+                    except OSError:
+                        continue
+                    # Symlinked directories are followed as glob does; a
+                    # directory that is its own ancestor is a loop.
+                    if key in ancestors:
+                        continue
+                    directories[rel_path] = listing
+                    reused += was_reused
+                    for name in listing["dirs"]:
+                        pending[executor.submit(visit, child(rel_path, name))] = ancestors | {key}
+
+        image_paths = []
+        current_files = {}
+        for rel_path, listing in directories.items():
+            path = root if rel_path == '.' else os.path.join(root, rel_path)
+            for name, size, mtime_ns in listing["files"]:
+                file_path = os.path.join(path, name)
+                image_paths.append(file_path)
+                current_files[file_path] = (size, mtime_ns)
+        image_paths.sort()
+
+        self._diff(root, previous_dirs, current_files)
+        self.stats = {"directories": len(directories), "reused_directories": reused,
+                      "files": len(image_paths), "had_manifest": previous is not None}
+
+        if self.manifest_path:
+            self.save_manifest({
+                "version": MANIFEST_VERSION,
+                "root": os.path.abspath(root),
+                "extensions": list(self.extensions),
+                "scanned_at_ns": scanned_at_ns,
+                "dirs": directories,
+            })
+
+        return image_paths
+
+    def _diff(self, root, previous_dirs, current_files):
+        previous_files = {}
+        for rel_path, listing in previous_dirs.items():
+            path = root if rel_path == '.' else os.path.join(root, rel_path)
+            for name, size, mtime_ns in listing["files"]:
+                previous_files[os.path.join(path, name)] = (size, mtime_ns)
+
+        if not previous_dirs:
+            self.changes = {"added": [], "removed": [], "modified": []}
+            return
+        self.changes = {
+            "added": sorted(set(current_files) - set(previous_files)),
+            "removed": sorted(set(previous_files) - set(current_files)),
+            "modified": sorted(p for p, meta in current_files.items()
+                               if p in previous_files and previous_files[p] != meta),
+        }
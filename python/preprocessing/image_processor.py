@@ -1,29 +1,108 @@
-import cv2
+import time
+import calendar
 import numpy as np
 from PIL import Image
-import tensorflow as tf
+from profiling.instrumentation import NULL_INSTRUMENTATION
+
+EXIF_IFD = 0x8769
+GPS_IFD = 0x8825
+DATETIME_ORIGINAL = 36867
+DATETIME_DIGITIZED = 36868
+DATETIME = 306
+
+# Quality score = weighted sum of per-image terms in [0, 1]. The reference
+# values map typical "good" photos (at model input resolution) to ~1.
+QUALITY_WEIGHTS = {'sharpness': 0.4, 'edges': 0.2, 'exposure': 0.25, 'clipping': 0.15}
+SHARPNESS_REFERENCE = 2000.0
+EDGE_THRESHOLD = 20.0
+EDGE_DENSITY_REFERENCE = 0.15
+CLIPPED_REFERENCE = 0.25
+LUMA = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+def image_quality_metrics(batch):
+    # Cheap no-reference metrics over a decoded (n, h, w, 3) batch in
+    # [0, 255], vectorized across the batch:
+    #   sharpness        - variance of the 4-neighbour Laplacian
+    #   edge_density     - share of pixels with a strong gradient; blurred or
+    #                      featureless frames have few
+    #   brightness       - mean luma
+    #   clipped_fraction - share of crushed or blown-out pixels
+    gray = np.asarray(batch, dtype=np.float32) @ LUMA
+    center = gray[:, 1:-1, 1:-1]
+    laplacian = (gray[:, :-2, 1:-1] + gray[:, 2:, 1:-1] +
+                 gray[:, 1:-1, :-2] + gray[:, 1:-1, 2:] - 4 * center)
+    gx = gray[:, 1:-1, 2:] - gray[:, 1:-1, :-2]
+    gy = gray[:, 2:, 1:-1] - gray[:, :-2, 1:-1]
+    return {
+        'sharpness': laplacian.var(axis=(1, 2)),
+        'edge_density': (gx * gx + gy * gy > (2 * EDGE_THRESHOLD) ** 2).mean(axis=(1, 2)),
+        'brightness': gray.mean(axis=(1, 2)),
+        'clipped_fraction': ((gray <= 5) | (gray >= 250)).mean(axis=(1, 2)),
+    }
+
+
+def image_quality_scores(batch):
+    metrics = image_quality_metrics(batch)
+    terms = {
+        'sharpness': np.clip(np.log1p(metrics['sharpness']) / np.log1p(SHARPNESS_REFERENCE), 0, 1),
+        'edges': np.clip(metrics['edge_density'] / EDGE_DENSITY_REFERENCE, 0, 1),
+        'exposure': 1 - np.abs(metrics['brightness'] - 127.5) / 127.5,
+        'clipping': 1 - np.clip(metrics['clipped_fraction'] / CLIPPED_REFERENCE, 0, 1),
+    }
+    return sum(QUALITY_WEIGHTS[name] * term for name, term in terms.items()).astype(np.float32)
 
 class ImageProcessor:
-    def __init__(self, target_size=(224, 224)):
+    def __init__(self, target_size=(224, 224), fast_decode=False, dtype=np.float32, instrumentation=None):
         self.target_size = target_size
+        self.fast_decode = fast_decode
+        self.dtype = np.dtype(dtype)
+        self.instrumentation = instrumentation or NULL_INSTRUMENTATION
     
-    def load_and_preprocess_image(self, image_path):
-        try:
-            image = Image.open(image_path)
+    def open_image(self, image_path):
+        with Image.open(image_path) as image:
+            if self.fast_decode:
+                # JPEG only: let libjpeg downscale by 1/2, 1/4 or 1/8 in the DCT
+                # domain while staying at least as large as the target.
+                image.draft('RGB', self.target_size)
+            
             if image.mode != 'RGB':
-                image = image.convert('RGB')
+                return image.convert('RGB')
             
+            image.load()
+            return image
+    
+    def preprocess_image(self, image):
+        if self.fast_decode:
+            image = image.resize(self.target_size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+        else:
             image = image.resize(self.target_size, Image.Resampling.LANCZOS)
-            
-            image_array = np.array(image, dtype=np.float32)
+        
+        return np.asarray(image, dtype=self.dtype)
+    
+    def decode_image(self, image_path):
+        return self.preprocess_image(self.open_image(image_path))
+    
+    def load_and_preprocess_image(self, image_path):
+        start_time = time.perf_counter()
+        try:
+            image_array = self.decode_image(image_path)
+            self.instrumentation.record_latency('decode', time.perf_counter() - start_time)
             
             image_array = np.expand_dims(image_array, axis=0)
             
             return image_array
         except Exception as e:
             print(f"Error processing {image_path}: {e}")
+            self.instrumentation.record_failure(image_path, e)
             return None
     
+    def iter_images(self, image_paths):
+        for path in image_paths:
+            img = self.load_and_preprocess_image(path)
+            if img is not None:
+                yield path, img
+    
     def preprocess_batch(self, image_paths):
         processed_images = []
         valid_paths = []
@@ -39,6 +118,12 @@ class ImageProcessor:
         else:
             return np.array([]), []
     
+    def quality_scores(self, batch):
+        # Runs on pixels that were already decoded for the model, so picking
+        # representatives costs no extra I/O.
+        with self.instrumentation.stage('quality', batch_size=len(batch)):
+            return image_quality_scores(batch)
+    
     def get_image_info(self, image_path):
         try:
             with Image.open(image_path) as img:
@@ -46,7 +131,57 @@ class ImageProcessor:
                     'path': image_path,
                     'size': img.size,
                     'mode': img.mode,
-                    'format': img.format
+                    'format': img.format,
+                    **self._capture_metadata(img)
                 }
         except Exception as e:
-            return {'path': image_path, 'error': str(e)}
\ No newline at end of file
+            return {'path': image_path, 'error': str(e)}
+    
+    def read_capture_metadata(self, image_path):
+        # Header-only read: Image.open parses EXIF without decoding pixels.
+        try:
+            with Image.open(image_path) as img:
+                return self._capture_metadata(img)
+        except Exception:
+            return {'capture_time': None, 'gps': None}
+    
+    def _capture_metadata(self, img):
+        try:
+            exif = img.getexif()
+        except Exception:
+            return {'capture_time': None, 'gps': None}
+        
+        capture_time = None
+        exif_ifd = exif.get_ifd(EXIF_IFD)
+        for value in (exif_ifd.get(DATETIME_ORIGINAL), exif_ifd.get(DATETIME_DIGITIZED), exif.get(DATETIME)):
+            capture_time = self._parse_exif_datetime(value)
+            if capture_time is not None:
+                break
+        
+        return {'capture_time': capture_time, 'gps': self._parse_gps(exif.get_ifd(GPS_IFD))}
+    
+    def _parse_exif_datetime(self, value):
+        # EXIF stores local time as "YYYY:MM:DD HH:MM:SS" without a zone; it is
+        # mapped to seconds as if UTC, which preserves differences between photos.
+        if not value:
+            return None
+        try:
+            parsed = time.strptime(str(value).strip('\x00 ')[:19], '%Y:%m:%d %H:%M:%S')
+            return float(calendar.timegm(parsed))
+        except ValueError:
+            return None
+    
+    def _parse_gps(self, gps):
+        try:
+            def degrees(values, ref, negative):
+                d, m, s = (float(v) for v in values)
+                value = d + m / 60.0 + s / 3600.0
+                return -value if ref in negative else value
+            
+            lat = degrees(gps[2], gps.get(1), ('S', b'S'))
+            lon = degrees(gps[4], gps.get(3), ('W', b'W'))
+            if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+                return None
+            return (lat, lon)
+        except (KeyError, TypeError, ValueError, ZeroDivisionError):
+            return None
@@ -0,0 +1,148 @@
+import os
+import time
+import queue
+import multiprocessing as mp
+import numpy as np
+from preprocessing.image_processor import ImageProcessor
+from profiling.instrumentation import NULL_INSTRUMENTATION
+
+_worker_state = {}
+
+
+def _init_worker(shared_buffer, buffer_shape, dtype, target_size, fast_decode):
+    _worker_state['buffer'] = np.frombuffer(shared_buffer, dtype=dtype).reshape(buffer_shape)
+    _worker_state['processor'] = ImageProcessor(target_size=target_size,
+                                                fast_decode=fast_decode,
+                                                dtype=dtype)
+
+
+def _decode_into_slot(task):
+    seq, slot, path = task
+    start_time = time.perf_counter()
+    try:
+        _worker_state['buffer'][slot] = _worker_state['processor'].decode_image(path)
+        return seq, slot, path, None, time.perf_counter() - start_time
+    except Exception as e:
+        return seq, slot, path, f"{type(e).__name__}: {e}", time.perf_counter() - start_time
+
+
+class ParallelImageProcessor:
+    # Workers decode straight into a shared ring of image slots, so only the
+    # (seq, slot, path, error, seconds) tuple crosses the process boundary.
+    def __init__(self, target_size=(224, 224), num_workers=None, num_slots=None,
+                 fast_decode=False, dtype=np.float32, start_method=None, instrumentation=None):
+        self.target_size = target_size
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.num_slots = num_slots or self.num_workers * 4
+        self.fast_decode = fast_decode
+        self.dtype = np.dtype(dtype)
+        self.start_method = start_method
+        self.instrumentation = instrumentation or NULL_INSTRUMENTATION
+        self._pool = None
+        self._buffer = None
+
+    def start(self):
+        if self._pool is None:
+            ctx = mp.get_context(self.start_method)
+            buffer_shape = (self.num_slots, self.target_size[1], self.target_size[0], 3)
+            nbytes = int(np.prod(buffer_shape)) * self.dtype.itemsize
+            shared_buffer = ctx.RawArray('b', nbytes)
+            self._buffer = np.frombuffer(shared_buffer, dtype=self.dtype).reshape(buffer_shape)
+            self._pool = ctx.Pool(
+                self.num_workers,
+                initializer=_init_worker,
+                initargs=(shared_buffer, buffer_shape, self.dtype.str, self.target_size,
+                          self.fast_decode)
+            )
+        return self._pool
+
+    def imap(self, image_paths, ordered=True):
+        # Yields (path, image, error). A successful image is a view into the
+        # shared buffer and stays valid until the next item is requested.
+        pool = self.start()
+        completed = queue.Queue()
+        free_slots = list(range(self.num_slots))
+        tasks = enumerate(image_paths)
+        pending = {}
+        next_seq = 0
+        in_flight = 0
+        exhausted = False
+
+        def submit():
+            nonlocal in_flight, exhausted
+            while free_slots and not exhausted:
+                try:
+                    seq, path = next(tasks)
+                except StopIteration:
+                    exhausted = True
+                    break
+                slot = free_slots.pop()
+                pool.apply_async(_decode_into_slot, ((seq, slot, path),),
+                                 callback=completed.put, error_callback=completed.put)
+                in_flight += 1
+
+        submit()
+        try:
+            while in_flight:
+                result = completed.get()
+                in_flight -= 1
+                if isinstance(result, BaseException):
+                    raise result
+
+                if ordered:
+                    pending[result[0]] = result
+                    ready = []
+                    while next_seq in pending:
+                        ready.append(pending.pop(next_seq))
+                        next_seq += 1
+                else:
+                    ready = [result]
+
+                for _, slot, path, error, seconds in ready:
+                    if error is None:
+                        self.instrumentation.record_latency('decode', seconds)
+                    else:
+                        self.instrumentation.record_failure(path, error)
+                    image = self._buffer[slot] if error is None else None
+                    yield path, image, error
+                    free_slots.append(slot)
+                submit()
+        finally:
+            # A consumer that stops early must not leave workers writing into
+            # slots the next imap call hands out again.
+            while in_flight:
+                completed.get()
+                in_flight -= 1
+
+    def iter_images(self, image_paths, ordered=True):
+        for path, image, error in self.imap(image_paths, ordered=ordered):
+            if error is not None:
+                print(f"Error processing {path}: {error}")
+                continue
+            yield path, image[np.newaxis]
+
+    def preprocess_batch(self, image_paths):
+        processed_images = []
+        valid_paths = []
+
+        for path, image in self.iter_images(image_paths):
+            processed_images.append(image.copy())
+            valid_paths.append(path)
+
+        if processed_images:
+            return np.vstack(processed_images), valid_paths
+        else:
+            return np.array([]), []
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+            self._buffer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,107 @@
+import os
+import numpy as np
+from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+# Beyond this the multi-index chunks get so narrow that most hashes share a
+# bucket and grouping degrades to comparing every pair.
+MAX_HASH_DISTANCE = 16
+
+
+def _dct_matrix(n):
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+def _pack_bits(bits):
+    return int(np.packbits(bits.ravel()).view('>u8')[0])
+
+
+def popcount(values):
+    values = np.asarray(values, dtype=np.uint64)
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values).astype(np.int64)
+    return np.unpackbits(values.reshape(-1, 1).view(np.uint8), axis=1).sum(axis=1)
+
+
+class PerceptualHasher:
+    # 64-bit dHash / pHash computed from a tiny decode. JPEGs are decoded at
+    # 1/8 scale through draft(), so hashing costs a fraction of a full decode.
+    def __init__(self, method='dhash', num_workers=None):
+        if method not in ('dhash', 'phash'):
+            raise ValueError("method must be 'dhash' or 'phash'")
+        self.method = method
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self._dct = _dct_matrix(32)
+    
+    def hash_image(self, image_path):
+        sample_size = (9, 8) if self.method == 'dhash' else (32, 32)
+        with Image.open(image_path) as image:
+            image.draft('L', (sample_size[0] * 4, sample_size[1] * 4))
+            pixels = np.asarray(image.convert('L').resize(sample_size, Image.Resampling.BOX), dtype=np.float32)
+        
+        if self.method == 'dhash':
+            return _pack_bits(pixels[:, 1:] > pixels[:, :-1])
+        
+        coefficients = (self._dct @ pixels @ self._dct.T)[:8, :8]
+        return _pack_bits(coefficients > np.median(coefficients.ravel()[1:]))
+    
+    def _safe_hash(self, image_path):
+        try:
+            return self.hash_image(image_path)
+        except Exception:
+            return None
+    
+    def hash_images(self, image_paths: List[str]):
+        # Returns a list with an int hash per path, or None if it can't be read.
+        with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+            return list(executor.map(self._safe_hash, image_paths))
+
+
+def group_by_hash(hashes, max_distance=0):
+    # Groups hashes within max_distance bits of a group leader, taking leaders
+    # in input order. Candidates come from multi-index hashing: split the
+    # 64 bits into max_distance + 1 chunks; any two hashes within the distance
+    # must match exactly on at least one chunk. Returns each item's leader
+    # index; leaders and unreadable items (None) map to themselves.
+    n = len(hashes)
+    valid = np.array([h is not None for h in hashes], dtype=bool)
+    values = np.array([h if h is not None else 0 for h in hashes], dtype=np.uint64)
+    leaders = np.arange(n)
+    
+    num_chunks = max_distance + 1
+    bounds = np.linspace(0, 64, num_chunks + 1).astype(int)
+    candidates = {}
+    for c in range(num_chunks):
+        width = bounds[c + 1] - bounds[c]
+        mask = np.uint64((1 << width) - 1)
+        chunks = (values >> np.uint64(bounds[c])) & mask
+        for i in np.nonzero(valid)[0].tolist():
+            candidates.setdefault((c, int(chunks[i])), []).append(i)
+    
+    neighbors = {}
+    for members in candidates.values():
+        if len(members) < 2:
+            continue
+        members = np.array(members)
+        for position, i in enumerate(members[:-1].tolist()):
+            later = members[position + 1:]
+            close = later[popcount(values[later] ^ values[i]) <= max_distance]
+            if len(close):
+                neighbors.setdefault(i, set()).update(close.tolist())
+    
+    assigned = np.zeros(n, dtype=bool)
+    for i in range(n):
+        if assigned[i] or not valid[i]:
+            continue
+        assigned[i] = True
+        for j in sorted(neighbors.get(i, ())):
+            if not assigned[j]:
+                assigned[j] = True
+                leaders[j] = i
+    
+    return leaders
@@ -0,0 +1,182 @@
+import os
+import sys
+import json
+import time
+import threading
+import numpy as np
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class NullInstrumentation:
+    # Default for every component: all recording calls are no-ops.
+    enabled = False
+
+    @contextmanager
+    def stage(self, name, **args):
+        yield
+
+    def record_span(self, name, start, end, category='stage', args=None):
+        pass
+
+    def record_latency(self, name, seconds):
+        pass
+
+    def record_failure(self, path, error, stage='decode'):
+        pass
+
+    def record_batch(self, size, capacity):
+        pass
+
+
+NULL_INSTRUMENTATION = NullInstrumentation()
+
+
+class Instrumentation(NullInstrumentation):
+    # Collects stage timers, per-item latencies, failures and batch occupancy.
+    # Hooks are callables that receive every recorded event as a dict, e.g. to
+    # forward metrics to a log or monitoring system.
+    enabled = True
+
+    def __init__(self, hooks=None, max_trace_events=200000):
+        self.hooks = list(hooks or [])
+        self.max_trace_events = max_trace_events
+        self.stage_totals = {}
+        self.latencies = {}
+        self.failures = []
+        self.batches = []
+        self.trace_events = []
+        self.dropped_trace_events = 0
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def _emit(self, event):
+        for hook in self.hooks:
+            hook(event)
+
+    @contextmanager
+    def stage(self, name, **args):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_span(name, start, time.perf_counter(), args=args or None)
+
+    def record_span(self, name, start, end, category='stage', args=None):
+        with self._lock:
+            total = self.stage_totals.setdefault(name, [0, 0.0])
+            total[0] += 1
+            total[1] += end - start
+            if len(self.trace_events) < self.max_trace_events:
+                event = {
+                    'name': name, 'cat': category, 'ph': 'X',
+                    'ts': (start - self._origin) * 1e6, 'dur': (end - start) * 1e6,
+                    'pid': os.getpid(), 'tid': threading.get_ident()
+                }
+                if args:
+                    event['args'] = args
+                self.trace_events.append(event)
+            else:
+                self.dropped_trace_events += 1
+        self._emit({'type': 'span', 'name': name, 'seconds': end - start, 'args': args})
+
+    def record_latency(self, name, seconds):
+        with self._lock:
+            self.latencies.setdefault(name, []).append(seconds)
+        self._emit({'type': 'latency', 'name': name, 'seconds': seconds})
+
+    def record_failure(self, path, error, stage='decode'):
+        with self._lock:
+            self.failures.append({'path': path, 'error': str(error), 'stage': stage})
+        self._emit({'type': 'failure', 'path': path, 'error': str(error), 'stage': stage})
+
+    def record_batch(self, size, capacity):
+        with self._lock:
+            self.batches.append((size, capacity))
+        self._emit({'type': 'batch', 'size': size, 'capacity': capacity})
+
+    def summary(self):
+        with self._lock:
+            stages = {
+                name: {'count': count, 'total_seconds': total, 'mean_ms': total / count * 1000}
+                for name, (count, total) in self.stage_totals.items()
+            }
+            latencies = {}
+            for name, values in self.latencies.items():
+                ms = np.asarray(values) * 1000
+                counts, _ = np.histogram(ms, bins=[0] + LATENCY_BUCKETS_MS + [np.inf])
+                latencies[name] = {
+                    'count': len(ms),
+                    'mean_ms': float(ms.mean()),
+                    'p50_ms': float(np.percentile(ms, 50)),
+                    'p90_ms': float(np.percentile(ms, 90)),
+                    'p99_ms': float(np.percentile(ms, 99)),
+                    'max_ms': float(ms.max()),
+                    'histogram': {
+                        (f"<{bound}ms" if bound != np.inf else f">={LATENCY_BUCKETS_MS[-1]}ms"): int(count)
+                        for bound, count in zip(LATENCY_BUCKETS_MS + [np.inf], counts)
+                    }
+                }
+            sizes = np.array([size for size, _ in self.batches], dtype=np.float64)
+            capacities = np.array([capacity for _, capacity in self.batches], dtype=np.float64)
+            batches = {
+                'count': len(self.batches),
+                'mean_size': float(sizes.mean()) if len(sizes) else 0.0,
+                'occupancy': float(sizes.sum() / capacities.sum()) if len(capacities) else 0.0
+            }
+            return {
+                'stages': stages,
+                'latencies': latencies,
+                'batches': batches,
+                'failures': {'count': len(self.failures), 'items': list(self.failures)},
+                'peak_rss_mb': peak_rss_mb()
+            }
+
+    def summary_table(self):
+        summary = self.summary()
+        lines = [f"{'stage':<28}{'count':>8}{'total s':>10}{'mean ms':>10}"]
+        for name, stage in sorted(summary['stages'].items(), key=lambda item: -item[1]['total_seconds']):
+            lines.append(f"{name:<28}{stage['count']:>8}{stage['total_seconds']:>10.3f}{stage['mean_ms']:>10.2f}")
+        if summary['latencies']:
+            lines.append("")
+            lines.append(f"{'latency':<28}{'count':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+            for name, latency in sorted(summary['latencies'].items()):
+                lines.append(f"{name:<28}{latency['count']:>8}{latency['p50_ms']:>10.2f}"
+                             f"{latency['p90_ms']:>10.2f}{latency['p99_ms']:>10.2f}{latency['max_ms']:>10.2f}")
+        lines.append("")
+        lines.append(f"Batches: {summary['batches']['count']} "
+                     f"(mean size {summary['batches']['mean_size']:.1f}, "
+                     f"occupancy {summary['batches']['occupancy']:.0%})")
+        lines.append(f"Failures: {summary['failures']['count']}")
+        if summary['peak_rss_mb'] is not None:
+            lines.append(f"Peak RSS: {summary['peak_rss_mb']:.1f} MB")
+        return "\n".join(lines)
+
+    def save_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def save_chrome_trace(self, path):
+        # Load in chrome://tracing or https://ui.perfetto.dev
+        with self._lock:
+            events = list(self.trace_events)
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms',
+                       'otherData': {'dropped_events': self.dropped_trace_events}}, f)
@@ -0,0 +1,230 @@
+import os
+import json
+import shutil
+import numpy as np
+from typing import Any, Dict, Iterator
+
+# Columnar results directory. Every path is stored once in a UTF-8 blob with
+# an offsets table; pairs, clusters and recommendations refer to paths by
+# index, scores are float32, and every array is an .npy file that loads
+# memory-mapped. The JSON exporter rebuilds the process_photos layout.
+#
+#   meta.json                 version, scalar fields, key order
+#   path_blob.bin             concatenated UTF-8 paths
+#   path_offsets.npy          int64 [num_paths + 1]
+#   pair_index.npy            int32/int64 [num_pairs, 2] path ids
+#   pair_scores.npy           float32 [num_pairs]
+#   cluster_offsets.npy       int64 [num_clusters + 1] into cluster_members
+#   cluster_members.npy       path ids, cluster by cluster
+#   cluster_representatives.npy  path id per cluster
+#   recommended.npy           path ids
+#   similarity_matrix.npy     float32 [n, n] (only when exported)
+
+RESULTS_FORMAT_VERSION = 1
+STREAMED_FIELDS = ('clusters', 'duplicate_pairs', 'recommended_photos', 'similarity_matrix')
+
+
+def _index_dtype(num_paths):
+    return np.int32 if num_paths < 2 ** 31 else np.int64
+
+
+def _encode(path):
+    return path.encode('utf-8', 'surrogateescape')
+
+
+def save_results(results: Dict[str, Any], results_dir: str):
+    # Path ids are the result indices ('indices', 'index1'/'index2'), which
+    # clusters cover completely; recommended photos not in any cluster are
+    # appended to the table.
+    path_ids = {}
+    table = []
+    for cluster in results.get('clusters', []):
+        for index, path in zip(cluster['indices'], cluster['paths']):
+            path_ids[path] = index
+    if path_ids:
+        table = [None] * (max(path_ids.values()) + 1)
+        for path, index in path_ids.items():
+            table[index] = path
+    for path in results.get('recommended_photos', []):
+        if path not in path_ids:
+            path_ids[path] = len(table)
+            table.append(path)
+    table = [path if path is not None else '' for path in table]
+    dtype = _index_dtype(len(table))
+
+    tmp_dir = results_dir.rstrip(os.sep) + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    encoded = [_encode(path) for path in table]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(blob) for blob in encoded])
+    with open(os.path.join(tmp_dir, 'path_blob.bin'), 'wb') as f:
+        f.write(b''.join(encoded))
+    np.save(os.path.join(tmp_dir, 'path_offsets.npy'), offsets)
+
+    pairs = results.get('duplicate_pairs', [])
+    np.save(os.path.join(tmp_dir, 'pair_index.npy'),
+            np.array([(p['index1'], p['index2']) for p in pairs], dtype=dtype).reshape(-1, 2))
+    np.save(os.path.join(tmp_dir, 'pair_scores.npy'),
+            np.array([p['similarity'] for p in pairs], dtype=np.float32))
+
+    clusters = results.get('clusters', [])
+    cluster_offsets = np.zeros(len(clusters) + 1, dtype=np.int64)
+    cluster_offsets[1:] = np.cumsum([len(c['indices']) for c in clusters])
+    members = [index for c in clusters for index in c['indices']]
+    np.save(os.path.join(tmp_dir, 'cluster_offsets.npy'), cluster_offsets)
+    np.save(os.path.join(tmp_dir, 'cluster_members.npy'), np.array(members, dtype=dtype))
+    np.save(os.path.join(tmp_dir, 'cluster_representatives.npy'),
+            np.array([path_ids[c['representative']] for c in clusters], dtype=dtype))
+    np.save(os.path.join(tmp_dir, 'recommended.npy'),
+            np.array([path_ids[p] for p in results.get('recommended_photos', [])], dtype=dtype))
+
+    if results.get('similarity_matrix') is not None:
+        np.save(os.path.join(tmp_dir, 'similarity_matrix.npy'),
+                np.asarray(results['similarity_matrix'], dtype=np.float32))
+
+    meta = {
+        'version': RESULTS_FORMAT_VERSION,
+        'keys': list(results.keys()),
+        'fields': {k: v for k, v in results.items() if k not in STREAMED_FIELDS},
+        'num_paths': len(table),
+        'num_pairs': len(pairs),
+        'num_clusters': len(clusters)
+    }
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+    shutil.rmtree(results_dir, ignore_errors=True)
+    os.replace(tmp_dir, results_dir)
+
+
+class LazyResults:
+    # Memory-mapped view of a results directory. Arrays are mapped, not
+    # read; paths are decoded only when asked for.
+    def __init__(self, results_dir: str):
+        self.results_dir = results_dir
+        with open(os.path.join(results_dir, 'meta.json')) as f:
+            self.meta = json.load(f)
+        if self.meta.get('version') != RESULTS_FORMAT_VERSION:
+            raise ValueError(f"Unsupported results format version {self.meta.get('version')}")
+
+        self._path_offsets = self._load('path_offsets.npy')
+        blob_path = os.path.join(results_dir, 'path_blob.bin')
+        self._path_blob = (np.memmap(blob_path, dtype=np.uint8, mode='r')
+                           if os.path.getsize(blob_path) else np.zeros(0, dtype=np.uint8))
+        self.pair_index = self._load('pair_index.npy')
+        self.pair_scores = self._load('pair_scores.npy')
+        self.cluster_offsets = self._load('cluster_offsets.npy')
+        self.cluster_members = self._load('cluster_members.npy')
+        self.cluster_representatives = self._load('cluster_representatives.npy')
+        self.recommended = self._load('recommended.npy')
+
+    def _load(self, name):
+        return np.load(os.path.join(self.results_dir, name), mmap_mode='r')
+
+    def __getitem__(self, key):
+        return self.meta['fields'][key]
+
+    def keys(self):
+        return list(self.meta['keys'])
+
+    @property
+    def num_paths(self):
+        return self.meta['num_paths']
+
+    @property
+    def num_pairs(self):
+        return self.meta['num_pairs']
+
+    @property
+    def num_clusters(self):
+        return self.meta['num_clusters']
+
+    def path(self, index: int) -> str:
+        start, end = self._path_offsets[index], self._path_offsets[index + 1]
+        return self._path_blob[start:end].tobytes().decode('utf-8', 'surrogateescape')
+
+    def paths(self) -> Iterator[str]:
+        for index in range(self.num_paths):
+            yield self.path(index)
+
+    @property
+    def similarity_matrix(self):
+        path = os.path.join(self.results_dir, 'similarity_matrix.npy')
+        return np.load(path, mmap_mode='r') if os.path.exists(path) else None
+
+    def cluster(self, index: int) -> Dict[str, Any]:
+        members = self.cluster_members[self.cluster_offsets[index]:self.cluster_offsets[index + 1]].tolist()
+        return {
+            'indices': members,
+            'paths': [self.path(i) for i in members],
+            'representative': self.path(int(self.cluster_representatives[index]))
+        }
+
+    def clusters(self) -> Iterator[Dict[str, Any]]:
+        for index in range(self.num_clusters):
+            yield self.cluster(index)
+
+    def duplicate_pairs(self, chunk_size: int = 65536) -> Iterator[Dict[str, Any]]:
+        for start in range(0, self.num_pairs, chunk_size):
+            index = self.pair_index[start:start + chunk_size].tolist()
+            scores = self.pair_scores[start:start + chunk_size].tolist()
+            for (i, j), score in zip(index, scores):
+                yield {'image1': self.path(i), 'image2': self.path(j),
+                       'similarity': score, 'index1': i, 'index2': j}
+
+    def recommended_photos(self) -> Iterator[str]:
+        for index in self.recommended.tolist():
+            yield self.path(index)
+
+    def to_dict(self) -> Dict[str, Any]:
+        # Fully materialized, JSON-ready results (the similarity matrix as lists).
+        results = {}
+        for key in self.keys():
+            if key == 'clusters':
+                results[key] = list(self.clusters())
+            elif key == 'duplicate_pairs':
+                results[key] = list(self.duplicate_pairs())
+            elif key == 'recommended_photos':
+                results[key] = list(self.recommended_photos())
+            elif key == 'similarity_matrix':
+                results[key] = np.asarray(self.similarity_matrix).tolist()
+            else:
+                results[key] = self.meta['fields'][key]
+        return results
+
+
+def load_results(results_dir: str) -> LazyResults:
+    return LazyResults(results_dir)
+
+
+def _write_array(f, items):
+    f.write('[')
+    for position, item in enumerate(items):
+        if position:
+            f.write(', ')
+        f.write(json.dumps(item))
+    f.write(']')
+
+
+def export_json(results: LazyResults, output_path: str):
+    # Streams the results as JSON one record at a time; memory stays flat
+    # however many pairs and clusters there are.
+    with open(output_path, 'w') as f:
+        f.write('{')
+        for position, key in enumerate(results.keys()):
+            if position:
+                f.write(', ')
+            f.write(json.dumps(key) + ': ')
+            if key == 'clusters':
+                _write_array(f, results.clusters())
+            elif key == 'duplicate_pairs':
+                _write_array(f, results.duplicate_pairs())
+            elif key == 'recommended_photos':
+                _write_array(f, results.recommended_photos())
+            elif key == 'similarity_matrix':
+                _write_array(f, (row.tolist() for row in results.similarity_matrix))
+            else:
+                f.write(json.dumps(results[key]))
+        f.write('}')
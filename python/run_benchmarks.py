@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import argparse
+from photo_curator import PhotoCurator
+from benchmarks.curation_benchmark import run_benchmarks, compare_to_baseline
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end curation benchmark on synthetic photo libraries')
+    parser.add_argument('--scales', type=int, nargs='+', default=[100, 500, 1000],
+                      help='Library sizes to benchmark')
+    parser.add_argument('--resolution', type=int, nargs=2, default=[1024, 768], metavar=('WIDTH', 'HEIGHT'),
+                      help='Resolution of generated photos')
+    parser.add_argument('--duplicate_rate', type=float, default=0.3,
+                      help='Fraction of photos that are near-duplicates of the previous scene')
+    parser.add_argument('--seed', type=int, default=0,
+                      help='Random seed for library generation')
+    parser.add_argument('--library_root', type=str, default='benchmark_data',
+                      help='Where generated libraries are kept between runs')
+    parser.add_argument('--output', type=str, default='benchmark_results.json',
+                      help='Path of the JSON report')
+    parser.add_argument('--baseline', type=str, default=None,
+                      help='Compare against a stored report and fail on regressions')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                      help='Allowed throughput drop relative to the baseline')
+    parser.add_argument('--similarity_threshold', type=float, default=0.85,
+                      help='Similarity threshold for duplicate detection')
+    parser.add_argument('--batch_size', type=int, default=32,
+                      help='Number of images per model inference batch')
+    parser.add_argument('--fast_decode', action='store_true',
+                      help='Benchmark the reduced-resolution decode path')
+    
+    args = parser.parse_args()
+    
+    curator = PhotoCurator(similarity_threshold=args.similarity_threshold,
+                           batch_size=args.batch_size,
+                           fast_decode=args.fast_decode)
+    
+    try:
+        report = run_benchmarks(curator, args.scales, args.library_root,
+                                resolution=tuple(args.resolution),
+                                duplicate_rate=args.duplicate_rate,
+                                seed=args.seed)
+    finally:
+        curator.close()
+    
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        comparison = compare_to_baseline(report, baseline, tolerance=args.tolerance)
+        report['comparison'] = comparison
+        
+        print("\n" + "="*60)
+        print(f"COMPARISON AGAINST {os.path.basename(args.baseline)}")
+        print("="*60)
+        for row in comparison['comparisons']:
+            marker = "REGRESSION" if row['regressed'] else ""
+            print(f"  {row['num_images']:>7} {row['stage']:<14} "
+                  f"{row['baseline_images_per_second']:>10.1f} -> {row['images_per_second']:>10.1f} "
+                  f"({row['ratio']:.2f}x) {marker}")
+        if comparison['regressions']:
+            print(f"\n{len(comparison['regressions'])} stage(s) regressed by more than {args.tolerance:.0%}")
+            exit_code = 1
+        else:
+            print("\nNo regressions")
+    
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nBenchmark report saved to: {args.output}")
+    
+    return exit_code
+
+if __name__ == "__main__":
+    raise SystemExit(main())
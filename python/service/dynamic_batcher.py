@@ -0,0 +1,211 @@
+import time
+import threading
+import collections
+import numpy as np
+from concurrent.futures import Future
+
+# Coalesces concurrent embedding requests into model batches. A batch is
+# sent to the model once it holds max_batch_size images or the oldest
+# request has waited max_latency_ms, whichever comes first. The queue is
+# bounded in images; callers either get QueueFull (to shed load) or block.
+
+METRICS_WINDOW = 10000
+
+
+class QueueFull(Exception):
+    pass
+
+
+class _Request:
+    __slots__ = ('images', 'future', 'enqueued', 'results', 'remaining', 'offset')
+
+    def __init__(self, images):
+        self.images = images
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+        self.results = []
+        self.remaining = len(images)
+        self.offset = 0
+
+
+class ServiceMetrics:
+    # Counters since start plus latency percentiles over the most recent
+    # METRICS_WINDOW observations, so memory stays flat in a resident process.
+    def __init__(self):
+        self.started = time.time()
+        self.counters = collections.Counter()
+        self.batch_sizes = collections.deque(maxlen=METRICS_WINDOW)
+        self.latencies = collections.defaultdict(lambda: collections.deque(maxlen=METRICS_WINDOW))
+        self._lock = threading.Lock()
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def record_latency(self, name, seconds):
+        with self._lock:
+            self.latencies[name].append(seconds)
+
+    def record_batch(self, size):
+        with self._lock:
+            self.batch_sizes.append(size)
+
+    def snapshot(self, **gauges):
+        with self._lock:
+            uptime = time.time() - self.started
+            latencies = {}
+            for name, values in self.latencies.items():
+                ms = np.asarray(values) * 1000
+                latencies[name] = {
+                    'count': len(ms),
+                    'mean_ms': float(ms.mean()),
+                    'p50_ms': float(np.percentile(ms, 50)),
+                    'p95_ms': float(np.percentile(ms, 95)),
+                    'p99_ms': float(np.percentile(ms, 99)),
+                    'max_ms': float(ms.max())
+                }
+            sizes = np.asarray(self.batch_sizes, dtype=np.float64)
+            return {
+                'uptime_seconds': uptime,
+                'counters': dict(self.counters),
+                'images_per_second': self.counters['images'] / uptime if uptime > 0 else 0.0,
+                'mean_batch_size': float(sizes.mean()) if len(sizes) else 0.0,
+                'latencies': latencies,
+                **gauges
+            }
+
+
+class DynamicBatcher:
+    def __init__(self, model, max_batch_size=32, max_latency_ms=5.0, max_queue_images=1024, metrics=None):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency_ms / 1000.0
+        self.max_queue_images = max_queue_images
+        self.metrics = metrics or ServiceMetrics()
+
+        self._queue = collections.deque()
+        self._queued_images = 0
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name='dynamic-batcher', daemon=True)
+        self._thread.start()
+
+    @property
+    def queued_images(self):
+        return self._queued_images
+
+    def submit(self, images, block=False, timeout=None) -> Future:
+        # Returns a Future with the embeddings of `images` in order.
+        images = np.asarray(images)
+        request = _Request(images)
+        if len(images) == 0:
+            request.future.set_result(np.zeros((0, self.model.embedding_dim), dtype=np.float32))
+            return request.future
+
+        with self._condition:
+            # A request bigger than the whole queue is admitted into an empty
+            # queue so it can never be starved.
+            def has_room():
+                return self._queued_images == 0 or self._queued_images + len(images) <= self.max_queue_images
+
+            if not has_room():
+                if not block:
+                    self.metrics.increment('rejected_requests')
+                    raise QueueFull(f"{self._queued_images} images already queued")
+                if not self._condition.wait_for(lambda: has_room() or self._stopped, timeout):
+                    self.metrics.increment('rejected_requests')
+                    raise QueueFull("Timed out waiting for queue space")
+            if self._stopped:
+                raise RuntimeError("Batcher has been stopped")
+            self._queue.append(request)
+            self._queued_images += len(images)
+            self._condition.notify_all()
+        self.metrics.increment('requests')
+        return request.future
+
+    def embed(self, images, timeout=None):
+        # Blocking helper for callers already admitted (e.g. a curation job):
+        # waits for queue space instead of failing.
+        return self.submit(images, block=True, timeout=timeout).result()
+
+    def _take_batch(self):
+        # Called with the condition held once the queue is non-empty. Takes
+        # images from the front of the queue; a large request may be split
+        # across consecutive batches.
+        parts = []
+        size = 0
+        while self._queue and size < self.max_batch_size:
+            request = self._queue[0]
+            count = min(len(request.images) - request.offset, self.max_batch_size - size)
+            parts.append((request, request.offset, count))
+            request.offset += count
+            size += count
+            if request.offset == len(request.images):
+                self._queue.popleft()
+        self._queued_images -= size
+        self._condition.notify_all()
+        return parts, size
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._queue or self._stopped)
+                if self._stopped and not self._queue:
+                    return
+                # Linger until the batch fills or the oldest request's
+                # deadline passes.
+                deadline = self._queue[0].enqueued + self.max_latency
+                while self._queued_images < self.max_batch_size and not self._stopped:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                parts, size = self._take_batch()
+
+            batch = np.concatenate([request.images[offset:offset + count] for request, offset, count in parts])
+            start_time = time.perf_counter()
+            for request, _, _ in parts:
+                self.metrics.record_latency('queue_wait', start_time - request.enqueued)
+            try:
+                embeddings = np.asarray(self.model.get_embeddings_batch(batch))
+            except Exception as e:
+                for request, _, _ in parts:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+                self.metrics.increment('failed_batches')
+                continue
+            end_time = time.perf_counter()
+            self.metrics.record_latency('inference', end_time - start_time)
+            self.metrics.record_batch(size)
+            self.metrics.increment('batches')
+            self.metrics.increment('images', size)
+
+            position = 0
+            for request, offset, count in parts:
+                request.results.append(embeddings[position:position + count])
+                position += count
+                request.remaining -= count
+                if request.remaining == 0 and not request.future.done():
+                    self.metrics.record_latency('request', end_time - request.enqueued)
+                    request.future.set_result(np.concatenate(request.results))
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        self._thread.join()
+
+
+class BatchedModel:
+    # Model facade for PhotoCurator: get_embeddings_batch goes through the
+    # shared batcher, so concurrent curation jobs share model batches.
+    def __init__(self, batcher: DynamicBatcher, fingerprint: str):
+        self.batcher = batcher
+        self.embedding_dim = batcher.model.embedding_dim
+        self._fingerprint = fingerprint
+
+    def get_embeddings_batch(self, images):
+        return self.batcher.embed(images)
+
+    def fingerprint(self):
+        return self._fingerprint
@@ -0,0 +1,189 @@
+import os
+import json
+import time
+import threading
+import socketserver
+import numpy as np
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from preprocessing.image_processor import ImageProcessor
+from service.dynamic_batcher import DynamicBatcher, BatchedModel, QueueFull
+
+# HTTP front end for a resident model. Endpoints:
+#   POST /embed    {"paths": [...]}            -> embeddings, quality, errors
+#   POST /curate   {"folder": ..., options}     -> process_photos results
+#   GET  /metrics                               -> throughput, batching, latency
+#   GET  /health
+# Overload answers 503 with Retry-After instead of queueing without bound.
+
+# Per-request curation options; everything else is fixed by the service.
+CURATE_OPTIONS = ('similarity_threshold', 'clustering_method', 'max_cluster_size', 'index_backend',
+                  'blocking', 'time_window_seconds', 'geo_cell_degrees', 'hash_prefilter',
+                  'hash_method', 'hash_max_distance')
+
+
+class ServiceBusy(Exception):
+    pass
+
+
+class InvalidRequest(Exception):
+    pass
+
+
+class EmbeddingService:
+    def __init__(self, model, target_size=(224, 224), fast_decode=False, max_batch_size=32,
+                 max_latency_ms=5.0, max_queue_images=1024, max_concurrent_jobs=4):
+        self.model = model
+        self.target_size = target_size
+        self.fast_decode = fast_decode
+        self.processor = ImageProcessor(target_size=target_size, fast_decode=fast_decode,
+                                        dtype=np.uint8 if fast_decode else np.float32)
+        self.batcher = DynamicBatcher(model, max_batch_size=max_batch_size, max_latency_ms=max_latency_ms,
+                                      max_queue_images=max_queue_images)
+        self.metrics = self.batcher.metrics
+        self.batched_model = BatchedModel(self.batcher, model.fingerprint())
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self._jobs = threading.BoundedSemaphore(max_concurrent_jobs)
+        self._active_jobs = 0
+        self._lock = threading.Lock()
+
+    def warmup(self):
+        # The first call traces the model graph; pay for it before serving.
+        dtype = np.uint8 if self.fast_decode else np.float32
+        self.batcher.embed(np.zeros((1, self.target_size[1], self.target_size[0], 3), dtype=dtype))
+
+    def embed_paths(self, paths):
+        images, valid, errors = [], [], {}
+        for path in paths:
+            try:
+                images.append(self.processor.decode_image(path))
+                valid.append(path)
+            except Exception as e:
+                errors[path] = str(e)
+        if not images:
+            return {'paths': [], 'embeddings': [], 'quality': [], 'errors': errors}
+
+        batch = np.stack(images)
+        future = self.batcher.submit(batch)
+        quality = self.processor.quality_scores(batch)
+        embeddings = future.result()
+        self.metrics.increment('embed_requests')
+        return {'paths': valid, 'embeddings': embeddings.tolist(), 'quality': quality.tolist(), 'errors': errors}
+
+    def curate(self, folder, options):
+        from photo_curator import PhotoCurator
+        if not self._jobs.acquire(blocking=False):
+            self.metrics.increment('rejected_jobs')
+            raise ServiceBusy(f"{self.max_concurrent_jobs} curation jobs already running")
+        with self._lock:
+            self._active_jobs += 1
+        start_time = time.perf_counter()
+        try:
+            # A curator per job is cheap: it shares the resident model through
+            # the batcher, so concurrent albums are embedded in common batches.
+            try:
+                curator = PhotoCurator(target_size=self.target_size, fast_decode=self.fast_decode,
+                                       batch_size=self.batcher.max_batch_size, model=self.batched_model,
+                                       **{k: v for k, v in options.items() if k in CURATE_OPTIONS})
+            except (ValueError, TypeError) as e:
+                # Bad option values are the client's fault, not a server error.
+                self.metrics.increment('invalid_requests')
+                raise InvalidRequest(f"Invalid curation options: {e}")
+            try:
+                results = curator.process_photos(folder)
+            finally:
+                curator.close()
+        finally:
+            with self._lock:
+                self._active_jobs -= 1
+            self._jobs.release()
+        self.metrics.increment('curate_requests')
+        self.metrics.record_latency('curate', time.perf_counter() - start_time)
+        return results
+
+    def metrics_snapshot(self):
+        return self.metrics.snapshot(queued_images=self.batcher.queued_images,
+                                     max_queue_images=self.batcher.max_queue_images,
+                                     active_jobs=self._active_jobs,
+                                     max_batch_size=self.batcher.max_batch_size,
+                                     max_latency_ms=self.batcher.max_latency * 1000)
+
+    def close(self):
+        self.batcher.stop()
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    service = None
+    quiet = False
+
+    def address_string(self):
+        # Unix socket peers have no (host, port).
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(200, {'status': 'ok'})
+        elif self.path == '/metrics':
+            self._send_json(200, self.service.metrics_snapshot())
+        else:
+            self._send_json(404, {'error': f"Unknown endpoint {self.path}"})
+
+    def do_POST(self):
+        try:
+            request = self._read_json()
+        except ValueError as e:
+            self._send_json(400, {'error': f"Invalid JSON: {e}"})
+            return
+
+        try:
+            if self.path == '/embed':
+                paths = request.get('paths')
+                if not isinstance(paths, list):
+                    self._send_json(400, {'error': "'paths' must be a list"})
+                    return
+                self._send_json(200, self.service.embed_paths(paths))
+            elif self.path == '/curate':
+                folder = request.get('folder')
+                if not folder or not os.path.isdir(folder):
+                    self._send_json(400, {'error': f"Folder not found: {folder}"})
+                    return
+                self._send_json(200, self.service.curate(folder, request))
+            else:
+                self._send_json(404, {'error': f"Unknown endpoint {self.path}"})
+        except InvalidRequest as e:
+            self._send_json(400, {'error': str(e)})
+        except (QueueFull, ServiceBusy) as e:
+            self._send_json(503, {'error': str(e)}, headers={'Retry-After': '1'})
+        except Exception as e:
+            self.service.metrics.increment('errors')
+            self._send_json(500, {'error': str(e)})
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def create_server(service, host='127.0.0.1', port=8765, unix_socket=None, quiet=False):
+    handler = type('BoundServiceHandler', (ServiceHandler,), {'service': service, 'quiet': quiet})
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        return ThreadingUnixHTTPServer(unix_socket, handler)
+    return ThreadingHTTPServer((host, port), handler)
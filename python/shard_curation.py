@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+import os
+import argparse
+from similarity.ann_index import INDEX_BACKENDS
+from similarity.clustering import CLUSTERING_METHODS
+from models.tflite_similarity import TFLITE_MODEL_FILES
+from preprocessing.perceptual_hash import MAX_HASH_DISTANCE
+from sharding.shard_runner import create_plan, load_plan, run_shards, create_curator, merge_shards
+from results.binary_results import save_results, load_results, export_json
+
+def parse_shard_ids(text):
+    # "0-3,7" -> [0, 1, 2, 3, 7]
+    ids = []
+    for part in text.split(','):
+        if '-' in part:
+            first, last = part.split('-')
+            ids.extend(range(int(first), int(last) + 1))
+        elif part:
+            ids.append(int(part))
+    return ids
+
+def add_plan_arguments(parser):
+    parser.add_argument('--data_folder', type=str, default='../data/',
+                      help='Path to folder containing images')
+    parser.add_argument('--shard_size', type=int, default=10000,
+                      help='Images per shard (rounded up to whole batches)')
+    parser.add_argument('--discovery_workers', type=int, default=4,
+                      help='Threads used to scan directories while planning')
+    parser.add_argument('--similarity_threshold', type=float, default=0.85,
+                      help='Similarity threshold for duplicate detection (0.0-1.0)')
+    parser.add_argument('--batch_size', type=int, default=32,
+                      help='Number of images per model inference batch')
+    parser.add_argument('--fast_decode', action='store_true',
+                      help='Decode JPEGs at reduced resolution and keep pixels as uint8')
+    parser.add_argument('--backend', type=str, default='keras', choices=['keras', *TFLITE_MODEL_FILES],
+                      help='Inference backend for embedding extraction')
+    parser.add_argument('--tflite_model_dir', type=str, default='tflite_models',
+                      help='Folder containing the converted .tflite models')
+    parser.add_argument('--no_xnnpack', action='store_true',
+                      help='Disable the XNNPACK delegate for TFLite backends')
+    parser.add_argument('--hash_prefilter', action='store_true',
+                      help='Group exact and near-exact copies by perceptual hash before embedding')
+    parser.add_argument('--hash_method', type=str, default='dhash', choices=['dhash', 'phash'],
+                      help='Perceptual hash used by the prefilter')
+    parser.add_argument('--hash_max_distance', type=int, default=0,
+                      help=f'Maximum Hamming distance (bits of 64, at most {MAX_HASH_DISTANCE}) for hash matches')
+    parser.add_argument('--index_backend', type=str, default='exact', choices=sorted(INDEX_BACKENDS),
+                      help='Nearest-neighbor backend used by the merge')
+    parser.add_argument('--blocking', type=str, default=None, choices=['time', 'geo'],
+                      help='Only compare photos taken close together in time or space (EXIF)')
+    parser.add_argument('--clustering', type=str, default='leader', choices=CLUSTERING_METHODS,
+                      help='Clustering method used by the merge')
+    parser.add_argument('--max_cluster_size', type=int, default=None,
+                      help='Largest cluster average-link may form')
+
+def add_runtime_arguments(parser):
+    parser.add_argument('--num_workers', type=int, default=1,
+                      help='Decode processes per shard worker')
+    parser.add_argument('--tflite_threads', type=int, default=1,
+                      help='Threads per TFLite interpreter')
+    parser.add_argument('--model_dir', type=str, default=None,
+                      help='Save the built Keras model here on first run and load it on later runs')
+
+def runtime_settings(args):
+    return {'num_workers': args.num_workers,
+            'tflite_threads': args.tflite_threads,
+            'model_dir': args.model_dir or None}
+
+def main():
+    parser = argparse.ArgumentParser(description='Sharded photo curation: plan, run shards, merge')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    plan_parser = subparsers.add_parser('plan', help='Discover images and split them into shards')
+    plan_parser.add_argument('plan_dir', help='Shared directory for the plan and shard outputs')
+    add_plan_arguments(plan_parser)
+
+    run_parser = subparsers.add_parser('run', help='Embed shards; finished shards are skipped')
+    run_parser.add_argument('plan_dir')
+    run_parser.add_argument('--shards', type=str, default=None,
+                          help="Shards to run on this host, e.g. '0-3,7' (default: all)")
+    run_parser.add_argument('--processes', type=int, default=1,
+                          help='Shard worker processes on this host')
+    add_runtime_arguments(run_parser)
+
+    merge_parser = subparsers.add_parser('merge', help='Find cross-shard duplicates and cluster')
+    merge_parser.add_argument('plan_dir')
+    merge_parser.add_argument('--results_out', type=str, default=None,
+                            help='Binary results directory (default: <plan_dir>/results)')
+    merge_parser.add_argument('--results_json', type=str, default=None,
+                            help='Also export the merged results as JSON')
+    merge_parser.add_argument('--similarity_threads', type=int, default=1,
+                            help='Threads used for blocked similarity computation')
+    add_runtime_arguments(merge_parser)
+
+    args = parser.parse_args()
+
+    if args.command == 'plan':
+        if not 0 <= args.hash_max_distance <= MAX_HASH_DISTANCE:
+            plan_parser.error(f"--hash_max_distance must be between 0 and {MAX_HASH_DISTANCE}")
+        data_folder = os.path.abspath(args.data_folder)
+        if not os.path.exists(data_folder):
+            print(f"Error: Data folder '{data_folder}' not found!")
+            return
+        settings = {
+            'similarity_threshold': args.similarity_threshold,
+            'batch_size': args.batch_size,
+            'fast_decode': args.fast_decode,
+            'backend': args.backend,
+            'tflite_model_dir': args.tflite_model_dir,
+            'use_xnnpack': not args.no_xnnpack,
+            'hash_prefilter': args.hash_prefilter,
+            'hash_method': args.hash_method,
+            'hash_max_distance': args.hash_max_distance,
+            'index_backend': args.index_backend,
+            'blocking': args.blocking,
+            'clustering_method': args.clustering,
+            'max_cluster_size': args.max_cluster_size
+        }
+        plan = create_plan(args.plan_dir, data_folder, args.shard_size, settings,
+                           discovery_workers=args.discovery_workers)
+        print(f"Planned {len(plan['paths'])} images in {len(plan['shards'])} shards: {args.plan_dir}")
+
+    elif args.command == 'run':
+        shard_ids = parse_shard_ids(args.shards) if args.shards else None
+        completed = run_shards(args.plan_dir, shard_ids, processes=args.processes,
+                               runtime_settings=runtime_settings(args))
+        for done in completed:
+            print(f"Shard {done['shard']}: {done['processed_images']}/{done['images']} images "
+                  f"in {done['seconds']:.1f}s")
+
+    else:
+        plan = load_plan(args.plan_dir)
+        curator = create_curator(plan, similarity_threads=args.similarity_threads, **runtime_settings(args))
+        try:
+            results = merge_shards(curator, args.plan_dir, plan)
+        finally:
+            curator.close()
+
+        if "error" in results:
+            print(f"Error: {results['error']}")
+            return
+
+        curator.print_summary(results)
+        results_dir = args.results_out or os.path.join(args.plan_dir, 'results')
+        save_results(results, results_dir)
+        print(f"Results saved to: {results_dir}")
+        if args.results_json:
+            export_json(load_results(results_dir), args.results_json)
+            print(f"Results exported to: {args.results_json}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+from preprocessing.file_discovery import FileDiscovery
+from preprocessing.perceptual_hash import group_by_hash
+
+# Sharded curation: `plan` splits the discovered files into contiguous shards,
+# `run` embeds shards independently (any process or host sharing the plan
+# directory), and `merge` stitches them back in discovery order and clusters
+# with the single-process code path, so results match process_photos.
+
+PLAN_VERSION = 1
+PLAN_FILE = 'plan.json'
+DONE_FILE = 'done.json'
+
+# PhotoCurator settings that may differ between run and merge without
+# changing results; everything else is fixed by the plan.
+RUNTIME_SETTINGS = ('num_workers', 'prefetch_batches', 'tflite_threads', 'tflite_interpreters',
+                    'similarity_threads', 'instrumentation', 'cache_dir', 'model_dir')
+
+
+def paths_digest(paths: List[str]) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    for path in paths:
+        digest.update(path.encode('utf-8', 'surrogateescape'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def shard_bounds(num_paths: int, shard_size: int, batch_size: int) -> List[tuple]:
+    # Shards hold whole batches so model batches line up with a single run.
+    shard_size = max(batch_size, -(-shard_size // batch_size) * batch_size)
+    return [(start, min(start + shard_size, num_paths)) for start in range(0, num_paths, shard_size)]
+
+
+def create_plan(plan_dir: str, data_folder: str, shard_size: int, curator_settings: Dict,
+                discovery_workers: int = 4) -> Dict:
+    image_paths = FileDiscovery(num_workers=discovery_workers).discover(data_folder)
+    settings = {k: v for k, v in curator_settings.items() if k not in RUNTIME_SETTINGS}
+    shards = []
+    for shard_id, (start, end) in enumerate(shard_bounds(len(image_paths), shard_size,
+                                                         settings.get('batch_size', 32))):
+        shards.append({'id': shard_id, 'start': start, 'end': end,
+                       'digest': paths_digest(image_paths[start:end])})
+    plan = {
+        'version': PLAN_VERSION,
+        'data_folder': data_folder,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'settings': settings,
+        'shards': shards,
+        'paths': image_paths
+    }
+    os.makedirs(plan_dir, exist_ok=True)
+    tmp_path = os.path.join(plan_dir, PLAN_FILE + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(plan, f)
+    os.replace(tmp_path, os.path.join(plan_dir, PLAN_FILE))
+    return plan
+
+
+def load_plan(plan_dir: str) -> Dict:
+    with open(os.path.join(plan_dir, PLAN_FILE)) as f:
+        plan = json.load(f)
+    if plan.get('version') != PLAN_VERSION:
+        raise ValueError(f"Unsupported shard plan version {plan.get('version')}")
+    return plan
+
+
+def create_curator(plan: Dict, **runtime_settings):
+    from photo_curator import PhotoCurator
+    settings = dict(plan['settings'])
+    if 'target_size' in settings:
+        settings['target_size'] = tuple(settings['target_size'])
+    settings.update(runtime_settings)
+    return PhotoCurator(**settings)
+
+
+def shard_dir(plan_dir: str, shard_id: int) -> str:
+    return os.path.join(plan_dir, f"shard_{shard_id:05d}")
+
+
+def shard_done(plan_dir: str, shard: Dict, model_fingerprint: str = None) -> bool:
+    # A shard is done once its directory has been renamed into place with a
+    # done marker matching the plan (and the model, when given).
+    try:
+        with open(os.path.join(shard_dir(plan_dir, shard['id']), DONE_FILE)) as f:
+            done = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if done.get('digest') != shard['digest']:
+        return False
+    return model_fingerprint is None or done.get('model_fingerprint') == model_fingerprint
+
+
+def run_shard(curator, plan_dir: str, plan: Dict, shard: Dict) -> Dict:
+    start_time = time.time()
+    image_paths = plan['paths'][shard['start']:shard['end']]
+
+    hashes = None
+    local_hashes = None
+    if curator.hasher is not None:
+        hashes = curator.hasher.hash_images(image_paths)
+        # Merge regroups hashes across all shards. With exact matching a
+        # global leader is always the first of its hash in its shard, so the
+        # shard may skip its own copies; with a distance, grouping is order
+        # dependent and every photo is embedded (unhashed photos never group).
+        local_hashes = hashes if curator.hash_max_distance == 0 else [None] * len(image_paths)
+
+    embeddings, valid_paths, quality = curator._extract_embeddings(image_paths, local_hashes)
+    rank = {path: i for i, path in enumerate(image_paths)}
+    valid = np.zeros(len(image_paths), dtype=bool)
+    valid[[rank[path] for path in valid_paths]] = True
+
+    final_dir = shard_dir(plan_dir, shard['id'])
+    tmp_dir = final_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    if not valid_paths:
+        # Nothing decoded; still record the shard as done so restarts move on.
+        embeddings = np.zeros((0, curator.model.embedding_dim), dtype=np.float32)
+    np.save(os.path.join(tmp_dir, 'embeddings.npy'), np.asarray(embeddings, dtype=np.float32))
+    np.save(os.path.join(tmp_dir, 'valid.npy'), valid)
+    np.save(os.path.join(tmp_dir, 'quality.npy'), np.asarray(quality, dtype=np.float32))
+    if hashes is not None:
+        np.save(os.path.join(tmp_dir, 'hashes.npy'),
+                np.array([h if h is not None else 0 for h in hashes], dtype=np.uint64))
+        np.save(os.path.join(tmp_dir, 'hashed.npy'), np.array([h is not None for h in hashes], dtype=bool))
+
+    done = {
+        'shard': shard['id'],
+        'digest': shard['digest'],
+        'model_fingerprint': curator.model_fingerprint(),
+        'images': len(image_paths),
+        'processed_images': len(valid_paths),
+        'seconds': time.time() - start_time
+    }
+    with open(os.path.join(tmp_dir, DONE_FILE), 'w') as f:
+        json.dump(done, f)
+
+    # Only a finished shard is ever visible under its final name.
+    shutil.rmtree(final_dir, ignore_errors=True)
+    os.replace(tmp_dir, final_dir)
+    return done
+
+
+def run_shards(plan_dir: str, shard_ids: List[int] = None, processes: int = 1,
+               runtime_settings: Dict = None) -> List[Dict]:
+    plan = load_plan(plan_dir)
+    shards = [s for s in plan['shards'] if shard_ids is None or s['id'] in shard_ids]
+    pending = [s['id'] for s in shards if not shard_done(plan_dir, s)]
+    print(f"Shards: {len(shards) - len(pending)} of {len(shards)} already done, {len(pending)} to run")
+    if not pending:
+        return []
+
+    runtime_settings = runtime_settings or {}
+    processes = max(1, min(processes, len(pending)))
+    if processes == 1:
+        return _run_shard_group(plan_dir, pending, runtime_settings)
+
+    # Each process loads the model once and works through its share of
+    # shards. Spawned rather than forked so no process inherits another's
+    # TensorFlow threads.
+    groups = [pending[k::processes] for k in range(processes)]
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context) as executor:
+        futures = [executor.submit(_run_shard_group, plan_dir, group, runtime_settings) for group in groups]
+        return [done for future in futures for done in future.result()]
+
+
+def _run_shard_group(plan_dir: str, shard_ids: List[int], runtime_settings: Dict) -> List[Dict]:
+    # Process entry point: one curator for several shards.
+    plan = load_plan(plan_dir)
+    curator = create_curator(plan, **runtime_settings)
+    completed = []
+    try:
+        for shard_id in shard_ids:
+            shard = plan['shards'][shard_id]
+            if shard_done(plan_dir, shard, curator.model_fingerprint()):
+                continue
+            print(f"Running shard {shard_id} ({shard['end'] - shard['start']} images)")
+            completed.append(run_shard(curator, plan_dir, plan, shard))
+    finally:
+        curator.close()
+    return completed
+
+
+def merge_shards(curator, plan_dir: str, plan: Dict = None) -> Dict:
+    plan = plan or load_plan(plan_dir)
+    start_time = time.time()
+    image_paths = plan['paths']
+    n = len(image_paths)
+    fingerprint = curator.model_fingerprint()
+
+    missing = [s['id'] for s in plan['shards'] if not shard_done(plan_dir, s, fingerprint)]
+    if missing:
+        return {"error": f"{len(missing)} shard(s) not finished with this model: {missing[:10]}"}
+    if not n:
+        return {"error": "No images found in the specified folder"}
+
+    valid = np.zeros(n, dtype=bool)
+    quality = np.full(n, np.nan, dtype=np.float32)
+    hashes = [None] * n if curator.hasher is not None else None
+    blocks = []
+    for shard in plan['shards']:
+        directory = shard_dir(plan_dir, shard['id'])
+        start, end = shard['start'], shard['end']
+        shard_valid = np.load(os.path.join(directory, 'valid.npy'))
+        valid[start:end] = shard_valid
+        quality[start + np.nonzero(shard_valid)[0]] = np.load(os.path.join(directory, 'quality.npy'))
+        blocks.append(np.load(os.path.join(directory, 'embeddings.npy')))
+        if hashes is not None:
+            values = np.load(os.path.join(directory, 'hashes.npy')).tolist()
+            hashed = np.load(os.path.join(directory, 'hashed.npy')).tolist()
+            hashes[start:end] = [value if ok else None for value, ok in zip(values, hashed)]
+
+    blocks = [block for block in blocks if block.size]
+    if not blocks:
+        return {"error": "No valid images could be processed"}
+    stacked = np.concatenate(blocks)
+    row = np.full(n, -1, dtype=np.int64)
+    row[valid] = np.arange(len(stacked))
+
+    # Cross-shard copies take their global leader's embedding, exactly as the
+    # prefilter does in a single run.
+    source = np.arange(n)
+    if hashes is not None:
+        source = np.asarray(group_by_hash(hashes, curator.hash_max_distance))
+        # As in a single run, a leader that failed to decode is replaced by
+        # the first member of its group that did; the members before it
+        # failed too and are dropped below (their source lies after them).
+        orphaned = np.nonzero(valid & ~valid[source])[0]
+        lost_leaders, first = np.unique(source[orphaned], return_index=True)
+        replacement = np.arange(n)
+        replacement[lost_leaders] = orphaned[first]
+        source = replacement[source]
+        print(f"Perceptual hash prefilter: {int(np.sum(source != np.arange(n)))} of {n} "
+              f"images reuse a matching photo's embedding")
+    keep = np.nonzero(valid[source] & (source <= np.arange(n)))[0]
+    embeddings = stacked[row[source[keep]]]
+    valid_paths = [image_paths[i] for i in keep]
+    print(f"Merged {len(plan['shards'])} shards: embeddings for {len(valid_paths)} of {n} images")
+
+    return curator._build_results(image_paths, embeddings, valid_paths, quality[source[keep]], start_time)
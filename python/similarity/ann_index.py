@@ -0,0 +1,327 @@
+import os
+import json
+import time
+import numpy as np
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+
+def _normalize(embeddings):
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return embeddings / norms
+
+
+def _empty_pairs():
+    return np.array([], dtype=np.int64), np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+
+
+def _sorted_pairs(rows, cols, scores):
+    order = np.lexsort((cols, rows))
+    return rows[order], cols[order], scores[order]
+
+
+class ExactIndex:
+    backend = 'exact'
+
+    def __init__(self, dim, block_size=1024):
+        self.dim = dim
+        self.block_size = block_size
+        self.embeddings = np.zeros((0, dim), dtype=np.float32)
+
+    def params(self):
+        return {'block_size': self.block_size}
+
+    def __len__(self):
+        return len(self.embeddings)
+
+    def add(self, embeddings):
+        self.embeddings = np.concatenate([self.embeddings, _normalize(embeddings)])
+
+    def range_search(self, queries, threshold):
+        # Returns (query_ids, ids, scores) for every stored vector above threshold.
+        queries = _normalize(queries)
+        query_ids, ids, scores = [], [], []
+        for start in range(0, len(queries), self.block_size):
+            block = queries[start:start + self.block_size] @ self.embeddings.T
+            local_rows, local_cols = np.nonzero(block > threshold)
+            query_ids.append(local_rows + start)
+            ids.append(local_cols)
+            scores.append(block[local_rows, local_cols])
+        if not query_ids:
+            return _empty_pairs()
+        return np.concatenate(query_ids), np.concatenate(ids), np.concatenate(scores)
+
+    def search_pairs(self, threshold):
+        # Self-join over the stored vectors: (rows, cols, scores) with rows < cols.
+        rows, cols, scores = [], [], []
+        for start in range(0, len(self.embeddings), self.block_size):
+            block = self.embeddings[start:start + self.block_size] @ self.embeddings[start:].T
+            local_rows, local_cols = np.nonzero(block > threshold)
+            keep = local_cols > local_rows
+            local_rows, local_cols = local_rows[keep], local_cols[keep]
+            rows.append(local_rows + start)
+            cols.append(local_cols + start)
+            scores.append(block[local_rows, local_cols])
+        if not rows:
+            return _empty_pairs()
+        return np.concatenate(rows), np.concatenate(cols), np.concatenate(scores)
+
+    def _state(self):
+        return {'embeddings': self.embeddings}
+
+    def _restore(self, state):
+        self.embeddings = state['embeddings']
+
+    def save(self, path):
+        meta = {'backend': self.backend, 'dim': self.dim, 'params': self.params()}
+        np.savez(_index_base(path) + '.npz', meta=np.array(json.dumps(meta)), **self._state())
+
+    @classmethod
+    def _from_saved(cls, meta, state, path):
+        index = cls(meta['dim'], **meta['params'])
+        index._restore(state)
+        return index
+
+
+class LSHIndex(ExactIndex):
+    # Random-hyperplane LSH for cosine similarity. Two vectors become candidates
+    # when they share a bucket in any table; candidates are then scored exactly,
+    # so precision is always 1 and more tables / fewer bits trade speed for recall.
+    backend = 'lsh'
+
+    def __init__(self, dim, num_tables=8, num_bits=14, seed=0, block_size=1024):
+        super().__init__(dim, block_size=block_size)
+        if not 0 < num_bits < 63:
+            raise ValueError("num_bits must be between 1 and 62")
+        self.num_tables = num_tables
+        self.num_bits = num_bits
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        self.planes = rng.standard_normal((num_tables, dim, num_bits)).astype(np.float32)
+        self._bit_weights = np.left_shift(np.int64(1), np.arange(num_bits, dtype=np.int64))
+        self.codes = np.zeros((num_tables, 0), dtype=np.int64)
+        self._sorted = None
+
+    def params(self):
+        return {'num_tables': self.num_tables, 'num_bits': self.num_bits,
+                'seed': self.seed, 'block_size': self.block_size}
+
+    def _hash(self, vectors):
+        codes = np.empty((self.num_tables, len(vectors)), dtype=np.int64)
+        for t in range(self.num_tables):
+            codes[t] = (vectors @ self.planes[t] > 0) @ self._bit_weights
+        return codes
+
+    def add(self, embeddings):
+        embeddings = _normalize(embeddings)
+        self.embeddings = np.concatenate([self.embeddings, embeddings])
+        self.codes = np.concatenate([self.codes, self._hash(embeddings)], axis=1)
+        self._sorted = None
+
+    def _sorted_tables(self):
+        if self._sorted is None:
+            self._sorted = []
+            for t in range(self.num_tables):
+                order = np.argsort(self.codes[t], kind='stable')
+                self._sorted.append((self.codes[t][order], order))
+        return self._sorted
+
+    def _score_candidates(self, rows, cols, queries, threshold):
+        keep_rows, keep_cols, keep_scores = [], [], []
+        chunk = 1 << 20
+        for start in range(0, len(rows), chunk):
+            r, c = rows[start:start + chunk], cols[start:start + chunk]
+            scores = np.einsum('ij,ij->i', queries[r], self.embeddings[c])
+            mask = scores > threshold
+            keep_rows.append(r[mask])
+            keep_cols.append(c[mask])
+            keep_scores.append(scores[mask])
+        if not keep_rows:
+            return _empty_pairs()
+        return np.concatenate(keep_rows), np.concatenate(keep_cols), np.concatenate(keep_scores)
+
+    def search_pairs(self, threshold):
+        n = len(self.embeddings)
+        keys = []
+        for sorted_codes, order in self._sorted_tables():
+            # Members of a bucket are adjacent after sorting; pairing each
+            # position with the one `gap` ahead enumerates every in-bucket pair.
+            gap = 1
+            while gap < n:
+                same = sorted_codes[gap:] == sorted_codes[:-gap]
+                if not same.any():
+                    break
+                a, b = order[:-gap][same], order[gap:][same]
+                keys.append(np.minimum(a, b) * n + np.maximum(a, b))
+                gap += 1
+        if not keys:
+            return _empty_pairs()
+        keys = np.unique(np.concatenate(keys))
+        rows, cols, scores = self._score_candidates(keys // n, keys % n, self.embeddings, threshold)
+        return _sorted_pairs(rows, cols, scores)
+
+    def range_search(self, queries, threshold):
+        queries = _normalize(queries)
+        query_codes = self._hash(queries)
+        query_ids, ids = [], []
+        for t, (sorted_codes, order) in enumerate(self._sorted_tables()):
+            left = np.searchsorted(sorted_codes, query_codes[t], side='left')
+            right = np.searchsorted(sorted_codes, query_codes[t], side='right')
+            for q in np.nonzero(right > left)[0]:
+                members = order[left[q]:right[q]]
+                query_ids.append(np.full(len(members), q, dtype=np.int64))
+                ids.append(members)
+        if not query_ids:
+            return _empty_pairs()
+        n = len(self.embeddings)
+        keys = np.unique(np.concatenate(query_ids) * n + np.concatenate(ids))
+        return self._score_candidates(keys // n, keys % n, queries, threshold)
+
+    def _state(self):
+        return {'embeddings': self.embeddings, 'planes': self.planes, 'codes': self.codes}
+
+    def _restore(self, state):
+        self.embeddings = state['embeddings']
+        self.planes = state['planes']
+        self.codes = state['codes']
+        self._sorted = None
+
+
+class HNSWIndex(ExactIndex):
+    # Graph index from the optional hnswlib package. HNSW answers k-NN queries,
+    # so range queries fetch max_neighbors candidates and filter by threshold.
+    backend = 'hnsw'
+
+    def __init__(self, dim, M=16, ef_construction=200, ef_search=128, max_neighbors=64,
+                 num_threads=-1, block_size=1024):
+        if hnswlib is None:
+            raise ImportError("The 'hnsw' index backend requires the hnswlib package")
+        super().__init__(dim, block_size=block_size)
+        self.M = M
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.max_neighbors = max_neighbors
+        self.num_threads = num_threads
+        self._index = None
+
+    def params(self):
+        return {'M': self.M, 'ef_construction': self.ef_construction, 'ef_search': self.ef_search,
+                'max_neighbors': self.max_neighbors, 'num_threads': self.num_threads,
+                'block_size': self.block_size}
+
+    def _new_index(self, capacity):
+        index = hnswlib.Index(space='ip', dim=self.dim)
+        index.init_index(max_elements=max(1, capacity), ef_construction=self.ef_construction, M=self.M)
+        index.set_ef(max(self.ef_search, self.max_neighbors))
+        index.set_num_threads(self.num_threads)
+        return index
+
+    def add(self, embeddings):
+        embeddings = _normalize(embeddings)
+        start = len(self.embeddings)
+        self.embeddings = np.concatenate([self.embeddings, embeddings])
+        if self._index is None:
+            self._index = self._new_index(len(self.embeddings))
+        elif len(self.embeddings) > self._index.get_max_elements():
+            self._index.resize_index(len(self.embeddings))
+        self._index.add_items(embeddings, np.arange(start, len(self.embeddings)))
+
+    def range_search(self, queries, threshold):
+        queries = _normalize(queries)
+        if len(self.embeddings) == 0 or len(queries) == 0:
+            return _empty_pairs()
+        k = min(self.max_neighbors, len(self.embeddings))
+        labels, distances = self._index.knn_query(queries, k=k)
+        # Inner-product space reports distance = 1 - similarity.
+        scores = (1.0 - distances).astype(np.float32)
+        query_ids, neighbor_ids = np.nonzero(scores > threshold)
+        return (query_ids.astype(np.int64), labels[query_ids, neighbor_ids].astype(np.int64),
+                scores[query_ids, neighbor_ids])
+
+    def search_pairs(self, threshold):
+        rows, cols, scores = self.range_search(self.embeddings, threshold)
+        keep = rows != cols
+        a, b, scores = rows[keep], cols[keep], scores[keep]
+        n = len(self.embeddings)
+        keys, first = np.unique(np.minimum(a, b) * n + np.maximum(a, b), return_index=True)
+        return _sorted_pairs(keys // n, keys % n, scores[first])
+
+    def save(self, path):
+        super().save(path)
+        if self._index is not None:
+            self._index.save_index(_index_base(path) + '.hnsw')
+
+    @classmethod
+    def _from_saved(cls, meta, state, path):
+        index = cls(meta['dim'], **meta['params'])
+        index.embeddings = state['embeddings']
+        if os.path.exists(path + '.hnsw'):
+            index._index = hnswlib.Index(space='ip', dim=index.dim)
+            index._index.load_index(path + '.hnsw', max_elements=max(1, len(index.embeddings)))
+            index._index.set_ef(max(index.ef_search, index.max_neighbors))
+            index._index.set_num_threads(index.num_threads)
+        return index
+
+
+INDEX_BACKENDS = {
+    ExactIndex.backend: ExactIndex,
+    LSHIndex.backend: LSHIndex,
+    HNSWIndex.backend: HNSWIndex,
+}
+
+
+def create_index(backend, dim, **params):
+    if backend not in INDEX_BACKENDS:
+        raise ValueError(f"Unknown index backend '{backend}'. Choose from: {', '.join(INDEX_BACKENDS)}")
+    return INDEX_BACKENDS[backend](dim, **params)
+
+
+def _index_base(path):
+    # 'foo' and 'foo.npz' name the same index: foo.npz plus side files such
+    # as foo.hnsw.
+    return path[:-len('.npz')] if path.endswith('.npz') else path
+
+
+def load_index(path):
+    base = _index_base(path)
+    state = dict(np.load(base + '.npz'))
+    meta = json.loads(str(state.pop('meta')))
+    return INDEX_BACKENDS[meta['backend']]._from_saved(meta, state, base)
+
+
+def measure_recall(index, threshold):
+    # Compares the index's self-join against exact search over the same vectors.
+    exact = ExactIndex(index.dim)
+    exact.embeddings = index.embeddings
+    n = max(1, len(index))
+
+    start_time = time.time()
+    exact_rows, exact_cols, _ = exact.search_pairs(threshold)
+    exact_seconds = time.time() - start_time
+
+    start_time = time.time()
+    rows, cols, _ = index.search_pairs(threshold)
+    index_seconds = time.time() - start_time
+
+    exact_keys = exact_rows * n + exact_cols
+    found_keys = rows * n + cols
+    true_positives = len(np.intersect1d(exact_keys, found_keys))
+
+    return {
+        "backend": index.backend,
+        "params": index.params(),
+        "num_vectors": len(index),
+        "threshold": threshold,
+        "exact_pairs": len(exact_keys),
+        "found_pairs": len(found_keys),
+        "recall": true_positives / len(exact_keys) if len(exact_keys) else 1.0,
+        "precision": true_positives / len(found_keys) if len(found_keys) else 1.0,
+        "exact_seconds": exact_seconds,
+        "index_seconds": index_seconds,
+        "speedup": exact_seconds / index_seconds if index_seconds > 0 else float('inf')
+    }
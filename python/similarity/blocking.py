@@ -0,0 +1,81 @@
+import numpy as np
+
+
+def _empty_pairs():
+    return np.array([], dtype=np.int64), np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+
+
+def _concat(parts):
+    parts = [part for part in parts if len(part[0])]
+    if not parts:
+        return _empty_pairs()
+    rows, cols, scores = zip(*parts)
+    return np.concatenate(rows), np.concatenate(cols), np.concatenate(scores)
+
+
+def _pairs_within(normalized, members, threshold, block_size):
+    # All-pairs over one bucket (used for the fallback bucket).
+    parts = []
+    for start in range(0, len(members), block_size):
+        block = normalized[members[start:start + block_size]] @ normalized[members[start:]].T
+        local_rows, local_cols = np.nonzero(block > threshold)
+        keep = local_cols > local_rows
+        local_rows, local_cols = local_rows[keep], local_cols[keep]
+        parts.append((members[start + local_rows], members[start + local_cols], block[local_rows, local_cols]))
+    return _concat(parts)
+
+
+def time_blocked_pairs(normalized, capture_times, window_seconds, threshold, block_size=1024):
+    # Sorts photos by capture time and compares each block of the sorted order
+    # only against photos up to window_seconds later. Photos without a time
+    # form a fallback bucket compared among themselves.
+    capture_times = np.asarray(capture_times, dtype=np.float64)
+    timed = np.nonzero(~np.isnan(capture_times))[0]
+    order = timed[np.argsort(capture_times[timed], kind='stable')]
+    times = capture_times[order]
+    
+    parts = []
+    for start in range(0, len(order), block_size):
+        end = min(start + block_size, len(order))
+        stop = np.searchsorted(times, times[end - 1] + window_seconds, side='right')
+        block = normalized[order[start:end]] @ normalized[order[start:stop]].T
+        gap = times[start:stop][None, :] - times[start:end][:, None]
+        local_rows, local_cols = np.nonzero((block > threshold) & (gap <= window_seconds))
+        keep = local_cols > local_rows
+        local_rows, local_cols = local_rows[keep], local_cols[keep]
+        parts.append((order[start + local_rows], order[start + local_cols], block[local_rows, local_cols]))
+    
+    parts.append(_pairs_within(normalized, np.nonzero(np.isnan(capture_times))[0], threshold, block_size))
+    return _concat(parts)
+
+
+def geo_blocked_pairs(normalized, coordinates, cell_degrees, threshold, block_size=1024):
+    # Buckets photos into lat/lon grid cells and compares each cell against
+    # itself and its eight neighbours. Photos without GPS form a fallback bucket.
+    coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+    located = np.nonzero(~np.isnan(coordinates).any(axis=1))[0]
+    cells = np.floor(coordinates[located] / cell_degrees).astype(np.int64)
+    
+    buckets = {}
+    for index, cell in zip(located.tolist(), map(tuple, cells.tolist())):
+        buckets.setdefault(cell, []).append(index)
+    
+    parts = []
+    for (lat_cell, lon_cell), members in buckets.items():
+        members = np.array(members, dtype=np.int64)
+        neighbors = np.concatenate([
+            np.array(buckets.get((lat_cell + dlat, lon_cell + dlon), []), dtype=np.int64)
+            for dlat in (-1, 0, 1) for dlon in (-1, 0, 1)
+        ])
+        for start in range(0, len(members), block_size):
+            rows = members[start:start + block_size]
+            block = normalized[rows] @ normalized[neighbors].T
+            local_rows, local_cols = np.nonzero(block > threshold)
+            # Each unordered pair is seen from both cells; keep it once.
+            keep = neighbors[local_cols] > rows[local_rows]
+            local_rows, local_cols = local_rows[keep], local_cols[keep]
+            parts.append((rows[local_rows], neighbors[local_cols], block[local_rows, local_cols]))
+    
+    missing = np.setdiff1d(np.arange(len(coordinates)), located)
+    parts.append(_pairs_within(normalized, missing, threshold, block_size))
+    return _concat(parts)
@@ -0,0 +1,285 @@
+import os
+import json
+import numpy as np
+from typing import List
+
+STATE_VERSION = 4
+# Rewrite the embedding file once more than this fraction of rows are deleted.
+COMPACT_FRACTION = 0.5
+
+
+def file_stats(image_paths: List[str]) -> tuple:
+    # (size, mtime_ns) per path, -1 for files that cannot be stat'ed.
+    sizes = np.full(len(image_paths), -1, dtype=np.int64)
+    mtimes = np.full(len(image_paths), -1, dtype=np.int64)
+    for i, path in enumerate(image_paths):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        sizes[i] = stat.st_size
+        mtimes[i] = stat.st_mtime_ns
+    return sizes, mtimes
+
+
+class ClusterState:
+    # Persistent library state for incremental curation. Embeddings live in a
+    # raw float32 file that only grows by appending; deletions are tombstoned
+    # through `active` until enough accumulate to compact.
+    def __init__(self, state_dir: str, dim: int, model_fingerprint: str, similarity_threshold: float):
+        self.state_dir = state_dir
+        self.dim = dim
+        self.model_fingerprint = model_fingerprint
+        self.similarity_threshold = similarity_threshold
+        
+        self.paths = []
+        self.labels = np.zeros(0, dtype=np.int64)
+        self.active = np.zeros(0, dtype=bool)
+        # Per-row quality score; representatives are the best active member.
+        self.quality = np.zeros(0, dtype=np.float32)
+        # File size and mtime when the row was embedded; a mismatch means the
+        # photo was edited in place and its row is stale.
+        self.sizes = np.zeros(0, dtype=np.int64)
+        self.mtimes = np.zeros(0, dtype=np.int64)
+        self.representatives = {}
+        self.next_label = 0
+        
+        self.embeddings = np.zeros((0, dim), dtype=np.float32)
+        self._pending = []
+        self._persisted_rows = 0
+        # Rewrites (first save, compaction) go to a new generation of the
+        # embedding file; state.npz names the file it was committed with.
+        self.embeddings_generation = 0
+    
+    @property
+    def state_path(self):
+        return os.path.join(self.state_dir, 'state.npz')
+    
+    @property
+    def embeddings_path(self):
+        return os.path.join(self.state_dir, f'embeddings.{self.embeddings_generation}.f32')
+    
+    @classmethod
+    def load(cls, state_dir: str, model_fingerprint: str, similarity_threshold: float):
+        state_path = os.path.join(state_dir, 'state.npz')
+        if not os.path.exists(state_path):
+            return None
+        
+        try:
+            data = np.load(state_path)
+            meta = json.loads(str(data['meta']))
+        except Exception as e:
+            print(f"Could not read library state: {e}")
+            return None
+        
+        if meta.get('version') != STATE_VERSION:
+            print("Library state has an unsupported version")
+            return None
+        if meta['model_fingerprint'] != model_fingerprint:
+            print("Library state was built by a different model")
+            return None
+        if meta['similarity_threshold'] != similarity_threshold:
+            print("Library state was built with a different similarity threshold")
+            return None
+        
+        state = cls(state_dir, meta['dim'], model_fingerprint, similarity_threshold)
+        state.embeddings_generation = meta['embeddings_generation']
+        rows = meta['rows']
+        size = os.path.getsize(state.embeddings_path) if os.path.exists(state.embeddings_path) else -1
+        if size < rows * state.dim * 4:
+            print("Library state embeddings are missing or truncated")
+            return None
+        state.paths = data['paths'].tolist()
+        state.labels = data['labels'].astype(np.int64)
+        state.active = data['active'].astype(bool)
+        state.quality = data['quality'].astype(np.float32)
+        state.sizes = data['sizes'].astype(np.int64)
+        state.mtimes = data['mtimes'].astype(np.int64)
+        state.representatives = dict(zip(data['rep_labels'].tolist(), data['rep_indices'].tolist()))
+        state.next_label = meta['next_label']
+        state._persisted_rows = len(state.paths)
+        if state.paths:
+            state.embeddings = np.memmap(state.embeddings_path, dtype=np.float32, mode='r',
+                                         shape=(len(state.paths), state.dim))
+        return state
+    
+    @classmethod
+    def from_clusters(cls, state_dir: str, model_fingerprint: str, similarity_threshold: float,
+                      image_paths: List[str], embeddings: np.ndarray, clusters: List[dict],
+                      quality: np.ndarray = None):
+        state = cls(state_dir, embeddings.shape[1], model_fingerprint, similarity_threshold)
+        labels = np.zeros(len(image_paths), dtype=np.int64)
+        for label, cluster in enumerate(clusters):
+            labels[cluster['indices']] = label
+            state.representatives[label] = cluster['indices'][cluster['paths'].index(cluster['representative'])]
+        state.next_label = len(clusters)
+        state.append(image_paths, embeddings, labels, quality)
+        return state
+    
+    def active_indices(self):
+        return np.nonzero(self.active)[0]
+    
+    def active_paths(self):
+        return [self.paths[i] for i in self.active_indices()]
+    
+    def changed_paths(self, image_paths: List[str]) -> List[str]:
+        # Active paths whose file no longer matches the size and mtime it was
+        # embedded with.
+        lookup = {path: i for i, path in enumerate(self.paths) if self.active[i]}
+        known = [path for path in image_paths if path in lookup]
+        rows = np.array([lookup[path] for path in known], dtype=np.int64)
+        sizes, mtimes = file_stats(known)
+        stale = (sizes != self.sizes[rows]) | (mtimes != self.mtimes[rows])
+        return [path for path, changed in zip(known, stale.tolist()) if changed]
+    
+    def remove(self, image_paths: List[str]) -> int:
+        if not image_paths:
+            return 0
+        
+        lookup = {path: i for i, path in enumerate(self.paths) if self.active[i]}
+        removed = np.array([lookup[p] for p in image_paths if p in lookup], dtype=np.int64)
+        if len(removed) == 0:
+            return 0
+        
+        self.active[removed] = False
+        for label in np.unique(self.labels[removed]).tolist():
+            if self.active[self.representatives.get(label, -1)]:
+                continue
+            members = np.nonzero(self.active & (self.labels == label))[0]
+            if len(members):
+                self.representatives[label] = self._best_member(members)
+            else:
+                self.representatives.pop(label, None)
+        return len(removed)
+    
+    def _best_member(self, members):
+        # Highest quality wins; ties and unscored rows fall back to the first.
+        scores = np.nan_to_num(self.quality[members], nan=-np.inf)
+        return int(members[np.argmax(scores)])
+    
+    def append(self, image_paths: List[str], embeddings: np.ndarray, labels: np.ndarray,
+               quality: np.ndarray = None):
+        if quality is None:
+            quality = np.full(len(image_paths), np.nan, dtype=np.float32)
+        start = len(self.paths)
+        self.paths.extend(image_paths)
+        self.labels = np.concatenate([self.labels, np.asarray(labels, dtype=np.int64)])
+        self.active = np.concatenate([self.active, np.ones(len(image_paths), dtype=bool)])
+        self.quality = np.concatenate([self.quality, np.asarray(quality, dtype=np.float32)])
+        sizes, mtimes = file_stats(image_paths)
+        self.sizes = np.concatenate([self.sizes, sizes])
+        self.mtimes = np.concatenate([self.mtimes, mtimes])
+        self._pending.append(np.asarray(embeddings, dtype=np.float32))
+        
+        for offset, label in enumerate(np.asarray(labels).tolist()):
+            row = start + offset
+            rep = self.representatives.get(label)
+            if rep is None or self.quality[row] > self.quality[rep]:
+                self.representatives[label] = row
+            self.next_label = max(self.next_label, label + 1)
+    
+    def _compact(self):
+        keep = self.active_indices()
+        remap = np.full(len(self.paths), -1, dtype=np.int64)
+        remap[keep] = np.arange(len(keep))
+        
+        all_rows = np.concatenate([np.asarray(self.embeddings[:self._persisted_rows])] + self._pending)
+        
+        self.paths = [self.paths[i] for i in keep]
+        self.labels = self.labels[keep]
+        self.quality = self.quality[keep]
+        self.sizes = self.sizes[keep]
+        self.mtimes = self.mtimes[keep]
+        self.active = np.ones(len(keep), dtype=bool)
+        self.representatives = {label: int(remap[index]) for label, index in self.representatives.items()}
+        self._pending = [all_rows[keep]]
+        self._persisted_rows = 0
+    
+    def save(self):
+        os.makedirs(self.state_dir, exist_ok=True)
+        
+        if len(self.paths) and np.mean(~self.active) > COMPACT_FRACTION:
+            self._compact()
+        
+        # Appends overwrite from the last committed row, so rows written by an
+        # interrupted save are discarded rather than shifted; the committed
+        # rows never move. A rewrite goes to a fresh file that only becomes
+        # live when state.npz is replaced, so a crash at any point leaves the
+        # previous state and its embeddings consistent.
+        previous_path = self.embeddings_path
+        if not self._persisted_rows:
+            self.embeddings_generation += 1
+        mode = 'r+b' if self._persisted_rows else 'wb'
+        with open(self.embeddings_path, mode) as f:
+            f.seek(self._persisted_rows * self.dim * 4)
+            for rows in self._pending:
+                f.write(np.ascontiguousarray(rows, dtype=np.float32).tobytes())
+            f.truncate()
+            f.flush()
+            os.fsync(f.fileno())
+        
+        meta = {
+            'version': STATE_VERSION,
+            'dim': self.dim,
+            'model_fingerprint': self.model_fingerprint,
+            'similarity_threshold': self.similarity_threshold,
+            'next_label': self.next_label,
+            'embeddings_generation': self.embeddings_generation,
+            'rows': len(self.paths)
+        }
+        tmp_path = self.state_path + '.tmp.npz'
+        np.savez(
+            tmp_path,
+            meta=np.array(json.dumps(meta)),
+            paths=np.array(self.paths, dtype=str),
+            labels=self.labels,
+            active=self.active,
+            quality=self.quality,
+            sizes=self.sizes,
+            mtimes=self.mtimes,
+            rep_labels=np.array(list(self.representatives.keys()), dtype=np.int64),
+            rep_indices=np.array(list(self.representatives.values()), dtype=np.int64)
+        )
+        os.replace(tmp_path, self.state_path)
+        if previous_path != self.embeddings_path:
+            # Drop the previous generation, including the pre-generation
+            # 'embeddings.f32' layout, only after the commit.
+            for stale in (previous_path, os.path.join(self.state_dir, 'embeddings.f32')):
+                if os.path.exists(stale):
+                    os.remove(stale)
+        
+        self._pending = []
+        self._persisted_rows = len(self.paths)
+        self.embeddings = np.memmap(self.embeddings_path, dtype=np.float32, mode='r',
+                                    shape=(len(self.paths), self.dim)) if self.paths else \
+            np.zeros((0, self.dim), dtype=np.float32)
+    
+    def positions(self):
+        # Maps state row -> position in active_paths() (or -1 when removed).
+        positions = np.full(len(self.paths), -1, dtype=np.int64)
+        active = self.active_indices()
+        positions[active] = np.arange(len(active))
+        return positions
+    
+    def clusters(self) -> List[dict]:
+        active = self.active_indices()
+        positions = self.positions()
+        
+        order = np.argsort(self.labels[active], kind='stable')
+        sorted_labels = self.labels[active][order]
+        boundaries = np.nonzero(np.diff(sorted_labels))[0] + 1
+        
+        clusters = []
+        for members in np.split(active[order], boundaries):
+            if len(members) == 0:
+                continue
+            label = int(self.labels[members[0]])
+            rep = self.representatives.get(label, int(members[0]))
+            clusters.append({
+                'indices': positions[members].tolist(),
+                'paths': [self.paths[i] for i in members],
+                'representative': self.paths[rep]
+            })
+        
+        clusters.sort(key=lambda cluster: cluster['indices'][0])
+        return clusters
@@ -0,0 +1,141 @@
+import heapq
+import numpy as np
+from typing import List
+from similarity.similarity_graph import SimilarityGraph
+
+CLUSTERING_METHODS = ('leader', 'components', 'average')
+
+
+def leader_labels(graph: SimilarityGraph) -> np.ndarray:
+    # In index order, each unassigned photo becomes a leader and claims every
+    # unassigned photo above the threshold. Only leaders touch the graph, so
+    # this is O(n + edges); the result depends on the input order.
+    labels = np.full(graph.num_nodes, -1, dtype=np.int64)
+    indptr, cols = graph.indptr, graph.cols
+    for i in range(graph.num_nodes):
+        if labels[i] >= 0:
+            continue
+        labels[i] = i
+        neighbors = cols[indptr[i]:indptr[i + 1]]
+        free = neighbors[labels[neighbors] < 0]
+        labels[free] = i
+    return labels
+
+
+def component_labels(graph: SimilarityGraph) -> np.ndarray:
+    # Connected components by vectorized union-find: every round hooks the
+    # larger root of each edge onto the smaller one, then compresses paths
+    # until each node points at its root. Each photo ends up labelled with
+    # the smallest index in its component, independent of input order, and
+    # transitive duplicates (a~b, b~c) land in one cluster.
+    parent = np.arange(graph.num_nodes, dtype=np.int64)
+    rows, cols = graph.rows, graph.cols
+    while True:
+        root_rows, root_cols = parent[rows], parent[cols]
+        low = np.minimum(root_rows, root_cols)
+        high = np.maximum(root_rows, root_cols)
+        pending = low != high
+        if not pending.any():
+            return parent
+        np.minimum.at(parent, high[pending], low[pending])
+        while True:
+            compressed = parent[parent]
+            if np.array_equal(compressed, parent):
+                break
+            parent = compressed
+        # Edges whose endpoints already share a root never matter again.
+        rows, cols = rows[pending], cols[pending]
+
+
+def average_link_labels(graph: SimilarityGraph, threshold: float, max_cluster_size: int = None) -> np.ndarray:
+    # Average-link agglomeration over the sparse graph. Cluster pairs are
+    # merged best-first while their mean similarity stays at or above the
+    # threshold; pairs missing from the graph (below the threshold) count as
+    # 0. Merges that would exceed max_cluster_size are skipped, which keeps
+    # long chains of near-duplicates from collapsing into one cluster.
+    n = graph.num_nodes
+    size = np.ones(n, dtype=np.int64)
+    version = np.zeros(n, dtype=np.int64)
+    alive = np.ones(n, dtype=bool)
+    # links[a][b] is the summed similarity between clusters a and b.
+    links = [dict() for _ in range(n)]
+    for i, j, score in graph.pairs():
+        links[i][j] = score
+        links[j][i] = score
+
+    heap = [(-score, i, j, 0, 0) for i, j, score in graph.pairs() if score >= threshold]
+    heapq.heapify(heap)
+    labels = np.arange(n, dtype=np.int64)
+    members = {i: [i] for i in range(n)}
+
+    while heap:
+        neg_average, a, b, version_a, version_b = heapq.heappop(heap)
+        if not (alive[a] and alive[b]) or version[a] != version_a or version[b] != version_b:
+            continue
+        if max_cluster_size and size[a] + size[b] > max_cluster_size:
+            continue
+
+        # Keep the lower index as the surviving cluster id so labels stay
+        # deterministic; fold the smaller link table into the larger.
+        a, b = min(a, b), max(a, b)
+        if len(links[a]) < len(links[b]):
+            links[a], links[b] = links[b], links[a]
+        merged, other = links[a], links[b]
+        for c, score in other.items():
+            merged[c] = merged.get(c, 0.0) + score
+        merged.pop(a, None)
+        merged.pop(b, None)
+        links[b] = {}
+        for c, total in merged.items():
+            links[c].pop(b, None)
+            links[c][a] = total
+
+        alive[b] = False
+        size[a] += size[b]
+        version[a] += 1
+        members[a].extend(members.pop(b))
+
+        for c, total in merged.items():
+            average = total / (size[a] * size[c])
+            if average >= threshold:
+                low, high = min(a, c), max(a, c)
+                heapq.heappush(heap, (-average, low, high, version[low], version[high]))
+
+    for leader, indices in members.items():
+        labels[indices] = min(indices)
+    return labels
+
+
+def cluster_labels(graph: SimilarityGraph, method: str = 'leader', threshold: float = 0.85,
+                   max_cluster_size: int = None) -> np.ndarray:
+    if method == 'leader':
+        return leader_labels(graph)
+    if method == 'components':
+        return component_labels(graph)
+    if method == 'average':
+        return average_link_labels(graph, threshold, max_cluster_size)
+    raise ValueError(f"Unknown clustering method '{method}'. Choose from: {', '.join(CLUSTERING_METHODS)}")
+
+
+def clusters_from_labels(labels: np.ndarray, image_paths: List[str], quality: np.ndarray = None) -> List[dict]:
+    # Clusters ordered by their first member, members in index order. The
+    # representative is the highest-quality member (the first on ties or
+    # without scores).
+    order = np.argsort(labels, kind='stable')
+    sorted_labels = labels[order]
+    boundaries = np.flatnonzero(np.diff(sorted_labels)) + 1
+    groups = np.split(order, boundaries) if len(order) else []
+    groups.sort(key=lambda group: group[0])
+
+    clusters = []
+    for group in groups:
+        cluster = group.tolist()
+        best = cluster[0]
+        if quality is not None and len(cluster) > 1:
+            best = cluster[int(np.argmax(np.nan_to_num(quality[group], nan=-np.inf)))]
+        clusters.append({
+            'indices': cluster,
+            'paths': [image_paths[idx] for idx in cluster],
+            'representative': image_paths[best]
+        })
+    return clusters
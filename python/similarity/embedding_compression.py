@@ -0,0 +1,396 @@
+import time
+import numpy as np
+
+# Codecs store unit-norm embeddings in fewer bytes. Search never expands the
+# whole store: each row/column block is decoded on the fly and compared with
+# one matrix product, so memory is the codes plus two decoded blocks.
+
+TRAINING_SAMPLE = 20000
+
+
+def _normalize(embeddings):
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return embeddings / norms
+
+
+def _training_sample(embeddings, seed=0):
+    if len(embeddings) <= TRAINING_SAMPLE:
+        return embeddings
+    rng = np.random.default_rng(seed)
+    return embeddings[np.sort(rng.choice(len(embeddings), TRAINING_SAMPLE, replace=False))]
+
+
+def _quantize_rows(values):
+    # Symmetric per-row int8: one float32 scale per vector.
+    scale = np.abs(values).max(axis=1) / 127.0
+    scale[scale == 0] = 1.0
+    codes = np.clip(np.round(values / scale[:, None]), -127, 127).astype(np.int8)
+    return codes, scale.astype(np.float32)
+
+
+class Float32Codec:
+    # Uncompressed reference; useful as the baseline in fidelity reports.
+    codec = 'float32'
+    # Codecs that learn from the data (PCA, PQ) need a training sample
+    # before they can encode.
+    needs_training = False
+
+    def __init__(self):
+        self.dim = None
+
+    def params(self):
+        return {}
+
+    def fit(self, embeddings):
+        self.dim = np.shape(embeddings)[1]
+        return self
+
+    def encode(self, embeddings):
+        return {'values': _normalize(embeddings)}
+
+    def decode(self, codes, rows):
+        # Rows are renormalized after reconstruction, so scores computed on
+        # codes are cosines, the same as the exported similarity matrix.
+        return _normalize(self._reconstruct(codes, rows))
+
+    def _reconstruct(self, codes, rows):
+        return np.asarray(codes['values'][rows], dtype=np.float32)
+
+    def num_codes(self, codes):
+        return len(next(iter(codes.values())))
+
+    def nbytes(self, codes):
+        return sum(array.nbytes for array in codes.values())
+
+    def model_nbytes(self):
+        return 0
+
+
+class Float16Codec(Float32Codec):
+    codec = 'float16'
+
+    def encode(self, embeddings):
+        return {'values': _normalize(embeddings).astype(np.float16)}
+
+
+class Int8Codec(Float32Codec):
+    codec = 'int8'
+
+    def encode(self, embeddings):
+        values, scale = _quantize_rows(_normalize(embeddings))
+        return {'values': values, 'scale': scale}
+
+    def _reconstruct(self, codes, rows):
+        return codes['values'][rows].astype(np.float32) * codes['scale'][rows, None]
+
+
+class PCACodec(Float32Codec):
+    # Projects onto the top principal directions of the (uncentered) second
+    # moment, which best preserves inner products for a given dimension.
+    codec = 'pca'
+    quantize = False
+    needs_training = True
+
+    def __init__(self, n_components=128):
+        super().__init__()
+        self.n_components = n_components
+        self.components = None
+
+    def params(self):
+        return {'n_components': self.n_components}
+
+    def fit(self, embeddings):
+        embeddings = _normalize(embeddings)
+        self.dim = embeddings.shape[1]
+        sample = _training_sample(embeddings)
+        _, _, vt = np.linalg.svd(sample, full_matrices=False)
+        self.components = np.ascontiguousarray(vt[:min(self.n_components, len(vt))].T, dtype=np.float32)
+        return self
+
+    def _project(self, embeddings):
+        return _normalize(embeddings) @ self.components
+
+    def encode(self, embeddings):
+        projected = self._project(embeddings)
+        if self.quantize:
+            values, scale = _quantize_rows(projected)
+            return {'values': values, 'scale': scale}
+        return {'values': projected}
+
+    def _reconstruct(self, codes, rows):
+        # Vectors stay in the reduced space; once renormalized, inner
+        # products there approximate the original cosines.
+        if self.quantize:
+            return codes['values'][rows].astype(np.float32) * codes['scale'][rows, None]
+        return np.asarray(codes['values'][rows], dtype=np.float32)
+
+    def model_nbytes(self):
+        return self.components.nbytes if self.components is not None else 0
+
+
+class PCAInt8Codec(PCACodec):
+    codec = 'pca_int8'
+    quantize = True
+
+
+class PQCodec(Float32Codec):
+    # Product quantization: the vector is split into num_subspaces chunks and
+    # each chunk is replaced by the uint8 id of its nearest k-means centroid.
+    codec = 'pq'
+    needs_training = True
+
+    def __init__(self, num_subspaces=128, num_centroids=256, iterations=15, seed=0):
+        super().__init__()
+        if num_centroids > 256:
+            raise ValueError("num_centroids must be at most 256 for uint8 codes")
+        self.num_subspaces = num_subspaces
+        self.num_centroids = num_centroids
+        self.iterations = iterations
+        self.seed = seed
+        self.centroids = None
+
+    def params(self):
+        return {'num_subspaces': self.num_subspaces, 'num_centroids': self.num_centroids,
+                'iterations': self.iterations, 'seed': self.seed}
+
+    def _split(self, embeddings):
+        return embeddings.reshape(len(embeddings), self.num_subspaces, -1)
+
+    def fit(self, embeddings):
+        embeddings = _normalize(embeddings)
+        self.dim = embeddings.shape[1]
+        if self.dim % self.num_subspaces:
+            raise ValueError(f"dim {self.dim} is not divisible by num_subspaces {self.num_subspaces}")
+        sample = self._split(_training_sample(embeddings, self.seed))
+        k = min(self.num_centroids, len(sample))
+        rng = np.random.default_rng(self.seed)
+
+        self.centroids = np.empty((self.num_subspaces, k, sample.shape[2]), dtype=np.float32)
+        for m in range(self.num_subspaces):
+            points = np.ascontiguousarray(sample[:, m])
+            centroids = points[rng.choice(len(points), k, replace=False)].copy()
+            for _ in range(self.iterations):
+                assignment = self._nearest(points, centroids)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assignment, points)
+                counts = np.bincount(assignment, minlength=k)
+                filled = counts > 0
+                centroids[filled] = sums[filled] / counts[filled, None]
+            self.centroids[m] = centroids
+        return self
+
+    @staticmethod
+    def _nearest(points, centroids):
+        # argmin ||p - c||^2 == argmax (p.c - ||c||^2 / 2)
+        scores = points @ centroids.T - 0.5 * np.sum(centroids * centroids, axis=1)
+        return np.argmax(scores, axis=1)
+
+    def encode(self, embeddings, block_size=8192):
+        embeddings = _normalize(embeddings)
+        codes = np.empty((len(embeddings), self.num_subspaces), dtype=np.uint8)
+        for start in range(0, len(embeddings), block_size):
+            chunks = self._split(embeddings[start:start + block_size])
+            for m in range(self.num_subspaces):
+                codes[start:start + len(chunks), m] = self._nearest(chunks[:, m], self.centroids[m])
+        return {'values': codes}
+
+    def _reconstruct(self, codes, rows):
+        values = codes['values'][rows]
+        subspaces = np.arange(self.num_subspaces)
+        return self.centroids[subspaces, values].reshape(len(values), -1)
+
+    def model_nbytes(self):
+        return self.centroids.nbytes if self.centroids is not None else 0
+
+
+EMBEDDING_CODECS = {
+    'float32': Float32Codec,
+    'float16': Float16Codec,
+    'int8': Int8Codec,
+    'pca': PCACodec,
+    'pca_int8': PCAInt8Codec,
+    'pq': PQCodec,
+}
+
+
+def create_codec(codec, **params):
+    if codec not in EMBEDDING_CODECS:
+        raise ValueError(f"Unknown embedding codec '{codec}'. Choose from: {', '.join(sorted(EMBEDDING_CODECS))}")
+    return EMBEDDING_CODECS[codec](**params)
+
+
+class CompressedEmbeddings:
+    # Row-aligned codes plus the codec that decodes them; stands in for the
+    # float32 embedding matrix once a run is compressed.
+    def __init__(self, codec, codes):
+        self.codec = codec
+        self.codes = codes
+
+    def __len__(self):
+        return self.codec.num_codes(self.codes)
+
+    @property
+    def nbytes(self):
+        return self.codec.nbytes(self.codes)
+
+    def take(self, rows):
+        return CompressedEmbeddings(self.codec, {name: array[rows] for name, array in self.codes.items()})
+
+    def decode(self):
+        return self.codec.decode(self.codes, slice(None))
+
+
+class StreamingEncoder:
+    # Encodes embeddings batch by batch so the float32 matrix never exists in
+    # full. Trained codecs buffer the first fit_rows rows, fit on them, and
+    # encode everything after on arrival; peak float32 memory is that sample.
+    def __init__(self, codec, fit_rows=TRAINING_SAMPLE):
+        self.codec = codec
+        self.fit_rows = fit_rows
+        self._buffer = []
+        self._buffered_rows = 0
+        self._fitted = False
+        self._codes = []
+
+    def append(self, embeddings):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if self._fitted:
+            self._codes.append(self.codec.encode(embeddings))
+            return
+        self._buffer.append(embeddings)
+        self._buffered_rows += len(embeddings)
+        if not self.codec.needs_training or self._buffered_rows >= self.fit_rows:
+            self._fit()
+
+    def _fit(self):
+        sample = np.concatenate(self._buffer)
+        self.codec.fit(sample)
+        self._fitted = True
+        self._codes.append(self.codec.encode(sample))
+        self._buffer = []
+        self._buffered_rows = 0
+
+    def finish(self):
+        if not self._fitted and self._buffer:
+            self._fit()
+        if not self._codes:
+            return None
+        names = self._codes[0].keys()
+        return CompressedEmbeddings(self.codec, {name: np.concatenate([codes[name] for codes in self._codes])
+                                                 for name in names})
+
+
+def _empty_pairs():
+    return np.array([], dtype=np.int64), np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+
+
+def _serial_blocks(fn, n, block_size):
+    return [fn(start) for start in range(0, n, block_size)]
+
+
+def compressed_pairs(codec, codes, threshold, block_size=1024, map_blocks=None):
+    # Self-join on codes: (rows, cols, scores) for every i < j above the
+    # threshold, in row-major order, like SimilarityCalculator.find_pairs_above_threshold.
+    # map_blocks(fn, n) lets the caller run row blocks on its own thread pool.
+    n = codec.num_codes(codes)
+
+    def pairs_in_block(start):
+        end = min(start + block_size, n)
+        queries = codec.decode(codes, slice(start, end))
+        block_rows, block_cols, block_scores = [], [], []
+        for col_start in range(start, n, block_size):
+            col_end = min(col_start + block_size, n)
+            scores = queries @ codec.decode(codes, slice(col_start, col_end)).T
+            local_rows, local_cols = np.nonzero(scores > threshold)
+            keep = local_cols + col_start > local_rows + start
+            local_rows, local_cols = local_rows[keep], local_cols[keep]
+            block_rows.append(local_rows + start)
+            block_cols.append(local_cols + col_start)
+            block_scores.append(scores[local_rows, local_cols])
+        rows, cols, scores = np.concatenate(block_rows), np.concatenate(block_cols), np.concatenate(block_scores)
+        order = np.lexsort((cols, rows))
+        return rows[order], cols[order], scores[order].astype(np.float32)
+
+    blocks = map_blocks(pairs_in_block, n) if map_blocks else _serial_blocks(pairs_in_block, n, block_size)
+    if not blocks:
+        return _empty_pairs()
+    rows, cols, scores = zip(*blocks)
+    return np.concatenate(rows), np.concatenate(cols), np.concatenate(scores)
+
+
+def compressed_neighbors(codec, query_codes, base_codes, threshold, block_size=1024):
+    # Cross join: (query_ids, base_ids, scores) above the threshold.
+    num_queries, num_base = codec.num_codes(query_codes), codec.num_codes(base_codes)
+    query_ids, base_ids, all_scores = [], [], []
+    for start in range(0, num_queries, block_size):
+        queries = codec.decode(query_codes, slice(start, start + block_size))
+        for col_start in range(0, num_base, block_size):
+            scores = queries @ codec.decode(base_codes, slice(col_start, col_start + block_size)).T
+            local_rows, local_cols = np.nonzero(scores > threshold)
+            query_ids.append(local_rows + start)
+            base_ids.append(local_cols + col_start)
+            all_scores.append(scores[local_rows, local_cols])
+    if not query_ids:
+        return _empty_pairs()
+    return np.concatenate(query_ids), np.concatenate(base_ids), np.concatenate(all_scores).astype(np.float32)
+
+
+def compression_fidelity_report(embeddings, threshold, codecs=None, block_size=1024):
+    # Duplicate-pair recall/precision of each codec against full precision,
+    # plus memory and timing.
+    embeddings = _normalize(embeddings)
+    reference = Float32Codec().fit(embeddings)
+    reference_codes = reference.encode(embeddings)
+    start_time = time.perf_counter()
+    rows, cols, _ = compressed_pairs(reference, reference_codes, threshold, block_size)
+    reference_seconds = time.perf_counter() - start_time
+    exact = set(zip(rows.tolist(), cols.tolist()))
+    full_bytes = reference.nbytes(reference_codes)
+
+    report = []
+    for name in codecs or [c for c in EMBEDDING_CODECS if c != 'float32']:
+        codec = create_codec(name)
+        start_time = time.perf_counter()
+        try:
+            codec.fit(embeddings)
+            codes = codec.encode(embeddings)
+        except ValueError as e:
+            report.append({'codec': name, 'error': str(e)})
+            continue
+        encode_seconds = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        rows, cols, _ = compressed_pairs(codec, codes, threshold, block_size)
+        search_seconds = time.perf_counter() - start_time
+        found = set(zip(rows.tolist(), cols.tolist()))
+        true_positives = len(exact & found)
+
+        nbytes = codec.nbytes(codes)
+        report.append({
+            'codec': name,
+            'params': codec.params(),
+            'bytes_per_vector': nbytes / max(1, len(embeddings)),
+            'compression': full_bytes / nbytes if nbytes else float('inf'),
+            'model_bytes': codec.model_nbytes(),
+            'exact_pairs': len(exact),
+            'found_pairs': len(found),
+            'recall': true_positives / len(exact) if exact else 1.0,
+            'precision': true_positives / len(found) if found else 1.0,
+            'encode_seconds': encode_seconds,
+            'search_seconds': search_seconds,
+            'reference_search_seconds': reference_seconds,
+        })
+    return report
+
+
+def format_fidelity_report(report):
+    lines = [f"{'codec':<10} {'bytes/vec':>10} {'ratio':>7} {'recall':>8} {'precision':>10} {'search s':>9}"]
+    for row in report:
+        if 'error' in row:
+            lines.append(f"{row['codec']:<10} error: {row['error']}")
+            continue
+        lines.append(f"{row['codec']:<10} {row['bytes_per_vector']:>10.1f} {row['compression']:>6.1f}x "
+                     f"{row['recall']:>8.4f} {row['precision']:>10.4f} {row['search_seconds']:>9.3f}")
+    return "\n".join(lines)
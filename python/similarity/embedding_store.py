@@ -0,0 +1,69 @@
+import os
+import tempfile
+import numpy as np
+
+
+class EmbeddingStore:
+    # Append-only embedding buffer that stays in RAM up to a byte budget and
+    # then spills every row to a temporary file read back in chunks.
+    def __init__(self, dim, max_memory_bytes=None, spill_dir=None):
+        self.dim = dim
+        self.max_memory_bytes = max_memory_bytes
+        self.spill_dir = spill_dir
+        self._chunks = []
+        self._count = 0
+        self._file = None
+        self._spill_path = None
+    
+    def __len__(self):
+        return self._count
+    
+    @property
+    def spilled(self):
+        return self._file is not None
+    
+    def append(self, embeddings):
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        self._count += len(embeddings)
+        
+        if self._file is None:
+            self._chunks.append(embeddings)
+            if self.max_memory_bytes is not None and self._count * self.dim * 4 > self.max_memory_bytes:
+                self._spill()
+        else:
+            self._file.write(embeddings.tobytes())
+            self._file.flush()
+    
+    def _spill(self):
+        fd, self._spill_path = tempfile.mkstemp(prefix='embeddings-', suffix='.f32', dir=self.spill_dir)
+        self._file = os.fdopen(fd, 'wb')
+        for chunk in self._chunks:
+            self._file.write(chunk.tobytes())
+        self._file.flush()
+        self._chunks = []
+    
+    def iter_chunks(self, chunk_rows):
+        # Yields (start_row, embeddings) covering every stored row in order.
+        if self._file is None:
+            start = 0
+            for chunk in self._chunks:
+                for offset in range(0, len(chunk), chunk_rows):
+                    yield start + offset, chunk[offset:offset + chunk_rows]
+                start += len(chunk)
+            return
+        
+        if self._count == 0:
+            return
+        rows = np.memmap(self._spill_path, dtype=np.float32, mode='r', shape=(self._count, self.dim))
+        for start in range(0, self._count, chunk_rows):
+            yield start, np.array(rows[start:start + chunk_rows])
+        del rows
+    
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            os.remove(self._spill_path)
+            self._file = None
+            self._spill_path = None
+        self._chunks = []
+        self._count = 0
@@ -1,9 +1,46 @@
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Tuple
+from similarity.similarity_graph import SimilarityGraph
+from similarity.ann_index import create_index, measure_recall
+from similarity.blocking import time_blocked_pairs, geo_blocked_pairs
+from similarity.clustering import CLUSTERING_METHODS, cluster_labels, clusters_from_labels
+from similarity.embedding_compression import create_codec, compressed_pairs, CompressedEmbeddings
+from profiling.instrumentation import NULL_INSTRUMENTATION
 
 class SimilarityCalculator:
-    def __init__(self, similarity_threshold=0.85):
+    def __init__(self, similarity_threshold=0.85, block_size=1024, num_threads=1,
+                 index_backend='exact', index_params=None, instrumentation=None,
+                 blocking=None, time_window_seconds=600, geo_cell_degrees=0.01,
+                 clustering_method='leader', max_cluster_size=None,
+                 embedding_codec=None, codec_params=None):
+        if blocking not in (None, 'time', 'geo'):
+            raise ValueError("blocking must be None, 'time' or 'geo'")
+        if clustering_method not in CLUSTERING_METHODS:
+            raise ValueError(f"clustering_method must be one of: {', '.join(CLUSTERING_METHODS)}")
         self.similarity_threshold = similarity_threshold
+        self.block_size = block_size
+        self.index_backend = index_backend
+        self.index_params = index_params or {}
+        self.index = None
+        self.instrumentation = instrumentation or NULL_INSTRUMENTATION
+        self.blocking = blocking
+        self.time_window_seconds = time_window_seconds
+        self.geo_cell_degrees = geo_cell_degrees
+        self.clustering_method = clustering_method
+        self.max_cluster_size = max_cluster_size
+        # With a codec, the exact graph is built from compressed codes
+        # (float16 / int8 / PCA / PQ) instead of float32 embeddings.
+        if embedding_codec is not None:
+            create_codec(embedding_codec, **(codec_params or {}))
+            if blocking or index_backend != 'exact':
+                raise ValueError("embedding_codec only works with exact search; "
+                                 "it cannot be combined with blocking or an approximate index_backend")
+        self.embedding_codec = embedding_codec
+        self.codec_params = codec_params or {}
+        # numpy's BLAS already multithreads each block product; extra threads
+        # help when BLAS is single-threaded or blocks are small.
+        self.num_threads = num_threads
     
     def cosine_similarity(self, embedding1, embedding2):
         dot_product = np.dot(embedding1, embedding2)
@@ -15,60 +52,180 @@ class SimilarityCalculator:
         
         return dot_product / (norm1 * norm2)
     
+    def normalize(self, embeddings):
+        if isinstance(embeddings, CompressedEmbeddings):
+            embeddings = embeddings.decode()
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return embeddings / norms
+    
+    def _block_starts(self, n):
+        return range(0, n, max(1, self.block_size))
+    
+    def _map_blocks(self, fn, n):
+        starts = self._block_starts(n)
+        if self.num_threads and self.num_threads > 1:
+            with ThreadPoolExecutor(max_workers=self.num_threads) as executor:
+                return list(executor.map(fn, starts))
+        return [fn(start) for start in starts]
+    
     def compute_similarity_matrix(self, embeddings):
-        n = len(embeddings)
-        similarity_matrix = np.zeros((n, n))
+        normalized = self.normalize(embeddings)
+        n = len(normalized)
+        similarity_matrix = np.empty((n, n), dtype=np.float32)
+        
+        def fill_block(start):
+            end = min(start + self.block_size, n)
+            np.matmul(normalized[start:end], normalized.T, out=similarity_matrix[start:end])
         
-        for i in range(n):
-            for j in range(i, n):
-                if i == j:
-                    similarity_matrix[i][j] = 1.0
-                else:
-                    sim = self.cosine_similarity(embeddings[i], embeddings[j])
-                    similarity_matrix[i][j] = sim
-                    similarity_matrix[j][i] = sim
+        self._map_blocks(fill_block, n)
+        np.fill_diagonal(similarity_matrix, 1.0)
         
         return similarity_matrix
     
-    def find_duplicate_pairs(self, embeddings, image_paths):
-        similarity_matrix = self.compute_similarity_matrix(embeddings)
-        duplicate_pairs = []
+    def find_pairs_above_threshold(self, embeddings) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Returns (rows, cols, scores) for every i < j above the threshold, in
+        # row-major order, without materializing the n x n matrix.
+        normalized = self.normalize(embeddings)
+        n = len(normalized)
         
-        n = len(embeddings)
-        for i in range(n):
-            for j in range(i + 1, n):
-                if similarity_matrix[i][j] > self.similarity_threshold:
-                    duplicate_pairs.append({
-                        'image1': image_paths[i],
-                        'image2': image_paths[j],
-                        'similarity': similarity_matrix[i][j],
-                        'index1': i,
-                        'index2': j
-                    })
+        def pairs_in_block(start):
+            end = min(start + self.block_size, n)
+            # Only columns >= start can hold the upper triangle of this block.
+            scores = normalized[start:end] @ normalized[start:].T
+            local_rows, local_cols = np.nonzero(scores > self.similarity_threshold)
+            keep = local_cols > local_rows
+            local_rows, local_cols = local_rows[keep], local_cols[keep]
+            return (local_rows + start, local_cols + start,
+                    scores[local_rows, local_cols])
         
-        return duplicate_pairs, similarity_matrix
+        blocks = self._map_blocks(pairs_in_block, n)
+        if not blocks:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+        
+        rows, cols, scores = zip(*blocks)
+        return np.concatenate(rows), np.concatenate(cols), np.concatenate(scores)
+    
+    def create_codec(self):
+        return create_codec(self.embedding_codec, **self.codec_params)
+    
+    def compress(self, embeddings) -> CompressedEmbeddings:
+        codec = self.create_codec().fit(embeddings)
+        return CompressedEmbeddings(codec, codec.encode(embeddings))
     
-    def greedy_clustering(self, embeddings, image_paths):
+    def find_pairs_compressed(self, embeddings) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Same contract as find_pairs_above_threshold, scored on codes.
+        # float32 input is encoded first (no memory saved, same scores).
+        if not isinstance(embeddings, CompressedEmbeddings):
+            with self.instrumentation.stage('similarity.compress', codec=self.embedding_codec, n=len(embeddings)):
+                embeddings = self.compress(embeddings)
+        return compressed_pairs(embeddings.codec, embeddings.codes, self.similarity_threshold, self.block_size,
+                                map_blocks=self._map_blocks)
+    
+    def find_neighbors(self, query_embeddings, base_embeddings) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Returns (query_ids, base_ids, scores) for every cross pair above the
+        # threshold, processing the queries in row blocks.
+        with self.instrumentation.stage('similarity.neighbors', queries=len(query_embeddings)):
+            return self._find_neighbors(query_embeddings, base_embeddings)
+    
+    def _find_neighbors(self, query_embeddings, base_embeddings):
+        queries = self.normalize(query_embeddings)
+        base = self.normalize(base_embeddings)
+        
+        def neighbors_in_block(start):
+            scores = queries[start:start + self.block_size] @ base.T
+            local_rows, cols = np.nonzero(scores > self.similarity_threshold)
+            return local_rows + start, cols, scores[local_rows, cols]
+        
+        blocks = self._map_blocks(neighbors_in_block, len(queries)) if len(base) else []
+        if not blocks:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+        
+        rows, cols, scores = zip(*blocks)
+        return np.concatenate(rows), np.concatenate(cols), np.concatenate(scores)
+    
+    def build_index(self, embeddings):
+        index = create_index(self.index_backend, np.shape(embeddings)[1], **self.index_params)
+        index.add(self.normalize(embeddings))
+        self.index = index
+        return index
+    
+    def measure_index_recall(self, embeddings=None):
+        if embeddings is not None:
+            self.build_index(embeddings)
+        if self.index is None:
+            raise ValueError("No index has been built; pass embeddings to build one")
+        index = self.index
+        return measure_recall(index, self.similarity_threshold)
+    
+    def find_pairs_blocked(self, embeddings, metadata) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Compares only photos taken close together in time or space.
+        # metadata holds one dict per embedding with 'capture_time' and 'gps'.
+        normalized = self.normalize(embeddings)
+        if self.blocking == 'time':
+            capture_times = [m.get('capture_time') if m.get('capture_time') is not None else np.nan
+                             for m in metadata]
+            rows, cols, scores = time_blocked_pairs(normalized, capture_times, self.time_window_seconds,
+                                                    self.similarity_threshold, self.block_size)
+        else:
+            coordinates = [m.get('gps') or (np.nan, np.nan) for m in metadata]
+            rows, cols, scores = geo_blocked_pairs(normalized, coordinates, self.geo_cell_degrees,
+                                                   self.similarity_threshold, self.block_size)
+        return np.minimum(rows, cols), np.maximum(rows, cols), scores
+    
+    def build_similarity_graph(self, embeddings, metadata=None) -> SimilarityGraph:
+        with self.instrumentation.stage('similarity.graph', backend=self.index_backend, n=len(embeddings)):
+            if self.blocking and metadata is not None:
+                rows, cols, scores = self.find_pairs_blocked(embeddings, metadata)
+            elif self.index_backend == 'exact' and self.embedding_codec:
+                rows, cols, scores = self.find_pairs_compressed(embeddings)
+            elif self.index_backend == 'exact':
+                rows, cols, scores = self.find_pairs_above_threshold(embeddings)
+            else:
+                rows, cols, scores = self.build_index(embeddings).search_pairs(self.similarity_threshold)
+            return SimilarityGraph(len(embeddings), rows, cols, scores)
+    
+    def duplicate_pairs_from_graph(self, graph: SimilarityGraph, image_paths):
+        return [
+            {
+                'image1': image_paths[i],
+                'image2': image_paths[j],
+                'similarity': score,
+                'index1': i,
+                'index2': j
+            }
+            for i, j, score in graph.pairs()
+        ]
+    
+    def find_duplicate_pairs(self, embeddings, image_paths):
         similarity_matrix = self.compute_similarity_matrix(embeddings)
-        n = len(embeddings)
-        visited = [False] * n
-        clusters = []
         
-        for i in range(n):
-            if not visited[i]:
-                cluster = [i]
-                visited[i] = True
-                
-                for j in range(i + 1, n):
-                    if not visited[j] and similarity_matrix[i][j] > self.similarity_threshold:
-                        cluster.append(j)
-                        visited[j] = True
-                
-                cluster_paths = [image_paths[idx] for idx in cluster]
-                clusters.append({
-                    'indices': cluster,
-                    'paths': cluster_paths,
-                    'representative': image_paths[cluster[0]]
-                })
+        rows, cols = np.nonzero(np.triu(similarity_matrix > self.similarity_threshold, k=1))
+        duplicate_pairs = [
+            {
+                'image1': image_paths[i],
+                'image2': image_paths[j],
+                'similarity': float(similarity_matrix[i, j]),
+                'index1': int(i),
+                'index2': int(j)
+            }
+            for i, j in zip(rows.tolist(), cols.tolist())
+        ]
         
-        return clusters
\ No newline at end of file
+        return duplicate_pairs, similarity_matrix
+    
+    def cluster(self, embeddings, image_paths, graph: SimilarityGraph = None, quality=None):
+        if graph is None:
+            graph = self.build_similarity_graph(embeddings)
+        with self.instrumentation.stage('similarity.clustering', edges=graph.num_edges,
+                                        method=self.clustering_method):
+            labels = cluster_labels(graph, self.clustering_method, self.similarity_threshold,
+                                    self.max_cluster_size)
+            return clusters_from_labels(labels, image_paths, quality)
+    
+    def greedy_clustering(self, embeddings, image_paths, graph: SimilarityGraph = None):
+        if graph is None:
+            graph = self.build_similarity_graph(embeddings)
+        with self.instrumentation.stage('similarity.clustering', edges=graph.num_edges, method='leader'):
+            return clusters_from_labels(cluster_labels(graph, 'leader'), image_paths)
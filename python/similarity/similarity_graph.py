@@ -0,0 +1,33 @@
+import numpy as np
+
+
+class SimilarityGraph:
+    # Above-threshold pairs i < j in CSR form: the neighbors of row i are
+    # cols[indptr[i]:indptr[i + 1]], sorted ascending.
+    def __init__(self, num_nodes, rows, cols, scores):
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        scores = np.asarray(scores, dtype=np.float32)
+        
+        order = np.lexsort((cols, rows))
+        self.num_nodes = int(num_nodes)
+        self.rows = rows[order]
+        self.cols = cols[order]
+        self.scores = scores[order]
+        
+        self.indptr = np.zeros(self.num_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.rows, minlength=self.num_nodes), out=self.indptr[1:])
+    
+    @property
+    def num_edges(self):
+        return len(self.rows)
+    
+    def neighbors(self, i):
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return self.cols[start:end], self.scores[start:end]
+    
+    def pairs(self):
+        return zip(self.rows.tolist(), self.cols.tolist(), self.scores.tolist())
+    
+    def nbytes(self):
+        return self.rows.nbytes + self.cols.nbytes + self.scores.nbytes + self.indptr.nbytes
@@ -0,0 +1,40 @@
+import os
+import shutil
+import numpy as np
+from PIL import Image
+
+
+class StubModel:
+    # Deterministic per image (independent of batch composition), like a
+    # batch-invariant model.
+    embedding_dim = 48
+
+    def __init__(self):
+        self.projection = np.random.default_rng(0).normal(size=(4 * 4 * 3, self.embedding_dim))
+
+    def get_embeddings_batch(self, images):
+        x = np.asarray(images, dtype=np.float32)
+        n, h, w = x.shape[:3]
+        x = x[:, :h // 4 * 4, :w // 4 * 4].reshape(n, 4, h // 4, 4, w // 4, 3).mean((2, 4)).reshape(n, -1)
+        x = x - x.mean(axis=1, keepdims=True)
+        embeddings = (x @ self.projection).astype(np.float32)
+        return embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+
+    def fingerprint(self):
+        return 'stub'
+
+
+def make_library(root):
+    # Shards of 4 (batch_size) in sorted order: a_* (scenes and near
+    # copies), b_* (all corrupt, one whole shard), c_* (exact copies of a_*
+    # files, so their hash leaders live in another shard).
+    rng = np.random.default_rng(1)
+    os.makedirs(root)
+    for i in range(8):
+        scene = Image.fromarray((rng.random((8, 8, 3)) * 255).astype(np.uint8)).resize((160, 120), Image.BILINEAR)
+        scene.save(os.path.join(root, f"a_{i:02d}.jpg"), quality=90)
+    for i in range(4):
+        with open(os.path.join(root, f"b_{i:02d}.jpg"), 'wb') as f:
+            f.write(b'not a jpeg')
+    for i in range(3):
+        shutil.copy(os.path.join(root, f"a_{i * 2:02d}.jpg"), os.path.join(root, f"c_{i:02d}.jpg"))
@@ -0,0 +1,26 @@
+from helpers import StubModel, make_library
+from models.embedding_cache import EmbeddingCache
+from photo_curator import PhotoCurator
+
+
+def test_cancelled_stream_keeps_computed_embeddings(tmp_path, capsys):
+    library = str(tmp_path / 'library')
+    cache_dir = str(tmp_path / 'cache')
+    make_library(library)
+    model = StubModel()
+
+    curator = PhotoCurator(model=model, batch_size=4, cache_dir=cache_dir)
+    events = curator.iter_process_photos(library)
+    for event in events:
+        if event['type'] == 'progress':
+            break
+    events.close()
+    curator.close()
+    assert len(EmbeddingCache(cache_dir, curator.cache_fingerprint())) == 4
+
+    capsys.readouterr()
+    curator = PhotoCurator(model=model, batch_size=4, cache_dir=cache_dir)
+    results = curator.process_photos(library)
+    curator.close()
+    assert "Embedding cache: 4 hits, 11 misses" in capsys.readouterr().out
+    assert results['processed_images'] == 11
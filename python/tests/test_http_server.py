@@ -0,0 +1,46 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+import pytest
+from helpers import StubModel, make_library
+from service.http_server import EmbeddingService, create_server
+
+
+@pytest.fixture
+def service_url():
+    service = EmbeddingService(StubModel(), max_batch_size=4, max_latency_ms=1.0)
+    server = create_server(service, port=0, quiet=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}", service
+    server.shutdown()
+    server.server_close()
+    service.close()
+
+
+def post(url, payload):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode(),
+                                     headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+
+@pytest.mark.parametrize('options', [{'clustering_method': 'bogus'}, {'blocking': 'weekday'},
+                                     {'hash_max_distance': 64}])
+def test_invalid_curate_options_are_client_errors(tmp_path, service_url, options):
+    url, service = service_url
+    library = str(tmp_path / 'library')
+    make_library(library)
+
+    status, body = post(url + '/curate', {'folder': library, **options})
+    assert status == 400
+    assert 'Invalid curation options' in body['error']
+    assert service.metrics.counters['errors'] == 0
+
+    status, body = post(url + '/curate', {'folder': library})
+    assert status == 200
+    assert body['processed_images'] == 11
@@ -0,0 +1,92 @@
+import os
+import json
+import pytest
+from helpers import StubModel, make_library
+from photo_curator import PhotoCurator
+from sharding.shard_runner import create_plan, run_shards, create_curator, merge_shards, shard_dir, DONE_FILE
+
+SETTINGS = {'similarity_threshold': 0.8, 'batch_size': 4}
+
+
+def comparable(results):
+    return {k: v for k, v in results.items() if k not in ('processing_time_seconds', 'avg_time_per_image')}
+
+
+@pytest.mark.parametrize('options', [{}, {'hash_prefilter': True}, {'hash_prefilter': True, 'hash_max_distance': 4},
+                                     {'clustering_method': 'components'}])
+def test_sharded_run_matches_single_process(tmp_path, options):
+    library = str(tmp_path / 'library')
+    plan_dir = str(tmp_path / 'plan')
+    make_library(library)
+    settings = {**SETTINGS, **options}
+    model = StubModel()
+
+    curator = PhotoCurator(model=model, **settings)
+    single = curator.process_photos(library)
+    curator.close()
+
+    plan = create_plan(plan_dir, library, 4, settings)
+    assert len(plan['shards']) == 4
+    completed = run_shards(plan_dir, runtime_settings={'model': model})
+    assert len(completed) == 4
+
+    # The all-corrupt shard is still marked done, so a restart skips it.
+    corrupt = [done for done in completed if done['processed_images'] == 0]
+    assert len(corrupt) == 1
+    with open(os.path.join(shard_dir(plan_dir, corrupt[0]['shard']), DONE_FILE)) as f:
+        assert json.load(f)['images'] == 4
+    assert run_shards(plan_dir, runtime_settings={'model': model}) == []
+
+    merger = create_curator(plan, model=model)
+    merged = merge_shards(merger, plan_dir, plan)
+    merger.close()
+
+    assert comparable(merged) == comparable(single)
+    assert single['duplicate_pairs']
+
+
+def test_restart_redoes_only_unfinished_shards(tmp_path):
+    library = str(tmp_path / 'library')
+    plan_dir = str(tmp_path / 'plan')
+    make_library(library)
+    model = StubModel()
+
+    create_plan(plan_dir, library, 4, SETTINGS)
+    assert len(run_shards(plan_dir, [0, 2], runtime_settings={'model': model})) == 2
+    # Leftovers of a crashed shard are discarded, not merged.
+    os.makedirs(shard_dir(plan_dir, 1) + '.tmp')
+    assert sorted(done['shard'] for done in run_shards(plan_dir, runtime_settings={'model': model})) == [1, 3]
+    assert not os.path.exists(shard_dir(plan_dir, 1) + '.tmp')
+
+
+@pytest.mark.parametrize('hash_max_distance', [0, 4])
+def test_follower_stands_in_for_undecodable_leader(tmp_path, monkeypatch, hash_max_distance):
+    # a_00 hashes but fails to decode; its copy c_00 (in another shard) must
+    # take its place rather than vanish with it.
+    from preprocessing.image_processor import ImageProcessor
+    open_image = ImageProcessor.open_image
+
+    def failing_open_image(self, image_path):
+        if os.path.basename(image_path) == 'a_00.jpg':
+            raise OSError('simulated decode failure')
+        return open_image(self, image_path)
+
+    monkeypatch.setattr(ImageProcessor, 'open_image', failing_open_image)
+    library = str(tmp_path / 'library')
+    plan_dir = str(tmp_path / 'plan')
+    make_library(library)
+    settings = {**SETTINGS, 'hash_prefilter': True, 'hash_max_distance': hash_max_distance}
+    model = StubModel()
+
+    curator = PhotoCurator(model=model, num_workers=1, **settings)
+    single = curator.process_photos(library)
+    curator.close()
+    assert single['processed_images'] == 10
+    assert any(os.path.join(library, 'c_00.jpg') in cluster['paths'] for cluster in single['clusters'])
+
+    plan = create_plan(plan_dir, library, 4, settings)
+    run_shards(plan_dir, runtime_settings={'model': model, 'num_workers': 1})
+    merger = create_curator(plan, model=model, num_workers=1)
+    merged = merge_shards(merger, plan_dir, plan)
+    merger.close()
+    assert comparable(merged) == comparable(single)
@@ -0,0 +1,36 @@
+import os
+import shutil
+from helpers import StubModel, make_library
+from photo_curator import PhotoCurator
+
+
+def cluster_names(results):
+    return sorted(sorted(os.path.basename(path) for path in cluster['paths']) for cluster in results['clusters'])
+
+
+def test_edited_photo_is_reassigned(tmp_path):
+    library = str(tmp_path / 'library')
+    state_dir = str(tmp_path / 'state')
+    make_library(library)
+    curator = PhotoCurator(model=StubModel(), similarity_threshold=0.8, batch_size=4)
+
+    first = curator.update_library(library, state_dir)
+    assert ['a_01.jpg', 'a_05.jpg'] not in cluster_names(first)
+
+    unchanged = curator.update_library(library, state_dir)
+    assert (unchanged['new_images'], unchanged['changed_images'], unchanged['removed_images']) == (0, 0, 0)
+
+    # Re-exported under the same name: a_05 now shows the a_01 scene.
+    edited = os.path.join(library, 'a_05.jpg')
+    shutil.copy(os.path.join(library, 'a_01.jpg'), edited)
+    stat = os.stat(edited)
+    os.utime(edited, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    updated = curator.update_library(library, state_dir)
+    assert (updated['new_images'], updated['changed_images'], updated['removed_images']) == (0, 1, 0)
+    assert ['a_01.jpg', 'a_05.jpg'] in cluster_names(updated)
+    assert updated['processed_images'] == first['processed_images']
+
+    reloaded = curator.update_library(library, state_dir)
+    assert reloaded['changed_images'] == 0
+    assert cluster_names(reloaded) == cluster_names(updated)
+    curator.close()
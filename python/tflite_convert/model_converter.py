@@ -1,20 +1,75 @@
 import tensorflow as tf
 import numpy as np
 import os
+import time
+import shutil
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from typing import List, Tuple
 from models.mobilenet_similarity import MobileNetSimilarityModel
+from models.tflite_similarity import create_interpreter, quantize_input, dequantize_output
 from preprocessing.image_processor import ImageProcessor
-import glob
+from preprocessing.file_discovery import FileDiscovery
+from similarity.similarity_calculator import SimilarityCalculator
+
+
+def sample_paths(image_paths: List[str], num_samples: int) -> List[str]:
+    # Evenly spaced over the sorted library, so samples cover every folder
+    # rather than just the first one.
+    if len(image_paths) <= num_samples:
+        return list(image_paths)
+    picks = np.linspace(0, len(image_paths) - 1, num_samples).round().astype(int)
+    return [image_paths[i] for i in picks]
+
+
+def image_set_key(image_paths: List[str], *parts) -> str:
+    # Identifies a decoded image set: the files (with size and mtime, so
+    # edits invalidate it) plus whatever else shapes the tensors.
+    digest = hashlib.blake2b(digest_size=12)
+    digest.update(repr(parts).encode())
+    for path in image_paths:
+        stat = os.stat(path)
+        digest.update(f"{path}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+def _convert_variant(saved_model_path: str, output_path: str, data_folder: str, quantization_type: str,
+                     representative_path: str, test_image_path: str) -> tuple:
+    # Process-pool entry point: convert and verify one variant. Timing-
+    # sensitive steps stay in the parent so workers do not skew each other.
+    converter = TFLiteConverter()
+    representative_images = None
+    if quantization_type == "int8" and representative_path:
+        representative_images = np.load(representative_path, mmap_mode='r')
+    tflite_path, conversion_stats = converter.convert_to_tflite(
+        saved_model_path, output_path, data_folder, quantization_type,
+        representative_images=representative_images
+    )
+    verification_stats = None
+    if tflite_path:
+        verification_stats = converter.verify_tflite_model(tflite_path, test_image_path)
+    return tflite_path, conversion_stats, verification_stats
+
 
 class TFLiteConverter:
     def __init__(self, model_path: str = None):
         self.model_path = model_path
         self.processor = ImageProcessor()
-        
+    
+    def find_images(self, data_folder: str) -> List[str]:
+        return FileDiscovery().discover(data_folder)
+    
+    def load_images(self, image_paths: List[str]) -> Tuple[np.ndarray, List[str]]:
+        return self.processor.preprocess_batch(image_paths)
+    
     def create_representative_dataset(self, data_folder: str, num_samples: int = 100):
         print("Creating representative dataset for quantization...")
         
-        image_paths = glob.glob(os.path.join(data_folder, "*.jpeg"))[:num_samples]
+        # All supported formats, recursively: calibration ranges should see
+        # the same mix of sources as inference does.
+        image_paths = sample_paths(self.find_images(data_folder), num_samples)
+        print(f"Representative dataset: {len(image_paths)} images")
         
         def representative_data_gen():
             for path in image_paths:
@@ -24,11 +79,66 @@ class TFLiteConverter:
         
         return representative_data_gen
     
+    def representative_dataset_from_tensors(self, images: np.ndarray):
+        def representative_data_gen():
+            for i in range(len(images)):
+                yield [np.asarray(images[i:i + 1], dtype=np.float32)]
+        
+        return representative_data_gen
+    
+    def cached_image_tensors(self, image_paths: List[str], cache_dir: str, name: str,
+                             fingerprint: str, use_cache: bool = True) -> str:
+        # Decoded tensors are written once per (model, image set) and
+        # memory-mapped by later runs and by pool workers.
+        key = image_set_key(image_paths, fingerprint, self.processor.target_size)
+        path = os.path.join(cache_dir, f"{name}_{key}.npy")
+        if use_cache and os.path.exists(path):
+            print(f"Reusing cached {name} tensors: {path}")
+            return path
+        
+        os.makedirs(cache_dir, exist_ok=True)
+        images, _ = self.load_images(image_paths)
+        tmp_path = f"{path[:-len('.npy')]}.{os.getpid()}.tmp.npy"
+        np.save(tmp_path, np.asarray(images, dtype=np.float32))
+        os.replace(tmp_path, path)
+        print(f"Cached {len(images)} {name} tensors: {path}")
+        return path
+    
+    def export_saved_model(self, model: MobileNetSimilarityModel, saved_model_path: str,
+                           use_cache: bool = True) -> bool:
+        # The SavedModel is only re-exported when the model fingerprint changes.
+        fingerprint = model.fingerprint()
+        marker_path = saved_model_path + ".fingerprint"
+        if use_cache and os.path.isdir(saved_model_path) and os.path.exists(marker_path):
+            with open(marker_path) as f:
+                if f.read().strip() == fingerprint:
+                    print(f"Reusing exported SavedModel: {saved_model_path}")
+                    return False
+        
+        tmp_path = f"{saved_model_path}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        model.save_for_tflite(tmp_path)
+        shutil.rmtree(saved_model_path, ignore_errors=True)
+        os.replace(tmp_path, saved_model_path)
+        with open(marker_path, 'w') as f:
+            f.write(fingerprint)
+        return True
+    
+    def create_interpreter(self, tflite_path: str):
+        # Prefer XNNPACK; fall back to the reference kernels if it cannot
+        # prepare the graph.
+        try:
+            return create_interpreter(tflite_path, use_xnnpack=True), True
+        except (RuntimeError, ValueError) as e:
+            print(f"  XNNPACK unavailable for {os.path.basename(tflite_path)}: {e}")
+            return create_interpreter(tflite_path, use_xnnpack=False), False
+    
     def convert_to_tflite(self, 
                          saved_model_path: str,
                          output_path: str,
                          data_folder: str,
-                         quantization_type: str = "dynamic") -> Tuple[str, dict]:
+                         quantization_type: str = "dynamic",
+                         representative_images: np.ndarray = None) -> Tuple[str, dict]:
         
         print(f"Converting model to TFLite with {quantization_type} quantization...")
         
@@ -38,16 +148,17 @@ class TFLiteConverter:
             converter.optimizations = [tf.lite.Optimize.DEFAULT]
             
         elif quantization_type == "int8":
+            # Full-integer model: every op runs in int8 and the graph takes
+            # raw uint8 pixels and returns a uint8 embedding. Mixing in float
+            # builtins left float islands that XNNPACK could not prepare.
             converter.optimizations = [tf.lite.Optimize.DEFAULT]
-            converter.representative_dataset = self.create_representative_dataset(data_folder)
-            # Use more compatible configuration for int8
-            converter.target_spec.supported_ops = [
-                tf.lite.OpsSet.TFLITE_BUILTINS_INT8,
-                tf.lite.OpsSet.TFLITE_BUILTINS  # Fallback for unsupported ops
-            ]
-            # Keep input/output as float32 for better compatibility
-            # converter.inference_input_type = tf.uint8
-            # converter.inference_output_type = tf.uint8
+            if representative_images is not None:
+                converter.representative_dataset = self.representative_dataset_from_tensors(representative_images)
+            else:
+                converter.representative_dataset = self.create_representative_dataset(data_folder)
+            converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+            converter.inference_input_type = tf.uint8
+            converter.inference_output_type = tf.uint8
             
         elif quantization_type == "float16":
             converter.optimizations = [tf.lite.Optimize.DEFAULT]
@@ -84,23 +195,7 @@ class TFLiteConverter:
         print(f"Verifying TFLite model: {tflite_path}")
         
         try:
-            # Try with different interpreter configurations for compatibility
-            interpreter = None
-            for use_xnnpack in [True, False]:
-                try:
-                    if use_xnnpack:
-                        interpreter = tf.lite.Interpreter(model_path=tflite_path)
-                    else:
-                        interpreter = tf.lite.Interpreter(
-                            model_path=tflite_path,
-                            experimental_delegates=[]
-                        )
-                    interpreter.allocate_tensors()
-                    break
-                except Exception as e:
-                    if not use_xnnpack:  # If CPU-only also fails, give up
-                        raise e
-                    continue
+            interpreter, _ = self.create_interpreter(tflite_path)
             
             input_details = interpreter.get_input_details()
             output_details = interpreter.get_output_details()
@@ -112,12 +207,12 @@ class TFLiteConverter:
             if test_img is None:
                 return {"error": "Could not load test image"}
             
-            input_data = test_img.astype(input_details[0]['dtype'])
+            input_data = quantize_input(test_img, input_details[0])
             
             interpreter.set_tensor(input_details[0]['index'], input_data)
             interpreter.invoke()
             
-            output_data = interpreter.get_tensor(output_details[0]['index'])
+            output_data = dequantize_output(interpreter.get_tensor(output_details[0]['index']), output_details[0])
             
             embedding_norm = np.linalg.norm(output_data[0])
             
@@ -142,32 +237,10 @@ class TFLiteConverter:
     def benchmark_model(self, tflite_path: str, test_images: List[str], num_runs: int = 10) -> dict:
         print(f"Benchmarking TFLite model...")
         
-        # Try different interpreter configurations for compatibility
-        interpreter = None
-        for use_xnnpack in [True, False]:
-            try:
-                if use_xnnpack:
-                    interpreter = tf.lite.Interpreter(model_path=tflite_path)
-                    print("  Trying with XNNPACK delegate...")
-                else:
-                    # Disable XNNPACK delegate for problematic models (like int8)
-                    interpreter = tf.lite.Interpreter(
-                        model_path=tflite_path,
-                        experimental_delegates=[]
-                    )
-                    print("  Trying without XNNPACK delegate...")
-                
-                interpreter.allocate_tensors()
-                print("  ✅ Interpreter initialized successfully")
-                break
-                
-            except Exception as e:
-                print(f"  ❌ Failed with {'XNNPACK' if use_xnnpack else 'CPU-only'}: {e}")
-                interpreter = None
-                continue
-        
-        if interpreter is None:
-            return {"error": "Failed to initialize interpreter with any configuration"}
+        try:
+            interpreter, _ = self.create_interpreter(tflite_path)
+        except (RuntimeError, ValueError) as e:
+            return {"error": f"Failed to initialize interpreter: {e}"}
         
         input_details = interpreter.get_input_details()
         output_details = interpreter.get_output_details()
@@ -179,9 +252,8 @@ class TFLiteConverter:
             if test_img is None:
                 continue
                 
-            input_data = test_img.astype(input_details[0]['dtype'])
+            input_data = quantize_input(test_img, input_details[0])
             
-            import time
             start_time = time.time()
             
             interpreter.set_tensor(input_details[0]['index'], input_data)
@@ -211,41 +283,216 @@ class TFLiteConverter:
         else:
             return {"error": "No valid test images for benchmarking"}
     
-    def convert_and_evaluate(self, data_folder: str, output_folder: str = "tflite_models"):
+    def embed_images(self, tflite_path: str, images: np.ndarray) -> Tuple[np.ndarray, List[float]]:
+        interpreter, _ = self.create_interpreter(tflite_path)
+        input_detail = interpreter.get_input_details()[0]
+        output_detail = interpreter.get_output_details()[0]
+        
+        embeddings = []
+        times = []
+        for image in images:
+            input_data = quantize_input(image[None], input_detail)
+            start_time = time.perf_counter()
+            interpreter.set_tensor(input_detail['index'], input_data)
+            interpreter.invoke()
+            output = interpreter.get_tensor(output_detail['index'])
+            times.append((time.perf_counter() - start_time) * 1000)
+            embeddings.append(dequantize_output(output, output_detail)[0])
+        
+        embeddings = np.stack(embeddings)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return embeddings / norms, times
+    
+    def evaluate_fidelity(self, tflite_path: str, images: np.ndarray, reference_embeddings: np.ndarray,
+                          similarity_threshold: float = 0.85) -> dict:
+        # Compares a converted model against the float Keras model on the same
+        # images: per-image cosine agreement, and whether the duplicate pairs
+        # found at the curation threshold survive quantization.
+        print(f"Evaluating fidelity against the float model ({len(images)} images)...")
+        
+        try:
+            embeddings, times = self.embed_images(tflite_path, images)
+        except (RuntimeError, ValueError) as e:
+            return {"error": str(e)}
+        
+        cosine = np.sum(embeddings * reference_embeddings, axis=1)
+        
+        calculator = SimilarityCalculator(similarity_threshold=similarity_threshold)
+        reference_pairs = set(zip(*[a.tolist() for a in calculator.find_pairs_above_threshold(reference_embeddings)[:2]]))
+        found_pairs = set(zip(*[a.tolist() for a in calculator.find_pairs_above_threshold(embeddings)[:2]]))
+        true_positives = len(reference_pairs & found_pairs)
+        
+        fidelity_stats = {
+            "num_images": len(images),
+            "cosine_mean": float(np.mean(cosine)),
+            "cosine_min": float(np.min(cosine)),
+            "cosine_p5": float(np.percentile(cosine, 5)),
+            "similarity_threshold": similarity_threshold,
+            "reference_pairs": len(reference_pairs),
+            "found_pairs": len(found_pairs),
+            "pair_precision": true_positives / len(found_pairs) if found_pairs else 1.0,
+            "pair_recall": true_positives / len(reference_pairs) if reference_pairs else 1.0,
+            "latency_ms_mean": float(np.mean(times)),
+            "latency_ms_p50": float(np.percentile(times, 50)),
+        }
+        
+        print(f"  Cosine agreement: mean {fidelity_stats['cosine_mean']:.4f}, min {fidelity_stats['cosine_min']:.4f}")
+        print(f"  Duplicate pairs: precision {fidelity_stats['pair_precision']:.3f}, "
+              f"recall {fidelity_stats['pair_recall']:.3f} "
+              f"({fidelity_stats['found_pairs']} found / {fidelity_stats['reference_pairs']} reference)")
+        print(f"  Latency: {fidelity_stats['latency_ms_mean']:.1f} ms/image")
+        
+        return fidelity_stats
+    
+    def benchmark_sweep(self, tflite_path: str, images: np.ndarray, batch_sizes=(1, 8, 32),
+                        thread_counts=None, delegates=(True, False),
+                        warmup_runs: int = 3, num_runs: int = 20) -> List[dict]:
+        # Throughput across batch size x num_threads x XNNPACK on/off. Inputs
+        # are quantized once up front and every configuration is warmed up,
+        # so the timings cover set_tensor + invoke + get_tensor only.
+        thread_counts = thread_counts or sorted({1, 2, 4, os.cpu_count() or 1})
+        print(f"Sweeping {os.path.basename(tflite_path)}: batch sizes {list(batch_sizes)}, "
+              f"threads {list(thread_counts)}, XNNPACK {list(delegates)}")
+        
+        rows = []
+        for use_xnnpack in delegates:
+            for num_threads in thread_counts:
+                config = {"use_xnnpack": use_xnnpack, "num_threads": num_threads}
+                try:
+                    interpreter = create_interpreter(tflite_path, num_threads, use_xnnpack)
+                except (RuntimeError, ValueError) as e:
+                    rows.extend(dict(config, batch_size=b, error=str(e)) for b in batch_sizes)
+                    continue
+                
+                input_detail = interpreter.get_input_details()[0]
+                output_index = interpreter.get_output_details()[0]['index']
+                image_shape = [int(d) for d in input_detail['shape'][1:]]
+                dynamic_batch = int(input_detail['shape_signature'][0]) == -1
+                
+                for batch_size in batch_sizes:
+                    row = dict(config, batch_size=batch_size)
+                    rows.append(row)
+                    if batch_size > 1 and not dynamic_batch:
+                        row["error"] = "model has a fixed batch dimension"
+                        continue
+                    try:
+                        interpreter.resize_tensor_input(input_detail['index'], [batch_size, *image_shape])
+                        interpreter.allocate_tensors()
+                    except (RuntimeError, ValueError) as e:
+                        row["error"] = str(e)
+                        continue
+                    
+                    batch = quantize_input(np.resize(images, (batch_size, *images.shape[1:])), input_detail)
+                    
+                    def run():
+                        interpreter.set_tensor(input_detail['index'], batch)
+                        interpreter.invoke()
+                        interpreter.get_tensor(output_index)
+                    
+                    for _ in range(warmup_runs):
+                        run()
+                    times = []
+                    for _ in range(num_runs):
+                        start_time = time.perf_counter()
+                        run()
+                        times.append(time.perf_counter() - start_time)
+                    
+                    times_ms = np.array(times) * 1000
+                    row.update({
+                        "p50_ms": float(np.percentile(times_ms, 50)),
+                        "p95_ms": float(np.percentile(times_ms, 95)),
+                        "mean_ms": float(np.mean(times_ms)),
+                        "images_per_second": float(batch_size * num_runs / np.sum(times)),
+                    })
+                    print(f"  xnnpack={use_xnnpack!s:5} threads={num_threads:<2} batch={batch_size:<3} "
+                          f"p50 {row['p50_ms']:8.2f} ms  p95 {row['p95_ms']:8.2f} ms  "
+                          f"{row['images_per_second']:8.1f} img/s")
+        
+        return rows
+    
+    def convert_and_evaluate(self, data_folder: str, output_folder: str = "tflite_models",
+                             similarity_threshold: float = 0.85, num_eval_images: int = 200,
+                             sweep: dict = None, num_workers: int = None, use_cache: bool = True,
+                             num_representative: int = 100):
         os.makedirs(output_folder, exist_ok=True)
+        cache_dir = os.path.join(output_folder, "cache")
         
         print("Step 1: Creating and saving Keras model...")
-        model = MobileNetSimilarityModel()
+        model = MobileNetSimilarityModel(model_dir=cache_dir if use_cache else None)
+        fingerprint = model.fingerprint()
         saved_model_path = os.path.join(output_folder, "similarity_model")
-        model.save_for_tflite(saved_model_path)
+        self.export_saved_model(model, saved_model_path, use_cache)
         
         quantization_types = ["dynamic", "float16", "int8"]
         results = {}
         
-        test_images = glob.glob(os.path.join(data_folder, "*.jpeg"))[:10]
+        all_images = self.find_images(data_folder)
+        if not all_images:
+            return {quant_type: {"error": f"No images found in {data_folder}"} for quant_type in quantization_types}
+        test_images = sample_paths(all_images, 10)
         
+        representative_path = self.cached_image_tensors(sample_paths(all_images, num_representative), cache_dir,
+                                                        "representative", fingerprint, use_cache)
+        eval_path = self.cached_image_tensors(sample_paths(all_images, num_eval_images), cache_dir,
+                                              "eval", fingerprint, use_cache)
+        eval_images = np.load(eval_path, mmap_mode='r')
+        
+        reference_embeddings = None
+        if len(eval_images):
+            reference_path = eval_path[:-len('.npy')] + "_reference.npy"
+            if use_cache and os.path.exists(reference_path):
+                reference_embeddings = np.load(reference_path)
+            else:
+                reference_embeddings = np.concatenate([
+                    model.get_embeddings_batch(eval_images[i:i + 32]) for i in range(0, len(eval_images), 32)
+                ])
+                np.save(reference_path, reference_embeddings)
+        
+        print(f"\nStep 2: Converting and verifying {', '.join(quantization_types)} variants...")
+        jobs = {
+            quant_type: (saved_model_path,
+                         os.path.join(output_folder, f"similarity_model_{quant_type}.tflite"),
+                         data_folder, quant_type, representative_path, test_images[0])
+            for quant_type in quantization_types
+        }
+        num_workers = min(len(jobs), num_workers or os.cpu_count() or 1)
+        if num_workers > 1:
+            # Spawned workers start with a clean TensorFlow runtime instead of
+            # forking the parent's threads.
+            with ProcessPoolExecutor(max_workers=num_workers,
+                                     mp_context=multiprocessing.get_context('spawn')) as pool:
+                futures = {quant_type: pool.submit(_convert_variant, *job) for quant_type, job in jobs.items()}
+                converted = {quant_type: future.result() for quant_type, future in futures.items()}
+        else:
+            converted = {quant_type: _convert_variant(*job) for quant_type, job in jobs.items()}
+        
+        # Latency measurements run one variant at a time.
         for quant_type in quantization_types:
-            print(f"\nStep 2: Converting to TFLite ({quant_type})...")
-            
-            output_path = os.path.join(output_folder, f"similarity_model_{quant_type}.tflite")
-            
-            tflite_path, conversion_stats = self.convert_to_tflite(
-                saved_model_path, output_path, data_folder, quant_type
-            )
+            tflite_path, conversion_stats, verification_stats = converted[quant_type]
             
             if tflite_path:
-                print(f"\nStep 3: Verifying {quant_type} model...")
-                verification_stats = self.verify_tflite_model(tflite_path, test_images[0])
-                
-                print(f"\nStep 4: Benchmarking {quant_type} model...")
+                print(f"\nStep 3: Benchmarking {quant_type} model...")
                 benchmark_stats = self.benchmark_model(tflite_path, test_images)
                 
+                print(f"\nStep 4: Evaluating {quant_type} model fidelity...")
+                if reference_embeddings is not None:
+                    fidelity_stats = self.evaluate_fidelity(tflite_path, eval_images, reference_embeddings,
+                                                            similarity_threshold)
+                else:
+                    fidelity_stats = {"error": "No images to evaluate"}
+                
                 results[quant_type] = {
                     "conversion": conversion_stats,
                     "verification": verification_stats,
-                    "benchmark": benchmark_stats
+                    "benchmark": benchmark_stats,
+                    "fidelity": fidelity_stats
                 }
+                
+                if sweep is not None and len(eval_images):
+                    print(f"\nStep 5: Throughput sweep for {quant_type} model...")
+                    results[quant_type]["sweep"] = self.benchmark_sweep(tflite_path, eval_images, **sweep)
             else:
                 results[quant_type] = {"error": conversion_stats.get("error", "Unknown error")}
         
-        return results
\ No newline at end of file
+        return results